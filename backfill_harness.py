@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# Runs the Polymarket backfill and the multi-ticker Kalshi fetch end to end (query_polymarket.main,
+# query_kalshi.main) against the local mock API and checks their paging and resume: every served
+# fill / trade is written exactly once (including a second with more fills than fit in one page),
+# whether the fetch runs straight through or crashes at a checkpoint save and is resumed from the
+# checkpoint, and a refresh afterwards appends nothing. The Polymarket backfill into a trade store
+# (--store, which takes no checkpoint) is run twice, and the second run may add no rows.
+# Polymarket pages are kept small (--first) so every path is taken with a few thousand rows.
+#
+#   python backfill_harness.py
+#   python backfill_harness.py --rows 5000 --crashes 20
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import query_kalshi as qk
+import query_polymarket as qp
+from checkpoint import Checkpoint
+from mock_api import MockAPI
+from synthetic_fills import FILL_FIELDS, NO_TOKEN, YES_TOKEN, generate_fills, generate_kalshi_trades
+from trade_store import TradeStore
+
+CONDITION = qp.CONDITION_ID
+TICKERS = ["KXMAYORNYCNOMD-25-ZM", "KXMAYORNYCNOMD-25-AC"]
+
+class Crash(Exception):
+    pass
+
+@contextlib.contextmanager
+def crash_at_save(k):
+    """Checkpoint saves 1..k-1 go through; save k and every later one raise, as if the process died."""
+    real, calls = Checkpoint.save, [0]
+
+    def save(self, out_path=None):
+        calls[0] += 1
+        if k is not None and calls[0] >= k:
+            raise Crash(f"crash at save {calls[0]}")
+        real(self, out_path)
+
+    Checkpoint.save = save
+    try:
+        yield calls
+    finally:
+        Checkpoint.save = real
+
+def run_main(module, argv):
+    """module.main() with argv, quietly; True if it finished, False if it crashed."""
+    old = sys.argv
+    sys.argv = [module.__file__] + [str(a) for a in argv]
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            module.main()
+        return True
+    except Crash:
+        return False
+    finally:
+        sys.argv = old
+
+def served_fills(rows: int, first: int) -> pd.DataFrame:
+    """Synthetic fills of the market, with one second holding several pages' worth of fills."""
+    fills = pd.concat(generate_fills(rows, seed=4, other_share=0.0), ignore_index=True)[FILL_FIELDS]
+    burst = fills.index[len(fills) // 3: len(fills) // 3 + 4 * first + 7]
+    fills.loc[burst, "timestamp"] = int(fills.loc[burst[0], "timestamp"])
+    return fills
+
+def served_trades(rows: int) -> pd.DataFrame:
+    """rows Kalshi trades for each of TICKERS, with unix seconds in _ts."""
+    trades = pd.concat([generate_kalshi_trades(rows, ticker=t, seed=i) for i, t in enumerate(TICKERS)],
+                       ignore_index=True)
+    ts = pd.to_datetime(trades["created_time"], utc=True, format="ISO8601")
+    return trades.assign(_ts=(ts - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1))
+
+def check(got: pd.Series, want: set) -> list:
+    problems = []
+    if got.duplicated().any():
+        problems.append(f"{int(got.duplicated().sum())} duplicate rows")
+    if set(got) != want:
+        problems.append(f"{len(want - set(got))} missing, {len(set(got) - want)} unexpected")
+    return problems
+
+def polymarket_case(fills: pd.DataFrame, workers: int, crash: int, work: str) -> list:
+    out, ckpt = os.path.join(work, "fills.csv"), os.path.join(work, "fills.ckpt.json")
+    argv = ["--conditions", CONDITION, "--out", out, "--checkpoint", ckpt, "--workers", workers, "--batch", 3]
+    with crash_at_save(crash):
+        finished = run_main(qp, argv)
+    if crash is not None and finished:
+        return []  # fewer saves than the crash point: nothing to resume
+    if not finished and not run_main(qp, argv):
+        return ["resume crashed"]
+    run_main(qp, argv)  # refresh: nothing new is served, so nothing may be appended
+    return check(pd.read_csv(out, dtype=str)["id"], set(fills["id"]))
+
+def store_case(fills: pd.DataFrame, workers: int, work: str) -> list:
+    argv = ["--conditions", CONDITION, "--store", os.path.join(work, "store"), "--workers", workers, "--batch", 3]
+    run_main(qp, argv)
+    run_main(qp, argv)  # the same window again: every fill is already stored
+    return check(TradeStore(os.path.join(work, "store")).scan("fills", columns=["id"])["id"], set(fills["id"]))
+
+def kalshi_case(trades: pd.DataFrame, workers: int, crash: int, work: str) -> list:
+    out, ckpt = os.path.join(work, "trades.jsonl"), os.path.join(work, "trades.ckpt.json")
+    argv = ["--tickers", *TICKERS, "--min-ts", trades["_ts"].min(), "--max-ts", trades["_ts"].max(),
+            "--out", out, "--checkpoint", ckpt, "--windows", 3, "--workers", workers]
+    with crash_at_save(crash):
+        finished = run_main(qk, argv)
+    if crash is not None and finished:
+        return []
+    if not finished and not run_main(qk, argv):
+        return ["resume crashed"]
+    run_main(qk, argv)
+    return check(pd.read_json(out, lines=True, dtype={"trade_id": str})["trade_id"], set(trades["trade_id"]))
+
+def count_saves(case, served, workers) -> int:
+    with tempfile.TemporaryDirectory() as work, crash_at_save(None) as calls:
+        case(served, workers, None, work)
+        return calls[0]
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--rows", type=int, default=3000, help="fills served (and 4× as many Kalshi trades per ticker)")
+    p.add_argument("--first", type=int, default=50, help="page size the fetchers use")
+    p.add_argument("--crashes", type=int, default=12, help="crash points per case, spread over its saves")
+    args = p.parse_args()
+    qp.FIRST, qp.SLEEP_SEC, qk.PACE_SEC = args.first, 0.0, 0.0
+
+    fills = served_fills(args.rows, args.first)
+    trades = served_trades(4 * args.rows)  # Kalshi pages are 1000 trades: several per window
+    home = os.getcwd()
+    failed = 0
+    with tempfile.TemporaryDirectory() as tmp, MockAPI(fills, trades.drop(columns="_ts")) as api:
+        qp.ORDERBOOK_GQL, qk.URL = api.gql_url, api.kalshi_url
+        os.chdir(tmp)  # the fetchers read ./token_registry.json
+        try:
+            with open("token_registry.json", "w") as f:
+                json.dump({CONDITION: [YES_TOKEN, NO_TOKEN]}, f)
+            for name, case, served, workers in [("polymarket", polymarket_case, fills, 1),
+                                                ("polymarket", polymarket_case, fills, 4),
+                                                ("kalshi", kalshi_case, trades, 1),
+                                                ("kalshi", kalshi_case, trades, 3)]:
+                t0 = time.perf_counter()
+                saves = count_saves(case, served, workers)
+                points = [None] + sorted(set(np.linspace(1, saves, args.crashes).astype(int).tolist()))
+                problems = []
+                for k in points:
+                    with tempfile.TemporaryDirectory(dir=tmp) as work:
+                        problems += [f"crash at save {k}: {m}" for m in case(served, workers, k, work)]
+                status = "ok" if not problems else "FAIL"
+                print(f"{name:<10} workers={workers:<2} {status:<5} {time.perf_counter() - t0:6.2f}s  "
+                      f"{len(points) - 1} crash points over {saves} saves")
+                for msg in problems:
+                    print(f"    {msg}")
+                failed += bool(problems)
+            with tempfile.TemporaryDirectory(dir=tmp) as work:
+                problems = store_case(fills, 4, work)
+            print(f"{'store':<10} workers=4  {'ok' if not problems else 'FAIL':<5} fetched twice")
+            for msg in problems:
+                print(f"    {msg}")
+            failed += bool(problems)
+        finally:
+            os.chdir(home)
+    if failed:
+        sys.exit(f"✗ {failed} case(s) failed")
+    print("✓ Every fill and trade written exactly once, straight through and resumed after each crash")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# Benchmarks for the clean / compare / fetch stages on synthetic data.
+# Each case runs in a fresh process so peak RSS belongs to that stage alone; the fetchers run
+# against the local mock API. Results (rows/sec, seconds, peak RSS) go out as JSON, and
+# --baseline flags cases that got slower than a previous run.
+#
+#   python benchmark.py --sizes 10k 1m --out bench.json
+#   python benchmark.py --sizes 10k 1m --baseline bench.json   # exit 1 on regression
+
+import argparse
+import contextlib
+import json
+import multiprocessing as mp
+import os
+import platform
+import queue
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from metrics import peak_rss_mb
+
+SIZES = {"k": 1_000, "m": 1_000_000}
+CASE_TIMEOUT = 3600.0  # seconds a case may run before it is killed and reported as failed
+
+def parse_size(s: str) -> int:
+    s = s.lower().replace("_", "")
+    return int(float(s[:-1]) * SIZES[s[-1]]) if s[-1] in SIZES else int(s)
+
+# ---------- Cases (run in the child process; return rows processed) ----------
+def case_generate(p: Dict) -> int:
+    from synthetic_fills import write_fills
+    return write_fills(p["fills"], p["rows"], seed=p["seed"])
+
+def case_clean(p: Dict) -> int:
+    from clean_polymarket import FILL_COLS, clean_trades
+    from synthetic_fills import NO_TOKEN, YES_TOKEN
+    from tabular_io import is_parquet, read_table, write_table
+    df = read_table(p["fills"], columns=FILL_COLS, dtype=str)
+    if not is_parquet(p["fills"]):
+        df = df.fillna("")
+    write_table(clean_trades(df, YES_TOKEN, NO_TOKEN, "", "", "", p["perspective"]), p["out"])
+    return len(df)
+
+def case_clean_streaming(p: Dict) -> int:
+    from clean_polymarket import clean_trades_streaming
+    from synthetic_fills import NO_TOKEN, YES_TOKEN
+    clean_trades_streaming(p["fills"], p["out"], YES_TOKEN, NO_TOKEN, "", "", "",
+                           p["perspective"], chunksize=p["chunksize"])
+    return p["rows"]
+
+def case_compare(p: Dict) -> int:
+    from compare_transactions import analyze_matches, find_matching_transactions, load_and_prepare_data
+    ref_df, cleaned_df = load_and_prepare_data(p["ref"], p["cleaned"])
+    matches = find_matching_transactions(ref_df, cleaned_df)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        analyze_matches(matches, ref_df, cleaned_df)
+    return len(ref_df) + len(cleaned_df)
+
+def case_backfill_polymarket(p: Dict) -> int:
+    import query_polymarket as qp
+    from synthetic_fills import FILL_FIELDS, NO_TOKEN, YES_TOKEN
+    from tabular_io import TableWriter
+    qp.ORDERBOOK_GQL = p["url"]
+    qp.SLEEP_SEC = p["sleep"]
+    ids = [YES_TOKEN, NO_TOKEN]
+    since, until, shards = 0, 2_000_000_000, 1
+    if p["workers"] > 1:
+        since, until = qp.find_time_bounds(ids)
+        shards = 4 * p["workers"]
+    seen = set()
+    passes = [({}, side, ids) for side in ("maker", "taker")]
+    for pstate, _, _ in passes:
+        qp.plan_pass(pstate, since, until, shards)
+    with TableWriter(p["out"], fieldnames=FILL_FIELDS) as w:
+        return qp.run_backfill(w, seen, passes, p["workers"], batch=p["batch"])
+
+def case_fetch_kalshi(p: Dict) -> int:
+    import query_kalshi as qk
+    from tabular_io import TableWriter
+    qk.URL = p["url"]
+    with TableWriter(p["out"]) as w:
+        return qk.fetch_trades([p["ticker"]], p["min_ts"], p["max_ts"], w,
+                               windows=p["workers"], workers=p["workers"])
+
+CASES = {
+    "generate": case_generate,
+    "clean": case_clean,
+    "clean_streaming": case_clean_streaming,
+    "compare": case_compare,
+    "backfill_polymarket": case_backfill_polymarket,
+    "fetch_kalshi": case_fetch_kalshi,
+}
+
+def _child(name: str, params: Dict, q) -> None:
+    # Import everything up front so the timings cover the work, not interpreter start-up
+    import clean_polymarket, compare_transactions, query_kalshi, query_polymarket, synthetic_fills  # noqa: F401
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            t0 = time.perf_counter()
+            rows = CASES[name](params)
+            secs = time.perf_counter() - t0
+        q.put({"rows": int(rows), "seconds": secs, "peak_rss_mb": peak_rss_mb()})
+    except Exception as e:
+        q.put({"error": f"{type(e).__name__}: {e}"})
+
+def run_case(name: str, size: str, params: Dict) -> Dict:
+    ctx = mp.get_context("spawn")
+    q = ctx.Queue()
+    proc = ctx.Process(target=_child, args=(name, params, q))
+    proc.start()
+    deadline = time.monotonic() + CASE_TIMEOUT
+    res = None
+    while res is None:
+        try:
+            res = q.get(timeout=1.0)
+        except queue.Empty:
+            if not proc.is_alive():
+                # Died without reporting (OOM kill, segfault, failed import); drain a late result
+                try:
+                    res = q.get(timeout=1.0)
+                except queue.Empty:
+                    res = {"error": f"process exited with code {proc.exitcode} before reporting"}
+            elif time.monotonic() > deadline:
+                proc.kill()
+                res = {"error": f"timed out after {CASE_TIMEOUT:.0f}s"}
+    proc.join()
+    res = {"case": name, "size": size, **{k: params[k] for k in ("workers", "batch", "perspective") if k in params}, **res}
+    if "error" not in res:
+        res["rows_per_sec"] = res["rows"] / res["seconds"] if res["seconds"] > 0 else None
+        print(f"{name:<20} {size:>6}  {res['rows']:>10} rows  {res['seconds']:8.2f}s  "
+              f"{res['rows_per_sec']:>12,.0f} rows/s  {res['peak_rss_mb']:8.1f} MB", file=sys.stderr)
+    else:
+        print(f"{name:<20} {size:>6}  ERROR {res['error']}", file=sys.stderr)
+    return res
+
+# ---------- Suite ----------
+def bench_local(size: str, workdir: Path, fmt: str, chunksize: int, regen: bool) -> List[Dict]:
+    n = parse_size(size)
+    ext = "parquet" if fmt == "parquet" else "csv"
+    fills = workdir / f"fills_{size}.{ext}"
+    taker, maker = workdir / f"cleaned_taker_{size}.{ext}", workdir / f"cleaned_maker_{size}.{ext}"
+    results = []
+    if regen or not fills.exists():
+        results.append(run_case("generate", size, {"fills": str(fills), "rows": n, "seed": 0}))
+    results.append(run_case("clean", size, {"fills": str(fills), "out": str(taker), "perspective": "taker"}))
+    results.append(run_case("clean_streaming", size, {"fills": str(fills), "out": str(maker), "rows": n,
+                                                      "perspective": "maker", "chunksize": chunksize}))
+    results.append(run_case("compare", size, {"ref": str(taker), "cleaned": str(maker)}))
+    return results
+
+def bench_fetch(n: int, workdir: Path, workers: List[int], batch: List[int], latency: float,
+                sleep: float) -> List[Dict]:
+    import pandas as pd
+    from mock_api import MockAPI
+    from synthetic_fills import generate_fills, generate_kalshi_trades
+
+    size = f"{n}"
+    fills = pd.concat(generate_fills(n, seed=1, other_share=0.0), ignore_index=True)
+    kalshi = generate_kalshi_trades(n, seed=1)
+    ts = (pd.to_datetime(kalshi["created_time"], utc=True, format="ISO8601")
+          - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)
+    results = []
+    with MockAPI(fills, kalshi, latency=latency) as api:
+        for w in workers:
+            for b in batch:
+                results.append(run_case("backfill_polymarket", size, {
+                    "url": api.gql_url, "workers": w, "batch": b, "sleep": sleep,
+                    "out": str(workdir / "fetch_fills.csv")}))
+            results.append(run_case("fetch_kalshi", size, {
+                "url": api.kalshi_url, "workers": w, "ticker": kalshi["ticker"].iloc[0],
+                "min_ts": int(ts.min()), "max_ts": int(ts.max()), "out": str(workdir / "fetch_kalshi.jsonl")}))
+    return results
+
+def compare_baseline(results: List[Dict], baseline_path: str, tolerance: float) -> List[Dict]:
+    """Cases whose rows/sec fell more than `tolerance` (fraction) below the baseline run."""
+    base = json.loads(Path(baseline_path).read_text())["results"]
+    key = lambda r: (r["case"], r["size"], r.get("workers"), r.get("batch"), r.get("perspective"))
+    base = {key(r): r for r in base if r.get("rows_per_sec")}
+    regressions = []
+    for r in results:
+        b = base.get(key(r))
+        if b and r.get("rows_per_sec") and r["rows_per_sec"] < b["rows_per_sec"] * (1 - tolerance):
+            regressions.append({"case": r["case"], "size": r["size"], "workers": r.get("workers"),
+                                "baseline_rows_per_sec": b["rows_per_sec"], "rows_per_sec": r["rows_per_sec"]})
+    return regressions
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--sizes", nargs="+", default=["10k", "1m"],
+                   help="synthetic fill counts for clean/compare (e.g. 10k 1m 10m)")
+    p.add_argument("--fetch-rows", type=int, default=100_000,
+                   help="fills / trades served by the mock API for the fetch cases (0 to skip)")
+    p.add_argument("--fetch-workers", type=int, nargs="+", default=[1, 4], help="worker counts to fetch with")
+    p.add_argument("--fetch-batch", type=int, nargs="+", default=[1, 8],
+                   help="pages per request for the Polymarket backfill")
+    p.add_argument("--latency-ms", type=float, default=20.0, help="mock API delay per request")
+    p.add_argument("--sleep", type=float, default=0.0, help="query_polymarket SLEEP_SEC during the fetch cases")
+    p.add_argument("--format", choices=["csv", "parquet"], default="parquet", help="synthetic data format")
+    p.add_argument("--chunksize", type=int, default=500_000, help="chunk size for clean_streaming")
+    p.add_argument("--workdir", default="./bench_data", help="where synthetic inputs and outputs go")
+    p.add_argument("--regen", action="store_true", help="regenerate synthetic inputs that already exist")
+    p.add_argument("--out", help="write results JSON here (default: stdout)")
+    p.add_argument("--baseline", help="previous results JSON; exit 1 if any case is slower by > --tolerance")
+    p.add_argument("--tolerance", type=float, default=0.2, help="allowed rows/sec drop vs the baseline")
+    p.add_argument("--case-timeout", type=float, default=CASE_TIMEOUT,
+                   help="seconds before a case is killed and reported as failed")
+    return p.parse_args()
+
+def main():
+    global CASE_TIMEOUT
+    args = parse_args()
+    CASE_TIMEOUT = args.case_timeout
+    workdir = Path(args.workdir)
+    workdir.mkdir(parents=True, exist_ok=True)
+
+    results = []
+    for size in args.sizes:
+        results += bench_local(size, workdir, args.format, args.chunksize, args.regen)
+    if args.fetch_rows:
+        results += bench_fetch(args.fetch_rows, workdir, args.fetch_workers, args.fetch_batch,
+                               args.latency_ms / 1000, args.sleep)
+
+    import numpy as np
+    import pandas as pd
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__,
+            "platform": platform.platform(), "cpus": os.cpu_count(),
+            "latency_ms": args.latency_ms, "sleep": args.sleep,
+        },
+        "results": results,
+    }
+    regressions = []
+    if args.baseline:
+        regressions = compare_baseline(results, args.baseline, args.tolerance)
+        report["regressions"] = regressions
+    text = json.dumps(report, indent=1)
+    if args.out:
+        Path(args.out).write_text(text)
+        print(f"✓ Wrote {args.out}", file=sys.stderr)
+    else:
+        print(text)
+    for r in regressions:
+        print(f"REGRESSION {r['case']} {r['size']} (workers={r['workers']}): "
+              f"{r['rows_per_sec']:,.0f} rows/s vs {r['baseline_rows_per_sec']:,.0f}", file=sys.stderr)
+    if any("error" in r for r in results) or regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# Cleaned trades → OHLC / VWAP / volume / trade-count bars per outcome, at several intervals.
+# The finest interval is built from trades and coarser ones are rolled up from it. Re-runs are
+# incremental: only trades newer than the last run are applied, and only the trailing bars they
+# touch are recomputed. Trades that turn up below the watermark in a regenerated input (late
+# arrivals) are found by per-hour trade counts, and the bars are rebuilt from the earliest one.
+
+import argparse
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import pandas as pd
+
+import metrics
+from checkpoint import Checkpoint
+from tabular_io import read_table, write_table
+
+TRADE_COLS = ["timestamp", "outcome", "price", "size", "volume_usdc", "transactionHash", "asset"]
+BAR_COLS = ["bar_start", "open", "high", "low", "close", "vwap", "volume", "volume_usdc", "trades",
+            "first_ts", "last_ts"]
+COUNT_BUCKET = 3600  # seconds per bucket of applied-trade counts, the grain late arrivals are found at
+
+# Unit spellings pandas deprecates (Pandas4Warning), mapped to the ones it keeps
+UNIT_ALIASES = {"d": "D", "w": "W", "H": "h", "S": "s"}
+
+def interval_seconds(interval: str) -> int:
+    # Fixed-width intervals only ("1min", "15min", "1h", "1d" = "1D"); bars align to the unix epoch (UTC)
+    m = re.fullmatch(r"\s*(\d*)\s*([A-Za-z]+)\s*", str(interval))
+    if m:
+        interval = m.group(1) + UNIT_ALIASES.get(m.group(2), m.group(2))
+    return int(pd.Timedelta(interval).total_seconds())
+
+def bar_keys(df: pd.DataFrame) -> List[str]:
+    # Batch output carries a market column; single-market output is keyed by outcome alone
+    return ["market", "outcome"] if "market" in df.columns else ["outcome"]
+
+def _finish(bars: pd.DataFrame, keys: List[str]) -> pd.DataFrame:
+    bars["vwap"] = bars["volume_usdc"] / bars["volume"].where(bars["volume"] > 0)
+    bars["trades"] = bars["trades"].astype("int64")
+    return bars.sort_values(["bar_start"] + keys, kind="stable").reset_index(drop=True)[keys + BAR_COLS]
+
+def trade_bars(trades: pd.DataFrame, interval: str, keys: Optional[List[str]] = None) -> pd.DataFrame:
+    """Bars for one interval straight from trades."""
+    keys = keys or bar_keys(trades)
+    t = trades.sort_values("timestamp", kind="stable")
+    step = interval_seconds(interval)
+    start = (t["timestamp"].astype("int64") // step * step).rename("bar_start")
+    bars = (t.groupby([t[k] for k in keys] + [start], sort=True, observed=True)
+              .agg(open=("price", "first"), high=("price", "max"), low=("price", "min"),
+                   close=("price", "last"), volume=("size", "sum"), volume_usdc=("volume_usdc", "sum"),
+                   trades=("price", "size"), first_ts=("timestamp", "min"), last_ts=("timestamp", "max"))
+              .reset_index())
+    return _finish(bars, keys)
+
+def rollup_bars(bars: pd.DataFrame, interval: str, keys: List[str]) -> pd.DataFrame:
+    """Coarser bars from finer ones (the coarser interval must be a multiple of the finer)."""
+    step = interval_seconds(interval)
+    b = bars.sort_values(keys + ["bar_start"], kind="stable")
+    start = (b["bar_start"] // step * step).rename("bar_start")
+    out = (b.drop(columns="bar_start")
+             .groupby([b[k] for k in keys] + [start], sort=True, observed=True)
+             .agg(open=("open", "first"), high=("high", "max"), low=("low", "min"), close=("close", "last"),
+                  volume=("volume", "sum"), volume_usdc=("volume_usdc", "sum"), trades=("trades", "sum"),
+                  first_ts=("first_ts", "min"), last_ts=("last_ts", "max"))
+             .reset_index())
+    return _finish(out, keys)
+
+def build_bars(trades: pd.DataFrame, intervals: List[str]) -> Dict[str, pd.DataFrame]:
+    """Bars for every interval: the finest from trades, each coarser one rolled up when it divides."""
+    keys = bar_keys(trades)
+    ordered = sorted(intervals, key=interval_seconds)
+    out: Dict[str, pd.DataFrame] = {}
+    base = ordered[0]
+    out[base] = trade_bars(trades, base, keys)
+    for iv in ordered[1:]:
+        if interval_seconds(iv) % interval_seconds(base) == 0:
+            out[iv] = rollup_bars(out[base], iv, keys)
+        else:
+            out[iv] = trade_bars(trades, iv, keys)
+    return {iv: out[iv] for iv in intervals}
+
+def _combine(old: pd.DataFrame, new: pd.DataFrame, keys: List[str]) -> pd.DataFrame:
+    # Merge partial bars for the same (keys, bar_start); open/close follow first_ts/last_ts so
+    # late-arriving trades land in the right place
+    both = pd.concat([old, new], ignore_index=True)
+    gk = keys + ["bar_start"]
+    by_first = both.sort_values("first_ts", kind="stable").groupby(gk, sort=False, observed=True)
+    by_last = both.sort_values("last_ts", kind="stable").groupby(gk, sort=False, observed=True)
+    out = by_first.agg(open=("open", "first"), high=("high", "max"), low=("low", "min"),
+                       volume=("volume", "sum"), volume_usdc=("volume_usdc", "sum"), trades=("trades", "sum"),
+                       first_ts=("first_ts", "min"), last_ts=("last_ts", "max"))
+    out["close"] = by_last["close"].last()
+    return _finish(out.reset_index(), keys)
+
+def update_bars(bars: pd.DataFrame, new_trades: pd.DataFrame, interval: str) -> pd.DataFrame:
+    """Apply new trades to existing bars, recomputing only bars at or after the earliest new one."""
+    if new_trades.empty:
+        return bars
+    keys = bar_keys(new_trades)
+    fresh = trade_bars(new_trades, interval, keys)
+    if bars is None or bars.empty:
+        return fresh
+    cutoff = fresh["bar_start"].min()
+    head = bars[bars["bar_start"] < cutoff]
+    tail = bars[bars["bar_start"] >= cutoff]
+    return pd.concat([head, _combine(tail, fresh, keys)], ignore_index=True)
+
+def rebuild_bars_since(bars: Optional[pd.DataFrame], trades: pd.DataFrame, interval: str, since: int) -> pd.DataFrame:
+    """Keep the bars before the one holding `since` and recompute the rest from all of trades."""
+    cutoff = since // interval_seconds(interval) * interval_seconds(interval)
+    later = trades[trades["timestamp"].astype("int64") >= cutoff]
+    fresh = trade_bars(later, interval) if len(later) else pd.DataFrame(columns=bar_keys(trades) + BAR_COLS)
+    if bars is None or bars.empty:
+        return fresh
+    return pd.concat([bars[bars["bar_start"] < cutoff], fresh], ignore_index=True)
+
+# ---------- On-disk bars + watermark ----------
+def _trade_keys(trades: pd.DataFrame) -> pd.Series:
+    return trades["transactionHash"].astype(str) + ":" + trades["asset"].astype(str)
+
+def new_trades_since(trades: pd.DataFrame, state: dict) -> pd.DataFrame:
+    """Trades after the saved watermark, plus unseen ones at the watermark second itself."""
+    wm = state.get("watermark")
+    if wm is None:
+        return trades
+    ts = trades["timestamp"].astype("int64")
+    at_wm = ts == wm
+    seen = set(state.get("watermark_keys", []))
+    return trades[(ts > wm) | (at_wm & ~_trade_keys(trades).isin(seen))]
+
+def _applied_before(trades: pd.DataFrame, state: dict) -> pd.DataFrame:
+    # Rows the previous runs must have applied: up to the watermark, less unseen ones at it
+    ts = trades["timestamp"].astype("int64")
+    wm = state["watermark"]
+    return trades[(ts < wm) | ((ts == wm) & _trade_keys(trades).isin(set(state.get("watermark_keys", []))))]
+
+def _bucket_counts(trades: pd.DataFrame) -> pd.Series:
+    bucket = trades["timestamp"].astype("int64") // COUNT_BUCKET * COUNT_BUCKET
+    return bucket.value_counts().sort_index()
+
+def late_trades(trades: pd.DataFrame, state: dict) -> Tuple[int, int, Optional[int]]:
+    """(late rows, vanished rows, start of the earliest bucket that changed) below the watermark.
+
+    A regenerated input can gain rows before the watermark (late arrivals) or lose some; the
+    per-bucket counts recorded by record_applied show which hours no longer match what was applied.
+    Rows are netted per bucket, so an hour that gained 3 rows and lost 1 counts 2 late.
+    """
+    if state.get("watermark") is None or "counts" not in state:
+        return 0, 0, None
+    now = _bucket_counts(_applied_before(trades, state))
+    then = pd.Series({int(k): v for k, v in state["counts"].items()}, dtype="int64")
+    diff = now.sub(then, fill_value=0)
+    diff = diff[diff != 0]
+    if diff.empty:
+        return 0, 0, None
+    return int(diff[diff > 0].sum()), int(-diff[diff < 0].sum()), int(diff.index.min())
+
+def record_applied(state: dict, trades: pd.DataFrame) -> None:
+    """Save per-bucket counts of every input row the outputs now reflect (all of it up to the watermark)."""
+    if state.get("watermark") is None:
+        return
+    state["counts"] = {str(k): int(v) for k, v in _bucket_counts(_applied_before(trades, state)).items()}
+
+def advance_watermark(state: dict, applied: pd.DataFrame) -> None:
+    if applied.empty:
+        return
+    wm = int(applied["timestamp"].max())
+    keys = _trade_keys(applied[applied["timestamp"].astype("int64") == wm]).tolist()
+    if state.get("watermark") == wm:
+        keys = sorted(set(state.get("watermark_keys", [])) | set(keys))
+    elif state.get("watermark") is not None and state["watermark"] > wm:
+        return
+    state["watermark"], state["watermark_keys"] = wm, keys
+
+def bars_path(out_dir, interval: str, fmt: str) -> Path:
+    return Path(out_dir) / f"bars_{interval}.{'parquet' if fmt == 'parquet' else 'csv'}"
+
+def load_bars(path: Path) -> Optional[pd.DataFrame]:
+    if not path.exists():
+        return None
+    b = read_table(path)
+    return b.drop(columns=["datetime_utc"], errors="ignore")
+
+def save_bars(bars: pd.DataFrame, path: Path) -> None:
+    out = bars.copy()
+    out.insert(out.columns.get_loc("bar_start") + 1, "datetime_utc",
+               pd.to_datetime(out["bar_start"], unit="s", utc=True))
+    write_table(out, path)
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--in", dest="in_path", required=True, help="cleaned trades CSV or Parquet")
+    p.add_argument("--out-dir", required=True, help="directory for bars_<interval> files and state")
+    p.add_argument("--intervals", nargs="+", default=["1min", "1h", "1d"], help="bar intervals")
+    p.add_argument("--format", choices=["csv", "parquet"], default="parquet", help="bar file format")
+    p.add_argument("--rebuild", action="store_true", help="ignore existing bars and rebuild from scratch")
+    metrics.add_args(p)
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    metrics.configure(args)
+    Path(args.out_dir).mkdir(parents=True, exist_ok=True)
+    state_ckpt = Checkpoint(Path(args.out_dir) / "bars_state.json")
+    if args.rebuild:
+        state_ckpt.data = {}
+    state = state_ckpt.section("trades")
+
+    with metrics.stage("read") as st:
+        trades = read_table(args.in_path)
+        cols = [c for c in TRADE_COLS + ["market"] if c in trades.columns]
+        trades = trades[cols]
+        existing = {iv: (None if args.rebuild else load_bars(bars_path(args.out_dir, iv, args.format)))
+                    for iv in args.intervals}
+        st.rows = len(trades)
+    if any(b is None for b in existing.values()):
+        state.clear()  # an interval without bars on disk needs the full history
+
+    new = new_trades_since(trades, state)
+    late, gone, since = late_trades(trades, state)
+    if since is not None:
+        print(f"⚠ {late} late trade(s) below the watermark, {gone} gone from the input (net per hour); "
+              f"rebuilding bars from {pd.to_datetime(since, unit='s', utc=True)}")
+    with metrics.stage("bars", rows=len(new), hot=True):
+        if state.get("watermark") is None:
+            bars = build_bars(new, args.intervals) if len(new) else {iv: pd.DataFrame(columns=BAR_COLS) for iv in args.intervals}
+        elif since is not None:
+            bars = {iv: rebuild_bars_since(existing[iv], trades, iv, since) for iv in args.intervals}
+        else:
+            bars = {iv: update_bars(existing[iv], new, iv) for iv in args.intervals}
+    with metrics.stage("write", rows=sum(len(b) for b in bars.values())):
+        for iv, b in bars.items():
+            save_bars(b, bars_path(args.out_dir, iv, args.format))
+    advance_watermark(state, new)
+    record_applied(state, trades)
+    state_ckpt.save()
+    print(f"✓ Applied {len(new)} new trades of {len(trades)}; bars: "
+          + ", ".join(f"{iv}={len(b)}" for iv, b in bars.items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+# Persistent JSON checkpoints for the resumable fetchers (query_polymarket, query_kalshi).
+# The checkpoint also records how many bytes of the output file it covers, so rows written
+# after the last save (e.g. right before a crash) are cut off on resume instead of duplicated.
+
+import json
+import os
+from pathlib import Path
+
+class Checkpoint:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.data = json.loads(self.path.read_text()) if self.path.exists() else {}
+
+    def section(self, *keys) -> dict:
+        """Nested dict for keys, created on first use."""
+        d = self.data
+        for k in keys:
+            d = d.setdefault(k, {})
+        return d
+
+    def save(self, out_path=None) -> None:
+        # Call only after the output has been flushed; written atomically via rename
+        if out_path is not None:
+            self.data["out_bytes"] = os.path.getsize(out_path)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(self.data))
+        os.replace(tmp, self.path)
+
+    def restore_output(self, out_path) -> bool:
+        """Trim out_path back to the last checkpointed size; True if there is output to append to."""
+        n = self.data.get("out_bytes")
+        if n is None or not os.path.exists(out_path):
+            return False
+        if os.path.getsize(out_path) > n:
+            with open(out_path, "r+b") as f:
+                f.truncate(n)
+        return n > 0
@@ -3,62 +3,47 @@
 # Fixes BUY/SELL, Yes/No, and price by canonicalizing to the taker perspective per tx.
 
 import argparse
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+import numpy as np
 import pandas as pd
 
+import metrics
+from tabular_io import TableWriter, is_parquet, iter_table_chunks, read_table, write_table
+from trade_store import TradeStore
+from token_registry import CACHE_PATH, DEFAULT_NO_TOKEN, DEFAULT_YES_TOKEN, resolve_tokens
+
 USDC_ZERO_ID = "0"
 DECIMALS = 1_000_000  # 6 decimals for both tokens and USDC amounts
 
-# Default token IDs for Mamdani market
-DEFAULT_YES_TOKEN = "73817598408230683831072353847770809458837920203753987347670649717002095543451"
-DEFAULT_NO_TOKEN = "102505737677514435038431832532030540090751572260157019042399710777845176913904"
-
-# ---------- Optional: on-chain derivation of token ids (no API) ----------
-def keccak256(data: bytes) -> bytes:
-    import sha3  # pip install pysha3
-    k = sha3.keccak_256()
-    k.update(data)
-    return k.digest()
-
-def to_uint256_be(n: int) -> bytes:
-    return n.to_bytes(32, "big")
-
-def hexstr_to_bytes32(h: str) -> bytes:
-    h = h[2:] if h.startswith("0x") else h
-    b = bytes.fromhex(h)
-    return b if len(b) == 32 else b.rjust(32, b"\x00")
-
-def address_to_bytes(addr: str) -> bytes:
-    a = addr[2:] if addr.startswith("0x") else addr
-    b = bytes.fromhex(a)
-    if len(b) != 20:
-        raise ValueError(f"Bad address length for {addr}")
-    return b
-
-def derive_position_id(condition_id: str, outcome_index: int, collateral: str) -> int:
-    # collectionId = keccak256(parent=0x00..00, conditionId, indexSet=1<<i)
-    parent = b"\x00" * 32
-    cond = hexstr_to_bytes32(condition_id)
-    index_set = to_uint256_be(1 << outcome_index)
-    collection_id = keccak256(parent + cond + index_set)
-    # positionId = keccak256(collateral(address) || collectionId)
-    pos = keccak256(address_to_bytes(collateral) + collection_id)
-    return int.from_bytes(pos, "big")
+# Integer price representations (--price-units): price × scale, rounded to nearest
+PRICE_SCALES = {"bps": 10_000, "micro": 1_000_000}
 
 # ---------- Core logic ----------
 def parse_args():
     p = argparse.ArgumentParser()
-    p.add_argument("--in", dest="in_path", required=True, help="raw fills CSV")
-    p.add_argument("--out", dest="out_path", required=True, help="output CSV")
+    p.add_argument("--in", dest="in_path", help="raw fills CSV or Parquet")
+    p.add_argument("--out", dest="out_path",
+                   help="output CSV or Parquet (by extension); with --markets, a directory or one file")
+
+    # Trade store (optional): instead of --in / --out
+    p.add_argument("--store", help="trade store (see trade_store.py): read fills from it, and write "
+                                   "the cleaned trades into it when --out is not given")
+    p.add_argument("--since", type=int, help="with --store: earliest fill timestamp (unix seconds)")
+    p.add_argument("--until", type=int, help="with --store: fills before this timestamp")
 
     # Token-id sources (pick one: explicit OR derive OR infer-from-file)
     p.add_argument("--yes-token", help="explicit YES token id")
     p.add_argument("--no-token", help="explicit NO token id")
     p.add_argument("--condition", help="conditionId (0x...) to derive ids")
-    p.add_argument("--collateral", help="collateral address (USDC on the correct chain)")
+    p.add_argument("--collateral", help="collateral address: USDC.e, or the neg-risk WrappedCollateral "
+                                        "for multi-outcome events (also the default for --markets rows)")
     p.add_argument("--yes-index", type=int, default=0, help="YES outcome index (default 0)")
     p.add_argument("--no-index", type=int, default=1, help="NO outcome index (default 1)")
+    p.add_argument("--registry", default=CACHE_PATH, help="token registry cache JSON")
 
     # Cosmetic (optional)
     p.add_argument("--title", default="", help="title column text")
@@ -66,9 +51,28 @@ def parse_args():
     p.add_argument("--event-slug", default="", help="eventSlug column text")
     
     # Perspective (optional)
-    p.add_argument("--perspective", choices=["taker", "maker"], default="taker", 
-                   help="perspective for buy/sell classification (default: taker)")
+    p.add_argument("--perspective", choices=["taker", "maker", "both"], default="taker", 
+                   help="perspective for buy/sell classification (default: taker); both writes the "
+                        "taker trades to --out and the maker trades to --maker-out in one pass")
+    p.add_argument("--maker-out", help="maker output with --perspective both (default: --out with a _maker suffix)")
+    p.add_argument("--price-units", choices=["float", "bps", "micro"], default="float",
+                   help="price as a float, or an integer in basis points / micro-USDC per token")
+
+    # Streaming (optional)
+    p.add_argument("--chunksize", type=int, default=0,
+                   help="stream fills in chunks of this many rows (reads the input twice)")
+
+    # Batch (optional)
+    p.add_argument("--markets", help="markets table (CSV/Parquet/JSONL) with columns market, yes_token, "
+                                     "no_token and/or condition, plus optional title, slug, eventSlug")
+    p.add_argument("--workers", type=int, default=0, help="processes for --markets (default: all cores)")
+    p.add_argument("--format", choices=["csv", "parquet"], default="csv",
+                   help="per-market file format when --out is a directory (default: csv)")
+
+    p.add_argument("--verify", action="store_true",
+                   help="also run the original per-transaction implementation and check outputs match")
     
+    metrics.add_args(p)
     return p.parse_args()
 
 def infer_token_ids_from_file(df: pd.DataFrame) -> Optional[Tuple[str, str]]:
@@ -91,23 +95,324 @@ def infer_token_ids_from_file(df: pd.DataFrame) -> Optional[Tuple[str, str]]:
         return str(uniq[0]), str(uniq[1])
     return None
 
-def determine_token_ids(df: pd.DataFrame, args) -> Tuple[str, str]:
+def determine_token_ids(df: Optional[pd.DataFrame], args) -> Tuple[str, str]:
     # 1) explicit
     if args.yes_token and args.no_token:
         return str(args.yes_token), str(args.no_token)
-    # 2) derive from chain
-    if args.condition and args.collateral:
-        try:
-            yes = str(derive_position_id(args.condition, args.yes_index, args.collateral))
-            no  = str(derive_position_id(args.condition, args.no_index,  args.collateral))
+    # 2) token registry: cache → derive from chain (needs --collateral) → CLOB scan
+    if args.condition:
+        toks = resolve_tokens([args.condition], collateral=args.collateral,
+                              yes_index=args.yes_index, no_index=args.no_index, cache_path=args.registry)
+        if args.condition.lower() in toks:
+            yes, no = toks[args.condition.lower()]
             return yes, no
-        except Exception:
-            pass
+        # Never fall back to the defaults for a market that was asked for: wrong ids filter out every fill
+        raise RuntimeError(f"No token ids for condition {args.condition}: pass --collateral to derive "
+                           "them offline, or --yes-token/--no-token")
     # 3) use default Mamdani tokens
     return DEFAULT_YES_TOKEN, DEFAULT_NO_TOKEN
 
+def select_token_usdc_fills(df: pd.DataFrame, YES_TOKEN: str, NO_TOKEN: str) -> pd.DataFrame:
+    TOKENS = {YES_TOKEN, NO_TOKEN}
+
+    # numeric casts
+    for c in ["timestamp", "makerAmountFilled", "takerAmountFilled"]:
+        df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0).astype("int64")
+
+    # identify which rows have a token on which side
+    df["maker_is_token"] = df["makerAssetId"].isin(TOKENS)
+    df["taker_is_token"] = df["takerAssetId"].isin(TOKENS)
+    df["maker_is_usdc"]  = df["makerAssetId"].astype(str).eq(USDC_ZERO_ID)
+    df["taker_is_usdc"]  = df["takerAssetId"].astype(str).eq(USDC_ZERO_ID)
+
+    # keep only token<->USDC fills
+    mask_token_usdc = (
+        (df["maker_is_token"] & df["taker_is_usdc"]) |
+        (df["taker_is_token"] & df["maker_is_usdc"])
+    )
+    return df[mask_token_usdc]
+
+PERSPECTIVES = ("taker", "maker")
+
+def _aggregate_fills(fills: pd.DataFrame) -> pd.DataFrame:
+    # Per-fill signed token delta and USDC volume in int64 micro-units, from the taker perspective.
+    # Integer sums are exact whatever the chunking or grouping order; floats appear only per trade.
+    # Token on maker side: taker receives tokens (BUY), maker gives them (SELL).
+    # Token on taker side: taker gives tokens (SELL), maker receives them (BUY).
+    # The maker perspective is the same sums negated, so one grouping serves both; only the
+    # wallet differs, hence both wallet columns.
+    fills = fills.sort_values("timestamp", kind="stable")
+    tok_on_maker = fills["maker_is_token"].to_numpy()
+    maker_amt = fills["makerAmountFilled"].to_numpy()
+    taker_amt = fills["takerAmountFilled"].to_numpy()
+
+    tx = fills["transactionHash"]
+    by_tx = fills.groupby(tx, sort=False, observed=True)
+    per_fill = pd.DataFrame({
+        "transactionHash": tx.to_numpy(),
+        "asset":           np.where(tok_on_maker, fills["makerAssetId"].astype(str), fills["takerAssetId"].astype(str)),
+        "net_units":       np.where(tok_on_maker, maker_amt, -taker_amt),
+        "usdc_units":      np.where(tok_on_maker, taker_amt, maker_amt),
+        # Trade timestamp and wallet come from the whole transaction, not just this token's fills
+        "timestamp":       by_tx["timestamp"].transform("max").to_numpy(),
+        "taker":           by_tx["taker"].transform("first").to_numpy(),
+        "maker":           by_tx["maker"].transform("first").to_numpy(),
+    })
+
+    out = (per_fill.groupby(["transactionHash", "asset"], sort=False)
+                   .agg(net_units=("net_units", "sum"),
+                        usdc_units=("usdc_units", "sum"),
+                        timestamp=("timestamp", "first"),
+                        taker=("taker", "first"),
+                        maker=("maker", "first"))
+                   .reset_index())
+
+    # Net zero for a token → no trade for that outcome (in either perspective)
+    out = out[out["net_units"] != 0]
+    size_units = out["net_units"].abs()
+    out["size"] = size_units / DECIMALS
+    out["volume_usdc"] = out["usdc_units"] / DECIMALS
+    out["price"] = out["usdc_units"] / size_units
+    out["timestamp"] = out["timestamp"].astype("int64")
+    out["datetime_utc"] = pd.to_datetime(out["timestamp"], unit="s", utc=True)
+    return out
+
+def _finish_trades(agg: pd.DataFrame, YES_TOKEN: str, title: str, slug: str, event_slug: str,
+                   perspective: str, price_units: str) -> pd.DataFrame:
+    out = agg.copy()
+    buys = out["net_units"] > 0
+    out["side"] = np.where(buys if perspective == "taker" else ~buys, "BUY", "SELL")
+    out["proxyWallet"] = out[perspective]
+    if price_units in PRICE_SCALES:
+        out["price"] = np.rint(out["price"] * PRICE_SCALES[price_units]).astype("int64")
+    out["outcome"] = np.where(out["asset"] == YES_TOKEN, "Yes", "No")
+    out["title"] = title
+    out["slug"] = slug
+    out["eventSlug"] = event_slug
+
+    # newest first; within a transaction Yes precedes No
+    out["_no_first"] = out["outcome"] == "No"
+    out = out.sort_values(["timestamp", "transactionHash", "_no_first"],
+                          ascending=[False, True, True], kind="stable")
+    out = out[[
+        "timestamp","datetime_utc","side","outcome","price","size","volume_usdc",
+        "transactionHash","asset","proxyWallet","title","slug","eventSlug"
+    ]].reset_index(drop=True)
+    return out
+
+def canonicalize_fills(fills: pd.DataFrame, YES_TOKEN: str, NO_TOKEN: str,
+                       title: str, slug: str, event_slug: str, perspective: str = "taker",
+                       price_units: str = "float") -> Union[pd.DataFrame, Dict[str, pd.DataFrame]]:
+    """Cleaned trades from selected fills; perspective "both" returns {"taker": df, "maker": df}."""
+    agg = _aggregate_fills(fills)
+    if perspective == "both":
+        return {p: _finish_trades(agg, YES_TOKEN, title, slug, event_slug, p, price_units)
+                for p in PERSPECTIVES}
+    return _finish_trades(agg, YES_TOKEN, title, slug, event_slug, perspective, price_units)
+
 def clean_trades(df: pd.DataFrame, YES_TOKEN: str, NO_TOKEN: str,
+                 title: str, slug: str, event_slug: str, perspective: str = "taker",
+                 price_units: str = "float") -> Union[pd.DataFrame, Dict[str, pd.DataFrame]]:
+    # perspective "both" → {"taker": trades, "maker": trades} from one pass over the fills
+    with metrics.stage("select_fills", rows=len(df)):
+        fills = select_token_usdc_fills(df, YES_TOKEN, NO_TOKEN)
+    if fills.empty:
+        raise RuntimeError("No token↔USDC fills found.")
+    with metrics.stage("canonicalize", rows=len(fills), hot=True):
+        return canonicalize_fills(fills, YES_TOKEN, NO_TOKEN, title, slug, event_slug, perspective, price_units)
+
+# Raw fill columns the cleaner actually needs
+FILL_COLS = [
+    "timestamp","transactionHash","maker","taker",
+    "makerAssetId","makerAmountFilled","takerAssetId","takerAmountFilled"
+]
+
+def _tx_keys(tx: pd.Series) -> np.ndarray:
+    # 64-bit hash of each transaction hash: small to count and carry; two transactions sharing
+    # one are only ever completed together, so a collision costs memory, not correctness
+    return pd.util.hash_array(tx.to_numpy(dtype=object))
+
+def clean_trades_streaming(in_path: str, out_path: str, YES_TOKEN: str, NO_TOKEN: str,
+                           title: str, slug: str, event_slug: str, perspective: str = "taker",
+                           chunksize: int = 500_000, price_units: str = "float",
+                           maker_out_path: Optional[str] = None) -> int:
+    """Clean a fills CSV/Parquet file chunk by chunk, appending trades to out_path as they are ready.
+
+    Fills may come in any order (query_polymarket writes a maker pass and a taker pass, shard by
+    shard). A first read counts the fills of every transaction; the second carries a
+    transaction's fills across chunks until all of them have been read, then cleans it. The
+    trades equal clean_trades on the whole file, written newest first within each chunk's batch
+    rather than across the file. Memory is chunksize plus the fills of transactions still
+    open: little when a transaction's fills sit together, up to the fills between a
+    transaction's first and last fill otherwise. With perspective "both" the maker trades go to
+    maker_out_path.
+    """
+    written = 0
+    carry = None
+
+    def flush(part: pd.DataFrame):
+        nonlocal written
+        with metrics.stage("select_fills", rows=len(part)):
+            fills = select_token_usdc_fills(part, YES_TOKEN, NO_TOKEN)
+        if fills.empty:
+            return
+        with metrics.stage("canonicalize", rows=len(fills), hot=True):
+            cleaned = canonicalize_fills(fills, YES_TOKEN, NO_TOKEN, title, slug, event_slug,
+                                         perspective, price_units)
+        if not isinstance(cleaned, dict):
+            cleaned = {perspective: cleaned}
+        n = len(next(iter(cleaned.values())))  # both perspectives have the same rows
+        with metrics.stage("write", rows=n):
+            for p, trades in cleaned.items():
+                outs[p].write_frame(trades)
+        written += n
+
+    from_csv = not is_parquet(in_path)
+    counts = []
+    for chunk in metrics.timed_iter("count_tx", iter_table_chunks(in_path, columns=["transactionHash"],
+                                                                  chunksize=chunksize, dtype=str)):
+        tx = chunk["transactionHash"].fillna("") if from_csv else chunk["transactionHash"]
+        counts.append(pd.Series(_tx_keys(tx)).value_counts())
+    total = pd.concat(counts).groupby(level=0).sum() if counts else pd.Series(dtype="int64")
+
+    reader = metrics.timed_iter("read", iter_table_chunks(in_path, columns=FILL_COLS,
+                                                          chunksize=chunksize, dtype=str))
+    paths = {"taker": out_path, "maker": maker_out_path} if perspective == "both" else {perspective: out_path}
+    outs = {p: TableWriter(path) for p, path in paths.items()}
+    try:
+        for chunk in reader:
+            if from_csv:
+                chunk = chunk.fillna("")
+            chunk = chunk.assign(_tx=_tx_keys(chunk["transactionHash"]))
+            if carry is not None:
+                chunk = pd.concat([carry, chunk], ignore_index=True)
+            # carry holds every earlier fill of an open transaction, so these are counts so far
+            seen = chunk.groupby("_tx", sort=False)["_tx"].size()
+            done = seen.index[seen.to_numpy() >= total.reindex(seen.index).to_numpy()]
+            complete = chunk["_tx"].isin(done).to_numpy()
+            carry = chunk[~complete]
+            flush(chunk[complete].drop(columns="_tx"))
+        if carry is not None and len(carry):
+            flush(carry.drop(columns="_tx"))  # only if the file changed between the two reads
+    finally:
+        for out in outs.values():
+            out.close()
+
+    if written == 0:
+        raise RuntimeError("No token↔USDC fills found.")
+    return written
+
+# ---------- Batch: many markets from one fills file ----------
+MARKET_COLS = ["market", "yes_token", "no_token", "condition", "title", "slug", "eventSlug"]
+
+def load_markets(path, registry=CACHE_PATH, collateral: Optional[str] = None) -> pd.DataFrame:
+    """Markets table with every column of MARKET_COLS filled in.
+
+    Rows given only a condition id get their tokens from the registry in one batch, derived
+    offline where the row's collateral column (or the collateral argument) gives a collateral;
+    rows without a market key are keyed by condition id, else by YES token.
+    """
+    m = read_table(path, dtype=str)
+    for c in MARKET_COLS + ["collateral"]:
+        if c not in m.columns:
+            m[c] = ""
+    m = m[MARKET_COLS + ["collateral"]].astype(object).fillna("").astype(str)
+    need = m[((m["yes_token"] == "") | (m["no_token"] == "")) & (m["condition"] != "")]
+    if len(need):
+        cols = need["collateral"].where(need["collateral"] != "", collateral or "")
+        per_cond = {c.lower(): col for c, col in zip(need["condition"], cols) if col}
+        toks = resolve_tokens(need["condition"], collateral=per_cond or None, cache_path=registry)
+        for i, cond in need["condition"].items():
+            if cond.lower() in toks:
+                m.loc[i, ["yes_token", "no_token"]] = toks[cond.lower()]
+    missing = m[(m["yes_token"] == "") | (m["no_token"] == "")]
+    if len(missing):
+        raise RuntimeError(f"No token ids for markets: {missing['condition'].tolist()}")
+    m["market"] = m["market"].where(m["market"] != "", m["condition"].where(m["condition"] != "", m["yes_token"]))
+    if m["market"].duplicated().any():
+        raise RuntimeError(f"Duplicate market keys: {m['market'][m['market'].duplicated()].tolist()}")
+    return m[MARKET_COLS].reset_index(drop=True)
+
+def route_fills(df: pd.DataFrame, markets: pd.DataFrame) -> Iterator[Tuple[int, pd.DataFrame]]:
+    """Split fills by market via a token → market lookup on whichever side holds the token."""
+    token_market: Dict[str, int] = {}
+    for i, r in enumerate(markets.itertuples(index=False)):
+        token_market[r.yes_token] = i
+        token_market[r.no_token] = i
+    maker_m = df["makerAssetId"].map(token_market).astype("float64")
+    taker_m = df["takerAssetId"].map(token_market).astype("float64")
+    market_ix = maker_m.fillna(taker_m)
+    routed = df[market_ix.notna()]
+    for i, part in routed.groupby(market_ix[market_ix.notna()].astype("int64"), sort=True):
+        part = part.copy()
+        for c in part.columns:
+            if isinstance(part[c].dtype, pd.CategoricalDtype):
+                part[c] = part[c].cat.remove_unused_categories()  # don't ship every market's ids
+        yield int(i), part
+
+def _clean_market(job) -> Tuple[str, Optional[pd.DataFrame]]:
+    # Process-pool worker: one market's fills → cleaned trades (None when it has no token↔USDC fills)
+    key, fills, yes, no, title, slug, event_slug, perspective, price_units = job
+    fills = select_token_usdc_fills(fills, yes, no)
+    if fills.empty:
+        return key, None
+    return key, canonicalize_fills(fills, yes, no, title, slug, event_slug, perspective, price_units)
+
+def clean_batch(df: pd.DataFrame, markets: pd.DataFrame, perspective: str = "taker",
+                workers: int = 0, price_units: str = "float") -> Iterator[Tuple[str, Optional[pd.DataFrame]]]:
+    """Canonicalize every market in a process pool; yields (market, cleaned) in markets order."""
+    jobs = []
+    for i, fills in route_fills(df, markets):
+        r = markets.iloc[i]
+        jobs.append((r["market"], fills, r["yes_token"], r["no_token"],
+                     r["title"], r["slug"], r["eventSlug"], perspective, price_units))
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as ex:
+        yield from ex.map(_clean_market, jobs)
+
+def _market_filename(key: str, fmt: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", key) + (".parquet" if fmt == "parquet" else ".csv")
+
+def write_batch(results, out_path: str, fmt: str = "csv") -> List[Tuple[str, int]]:
+    """One file per market in directory out_path, or a single file (with a market column) if it
+    has a .csv/.parquet/.jsonl suffix. Returns (market, trades) for each market written."""
+    written = []
+    if Path(out_path).suffix:
+        with TableWriter(out_path) as w:
+            for key, cleaned in results:
+                if cleaned is not None:
+                    w.write_frame(cleaned.assign(market=key))
+                    written.append((key, len(cleaned)))
+    else:
+        Path(out_path).mkdir(parents=True, exist_ok=True)
+        for key, cleaned in results:
+            if cleaned is not None:
+                write_table(cleaned, Path(out_path) / _market_filename(key, fmt))
+                written.append((key, len(cleaned)))
+    return written
+
+def verify_equivalence(df: pd.DataFrame, YES_TOKEN: str, NO_TOKEN: str,
+                       title: str, slug: str, event_slug: str, perspective: str = "taker",
+                       rtol: float = 1e-9) -> None:
+    """Raise AssertionError if clean_trades disagrees with clean_trades_reference on df."""
+    fast = clean_trades(df.copy(), YES_TOKEN, NO_TOKEN, title, slug, event_slug, perspective)
+    ref = clean_trades_reference(df.copy(), YES_TOKEN, NO_TOKEN, title, slug, event_slug, perspective)
+
+    # The reference orders ties on timestamp arbitrarily; compare on the (tx, asset) key
+    key = ["transactionHash", "asset"]
+    fast = fast.sort_values(key).reset_index(drop=True)
+    ref = ref.sort_values(key).reset_index(drop=True)
+    assert len(fast) == len(ref), f"row count differs: {len(fast)} vs {len(ref)}"
+    for c in ["timestamp", "side", "outcome", "transactionHash", "asset", "proxyWallet",
+              "title", "slug", "eventSlug"]:
+        bad = (fast[c].astype(str) != ref[c].astype(str))
+        assert not bad.any(), f"column {c} differs on {int(bad.sum())} rows"
+    for c in ["price", "size", "volume_usdc"]:
+        ok = np.isclose(fast[c].astype(float), ref[c].astype(float), rtol=rtol, atol=0)
+        assert ok.all(), f"column {c} differs on {int((~ok).sum())} rows"
+
+def clean_trades_reference(df: pd.DataFrame, YES_TOKEN: str, NO_TOKEN: str,
                  title: str, slug: str, event_slug: str, perspective: str = "taker") -> pd.DataFrame:
+    # Original per-transaction implementation, kept for --verify equivalence checks.
     TOKENS = {YES_TOKEN, NO_TOKEN}
 
     # numeric casts
@@ -186,7 +491,7 @@ def clean_trades(df: pd.DataFrame, YES_TOKEN: str, NO_TOKEN: str,
             outcome = "Yes" if str(token_id) == YES_TOKEN else "No"
             
             results.append({
-                "transactionHash": g["transactionHash"].iloc[0],
+                "transactionHash": g.name,  # the group key (apply doesn't pass the key column)
                 "timestamp":       int(g["timestamp"].max()),
                 "side":            side,
                 "outcome":         outcome,
@@ -206,7 +511,7 @@ def clean_trades(df: pd.DataFrame, YES_TOKEN: str, NO_TOKEN: str,
             
         return pd.DataFrame(results)
 
-    out = (df.sort_values("timestamp")
+    out = (df.sort_values("timestamp", kind="stable")
              .groupby("transactionHash", group_keys=False)
              .apply(canon_group))
 
@@ -217,19 +522,109 @@ def clean_trades(df: pd.DataFrame, YES_TOKEN: str, NO_TOKEN: str,
     ]]
     return out
 
+def read_fills(args, markets: Optional[List[str]] = None) -> pd.DataFrame:
+    """FILL_COLS of the input file, or of the store's fills for `markets` (all when None)."""
+    if args.store:
+        return TradeStore(args.store).scan("fills", markets, args.since, args.until, columns=FILL_COLS)
+    df = read_table(args.in_path, columns=FILL_COLS, dtype=str)
+    return df if is_parquet(args.in_path) else df.fillna("")
+
+def maker_path(out_path: str) -> str:
+    """Default maker output next to out_path: cleaned.csv → cleaned_maker.csv, dir → dir_maker."""
+    p = Path(out_path)
+    return str(p.with_name(f"{p.stem}_maker{p.suffix}"))
+
+def split_perspectives(cleaned, perspective: str) -> Dict[str, pd.DataFrame]:
+    # clean_trades result as {perspective: trades}, whether it ran for one or both
+    return cleaned if isinstance(cleaned, dict) else {perspective: cleaned}
+
 def main():
     args = parse_args()
-    assert Path(args.in_path).exists(), f"Input not found: {args.in_path}"
-    df = pd.read_csv(args.in_path, dtype=str).fillna("")
+    metrics.configure(args)
+    if args.store:
+        if args.chunksize:
+            raise SystemExit("--chunksize streams a file; use --since/--until to bound a --store read")
+    else:
+        if not (args.in_path and args.out_path):
+            raise SystemExit("--in and --out are required without --store")
+        assert Path(args.in_path).exists(), f"Input not found: {args.in_path}"
+    store_out = args.store and not args.out_path
+    if store_out and args.perspective == "both":
+        raise SystemExit("the store holds one perspective per market; pass --out with --perspective both")
+    if args.perspective == "both":
+        outs = {"taker": args.out_path, "maker": args.maker_out or maker_path(args.out_path)}
+    else:
+        outs = {args.perspective: args.out_path}
+
+    if args.markets:
+        markets = load_markets(args.markets, registry=args.registry, collateral=args.collateral)
+        with metrics.stage("read") as st:
+            conds = [c.lower() for c in markets["condition"] if c]
+            df = read_fills(args, conds if len(conds) == len(markets) else None)
+            st.rows = len(df)
+        with metrics.stage("clean_batch", rows=len(df)):
+            results = clean_batch(df, markets, perspective=args.perspective, workers=args.workers,
+                                  price_units=args.price_units)
+            if store_out:
+                store = TradeStore(args.store)
+                written = [(key, store.append(cleaned, "trades", key))
+                           for key, cleaned in results if cleaned is not None]
+                outs = {args.perspective: args.store}
+            else:
+                results = [(key, None if c is None else split_perspectives(c, args.perspective))
+                           for key, c in results]
+                for p, path in outs.items():
+                    written = write_batch([(key, c and c[p]) for key, c in results], path, fmt=args.format)
+        for path in outs.values():
+            print(f"✓ Wrote {path}: {sum(n for _, n in written)} trades across "
+                  f"{len(written)} of {len(markets)} markets.")
+        return
+
+    if args.chunksize:
+        YES_TOKEN, NO_TOKEN = determine_token_ids(None, args)
+        n = clean_trades_streaming(
+            args.in_path, args.out_path, YES_TOKEN, NO_TOKEN,
+            title=args.title, slug=args.slug, event_slug=args.event_slug,
+            perspective=args.perspective, chunksize=args.chunksize, price_units=args.price_units,
+            maker_out_path=outs.get("maker")
+        )
+        for path in outs.values():
+            print(f"✓ Wrote {path} with {n} trades (no buy/sell pairs).")
+        print(f"Token IDs → YES: {YES_TOKEN} | NO: {NO_TOKEN}")
+        return
+
+    if store_out and not args.condition:
+        raise SystemExit("writing trades into --store needs --condition (the store's market key)")
+    with metrics.stage("read") as st:
+        df = read_fills(args, args.condition.lower() if args.condition else None)
+        st.rows = len(df)
 
     YES_TOKEN, NO_TOKEN = determine_token_ids(df, args)
 
+    if args.verify:
+        with metrics.stage("verify", rows=len(df)):
+            for p in outs:
+                verify_equivalence(
+                    df, YES_TOKEN, NO_TOKEN,
+                    title=args.title, slug=args.slug, event_slug=args.event_slug, perspective=p
+                )
+        print("✓ Vectorized output matches reference implementation.")
+
     cleaned = clean_trades(
         df, YES_TOKEN, NO_TOKEN,
-        title=args.title, slug=args.slug, event_slug=args.event_slug, perspective=args.perspective
+        title=args.title, slug=args.slug, event_slug=args.event_slug, perspective=args.perspective,
+        price_units=args.price_units
     )
-    cleaned.to_csv(args.out_path, index=False)
-    print(f"✓ Wrote {args.out_path} with {len(cleaned)} trades (no buy/sell pairs).")
+    cleaned = split_perspectives(cleaned, args.perspective)
+    n = len(cleaned[next(iter(outs))])
+    with metrics.stage("write", rows=n):
+        if store_out:
+            TradeStore(args.store).append(cleaned[args.perspective], "trades", args.condition.lower())
+        else:
+            for p, path in outs.items():
+                write_table(cleaned[p], path)
+    for path in outs.values():
+        print(f"✓ Wrote {path or args.store} with {n} trades (no buy/sell pairs).")
     print(f"Token IDs → YES: {YES_TOKEN} | NO: {NO_TOKEN}")
 
 if __name__ == "__main__":
@@ -2,19 +2,51 @@
 # Compare transactions between poly_nyc_dem_nom_zm_trades.csv (accurate) and cleaned_trades.csv
 # Match by timestamp and transaction hash, check buy/sell and yes/no accuracy
 
+import argparse
+import numpy as np
 import pandas as pd
-from typing import Dict, List, Tuple
+from typing import Optional, Tuple
 
-def load_and_prepare_data():
-    """Load both CSV files and prepare for comparison"""
-    print("Loading CSV files...")
+import metrics
+from tabular_io import read_table
+from trade_store import TradeStore
+
+REF_PATH = "poly_nyc_dem_nom_zm_trades.csv"
+CLEANED_PATH = "cleaned_trades_maker.csv"
+
+# Only these columns take part in the comparison
+COMPARE_COLS = ["timestamp", "side", "outcome", "price", "transactionHash"]
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--ref", dest="ref_path", default=REF_PATH, help="reference trades CSV or Parquet")
+    p.add_argument("--cleaned", dest="cleaned_path", default=CLEANED_PATH, help="cleaned trades CSV or Parquet")
+    p.add_argument("--store", help="read cleaned trades from this trade store instead of --cleaned: the "
+                                   "--market over the reference's time span, else the reference's tx hashes")
+    p.add_argument("--market", help="with --store: market key (conditionId) of the cleaned trades")
+    metrics.add_args(p)
+    return p.parse_args()
+
+def load_and_prepare_data(ref_path: str = REF_PATH, cleaned_path: str = CLEANED_PATH,
+                          store: Optional[str] = None, market: Optional[str] = None):
+    """Load both trade files and prepare for comparison"""
+    print("Loading trade files...")
     
     # Load the accurate reference data
-    ref_df = pd.read_csv("poly_nyc_dem_nom_zm_trades.csv")
+    ref_df = read_table(ref_path, columns=COMPARE_COLS)
     print(f"Reference data: {len(ref_df)} rows")
     
     # Load the cleaned data to compare
-    cleaned_df = pd.read_csv("cleaned_trades_maker.csv")
+    if store and market:
+        ts = pd.to_numeric(ref_df['timestamp'], errors='coerce')
+        cleaned_df = TradeStore(store).scan("trades", market, int(ts.min()), int(ts.max()) + 1,
+                                            columns=COMPARE_COLS)
+    elif store:
+        # Only the reference's transactions: cleaned-only transactions are not counted
+        cleaned_df = TradeStore(store).by_tx("trades", ref_df['transactionHash'].dropna(),
+                                             columns=COMPARE_COLS)[COMPARE_COLS]
+    else:
+        cleaned_df = read_table(cleaned_path, columns=COMPARE_COLS)
     print(f"Cleaned data: {len(cleaned_df)} rows")
     
     # Convert timestamp to int for comparison
@@ -23,166 +55,173 @@ def load_and_prepare_data():
     
     return ref_df, cleaned_df
 
-def find_matching_transactions(ref_df: pd.DataFrame, cleaned_df: pd.DataFrame) -> List[Dict]:
-    """Find transactions where ANY ref row matches ANY cleaned row for the same transaction hash"""
-    transaction_groups = []
-    
+def _upper_codes(values: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    # Upper-cased values as (codes, vocab); -1 for nulls. Only the distinct values get upper-cased.
+    cat = values.astype("category")
+    vocab = cat.cat.categories.astype(str).str.upper()
+    return np.asarray(cat.cat.codes), np.asarray(vocab)
+
+def _any_shared(ref_tx: np.ndarray, ref_vals: pd.Series,
+                cln_tx: np.ndarray, cln_vals: pd.Series, n_tx: int) -> np.ndarray:
+    # Per tx code: does some ref value equal (case-insensitively) some cleaned value?
+    r_codes, r_vocab = _upper_codes(ref_vals)
+    c_codes, c_vocab = _upper_codes(cln_vals)
+    vocab, inv = np.unique(np.concatenate([r_vocab, c_vocab]), return_inverse=True)
+    # (tx × value) presence matrices; side/outcome vocabularies are tiny
+    def present(tx, codes, offset):
+        ok = codes >= 0
+        m = np.zeros((n_tx, len(vocab)), dtype=bool)
+        m[tx[ok], inv[offset + codes[ok]]] = True
+        return m
+    return (present(ref_tx, r_codes, 0) & present(cln_tx, c_codes, len(r_vocab))).any(axis=1)
+
+def _any_price_within(ref_tx: np.ndarray, ref_price: pd.Series,
+                      cln_tx: np.ndarray, cln_price: pd.Series, n_tx: int, tol: float = 0.01) -> np.ndarray:
+    # Per tx code: is some ref price within tol (relative) of some cleaned price?
+    # For each ref price the nearest cleaned price in the same tx decides, found with one as-of join.
+    ref_p = pd.DataFrame({"tx": ref_tx, "price": pd.to_numeric(ref_price, errors="coerce").to_numpy()})
+    cln_p = pd.DataFrame({"tx": cln_tx, "cleaned_price": pd.to_numeric(cln_price, errors="coerce").to_numpy()})
+    ref_p = ref_p.dropna().sort_values("price")
+    cln_p = cln_p.dropna().sort_values("cleaned_price")
+    near = pd.merge_asof(ref_p, cln_p, left_on="price", right_on="cleaned_price",
+                         by="tx", direction="nearest")
+    ok = (near["price"] != 0) & ((near["price"] - near["cleaned_price"]).abs() / near["price"] < tol)
+    out = np.zeros(n_tx, dtype=bool)
+    out[near.loc[ok, "tx"].to_numpy()] = True
+    return out
+
+def find_matching_transactions(ref_df: pd.DataFrame, cleaned_df: pd.DataFrame) -> pd.DataFrame:
+    """Find transactions where ANY ref row matches ANY cleaned row for the same transaction hash.
+
+    Returns one row per transaction present in both files (sorted by hash) with the row counts
+    on each side and boolean sides_match / outcomes_match / price_match columns.
+    """
     print("\nFinding matching transactions...")
-    
-    # Group reference data by transaction hash
-    ref_groups = ref_df.groupby('transactionHash')
-    
-    for tx_hash, ref_group in ref_groups:
-        # Find matching rows in cleaned data for this transaction
-        matching_cleaned = cleaned_df[cleaned_df['transactionHash'] == tx_hash]
-        
-        if len(matching_cleaned) > 0:
-            # Check if ANY ref row matches ANY cleaned row
-            sides_match = False
-            outcomes_match = False
-            price_match = False
-            
-            # Get all unique values from both groups
-            ref_sides = set(ref_group['side'].dropna().str.upper())
-            cleaned_sides = set(matching_cleaned['side'].dropna().str.upper())
-            ref_outcomes = set(ref_group['outcome'].dropna().str.upper())
-            cleaned_outcomes = set(matching_cleaned['outcome'].dropna().str.upper())
-            
-            # Check if there's any overlap
-            if ref_sides & cleaned_sides:  # Any common sides
-                sides_match = True
-            
-            if ref_outcomes & cleaned_outcomes:  # Any common outcomes
-                outcomes_match = True
-            
-            # Check price overlap (within 1% tolerance)
-            ref_prices = ref_group['price'].dropna()
-            cleaned_prices = matching_cleaned['price'].dropna()
-            
-            if len(ref_prices) > 0 and len(cleaned_prices) > 0:
-                try:
-                    ref_prices_float = ref_prices.astype(float)
-                    cleaned_prices_float = cleaned_prices.astype(float)
-                    
-                    # Check if any ref price is close to any cleaned price
-                    for ref_price in ref_prices_float:
-                        for cleaned_price in cleaned_prices_float:
-                            if ref_price != 0 and abs(ref_price - cleaned_price) / ref_price < 0.01:
-                                price_match = True
-                                break
-                        if price_match:
-                            break
-                except (ValueError, TypeError, ZeroDivisionError):
-                    pass
-            
-            transaction_groups.append({
-                'transactionHash': tx_hash,
-                'ref_count': len(ref_group),
-                'cleaned_count': len(matching_cleaned),
-                'ref_sides': ref_sides,
-                'cleaned_sides': cleaned_sides,
-                'ref_outcomes': ref_outcomes,
-                'cleaned_outcomes': cleaned_outcomes,
-                'ref_prices': ref_prices.tolist(),
-                'cleaned_prices': cleaned_prices.tolist(),
-                'sides_match': sides_match,
-                'outcomes_match': outcomes_match,
-                'price_match': price_match,
-                'ref_group': ref_group,
-                'cleaned_group': matching_cleaned
-            })
-    
-    print(f"Found {len(transaction_groups)} matching transaction groups")
-    return transaction_groups
-
-def analyze_matches(transaction_groups: List[Dict]):
+
+    # Hash join: both files' transaction hashes share one integer code space
+    n_ref = len(ref_df)
+    codes, hashes = pd.factorize(pd.concat([ref_df["transactionHash"].astype(str),
+                                            cleaned_df["transactionHash"].astype(str)], ignore_index=True))
+    ref_tx, cln_tx = codes[:n_ref], codes[n_ref:]
+    n_tx = len(hashes)
+    ref_count = np.bincount(ref_tx, minlength=n_tx)
+    cln_count = np.bincount(cln_tx, minlength=n_tx)
+    common = (ref_count > 0) & (cln_count > 0)
+
+    # Only rows of transactions present on both sides take part
+    ref_rows, cln_rows = common[ref_tx], common[cln_tx]
+    ref_df, cleaned_df = ref_df[ref_rows], cleaned_df[cln_rows]
+    ref_tx, cln_tx = ref_tx[ref_rows], cln_tx[cln_rows]
+
+    sides = _any_shared(ref_tx, ref_df["side"], cln_tx, cleaned_df["side"], n_tx)
+    outcomes = _any_shared(ref_tx, ref_df["outcome"], cln_tx, cleaned_df["outcome"], n_tx)
+    prices = _any_price_within(ref_tx, ref_df["price"], cln_tx, cleaned_df["price"], n_tx)
+
+    groups = pd.DataFrame({
+        "transactionHash": np.asarray(hashes)[common],
+        "ref_count":       ref_count[common],
+        "cleaned_count":   cln_count[common],
+        "sides_match":     sides[common],
+        "outcomes_match":  outcomes[common],
+        "price_match":     prices[common],
+    }).sort_values("transactionHash").reset_index(drop=True)
+
+    print(f"Found {len(groups)} matching transaction groups")
+    return groups
+
+def _tx_details(df: pd.DataFrame, tx_hashes) -> dict:
+    # {tx: (SIDES, OUTCOMES, [prices])} for a handful of transactions
+    g = df[df["transactionHash"].isin(tx_hashes)]
+    out = {}
+    for tx, grp in g.groupby(g["transactionHash"].astype(str), sort=False):
+        out[tx] = (set(grp["side"].dropna().astype(str).str.upper()),
+                   set(grp["outcome"].dropna().astype(str).str.upper()),
+                   grp["price"].dropna().tolist())
+    return out
+
+def analyze_matches(transaction_groups: pd.DataFrame, ref_df: pd.DataFrame, cleaned_df: pd.DataFrame):
     """Analyze the transaction groups for accuracy"""
-    if not transaction_groups:
+    if transaction_groups.empty:
         print("No matching transaction groups found!")
         return
     
-    print(f"\nAnalyzing {len(transaction_groups)} transaction groups...")
+    n = len(transaction_groups)
+    print(f"\nAnalyzing {n} transaction groups...")
     
     # Count matches and mismatches
-    sides_correct = sum(1 for group in transaction_groups if group['sides_match'])
-    sides_incorrect = len(transaction_groups) - sides_correct
-    
-    outcomes_correct = sum(1 for group in transaction_groups if group['outcomes_match'])
-    outcomes_incorrect = len(transaction_groups) - outcomes_correct
-    
-    prices_correct = sum(1 for group in transaction_groups if group['price_match'])
-    prices_incorrect = len(transaction_groups) - prices_correct
-    
-    # Collect incorrect cases
-    incorrect_cases = []
-    
-    for group in transaction_groups:
-        issues = []
-        if not group['sides_match']:
-            issues.append(f"sides: ref={group['ref_sides']}, cleaned={group['cleaned_sides']}")
-        if not group['outcomes_match']:
-            issues.append(f"outcomes: ref={group['ref_outcomes']}, cleaned={group['cleaned_outcomes']}")
-        if not group['price_match']:
-            issues.append(f"prices: ref={group['ref_prices'][:3]}, cleaned={group['cleaned_prices'][:3]}")
-        
-        if issues:
-            incorrect_cases.append({
-                'tx': group['transactionHash'],
-                'ref_count': group['ref_count'],
-                'cleaned_count': group['cleaned_count'],
-                'issues': issues
-            })
+    sides_correct = int(transaction_groups['sides_match'].sum())
+    sides_incorrect = n - sides_correct
+    
+    outcomes_correct = int(transaction_groups['outcomes_match'].sum())
+    outcomes_incorrect = n - outcomes_correct
+    
+    prices_correct = int(transaction_groups['price_match'].sum())
+    prices_incorrect = n - prices_correct
+    
+    incorrect = transaction_groups[~(transaction_groups['sides_match'] &
+                                     transaction_groups['outcomes_match'] &
+                                     transaction_groups['price_match'])]
     
     # Print results
     print(f"\n=== TRANSACTION GROUP ACCURACY ===")
-    print(f"Total transaction groups: {len(transaction_groups)}")
+    print(f"Total transaction groups: {n}")
     
     print(f"\n=== SIDE (Buy/Sell) ACCURACY ===")
     print(f"Correct groups: {sides_correct}")
     print(f"Incorrect groups: {sides_incorrect}")
-    if len(transaction_groups) > 0:
-        accuracy = sides_correct / len(transaction_groups) * 100
-        print(f"Accuracy: {accuracy:.1f}%")
+    print(f"Accuracy: {sides_correct / n * 100:.1f}%")
     
     print(f"\n=== OUTCOME (Yes/No) ACCURACY ===")
     print(f"Correct groups: {outcomes_correct}")
     print(f"Incorrect groups: {outcomes_incorrect}")
-    if len(transaction_groups) > 0:
-        accuracy = outcomes_correct / len(transaction_groups) * 100
-        print(f"Accuracy: {accuracy:.1f}%")
+    print(f"Accuracy: {outcomes_correct / n * 100:.1f}%")
     
     print(f"\n=== PRICE ACCURACY ===")
     print(f"Correct groups (within 1%): {prices_correct}")
     print(f"Incorrect groups: {prices_incorrect}")
-    if len(transaction_groups) > 0:
-        accuracy = prices_correct / len(transaction_groups) * 100
-        print(f"Accuracy: {accuracy:.1f}%")
+    print(f"Accuracy: {prices_correct / n * 100:.1f}%")
     
-    # Show some incorrect cases
-    if incorrect_cases:
+    # Show some incorrect cases (details looked up only for the ones printed)
+    if len(incorrect):
         print(f"\n=== INCORRECT TRANSACTION GROUPS ===")
-        for i, case in enumerate(incorrect_cases[:10]):  # Show first 10
-            print(f"{i+1}. TX: {case['tx'][:20]}... (ref: {case['ref_count']} rows, cleaned: {case['cleaned_count']} rows)")
-            for issue in case['issues']:
-                print(f"   - {issue}")
-        if len(incorrect_cases) > 10:
-            print(f"... and {len(incorrect_cases) - 10} more incorrect groups")
+        shown = incorrect.head(10)
+        ref_details = _tx_details(ref_df, shown["transactionHash"])
+        cln_details = _tx_details(cleaned_df, shown["transactionHash"])
+        for i, case in enumerate(shown.itertuples(index=False)):
+            ref_sides, ref_outcomes, ref_prices = ref_details[case.transactionHash]
+            cln_sides, cln_outcomes, cln_prices = cln_details[case.transactionHash]
+            print(f"{i+1}. TX: {case.transactionHash[:20]}... (ref: {case.ref_count} rows, cleaned: {case.cleaned_count} rows)")
+            if not case.sides_match:
+                print(f"   - sides: ref={ref_sides}, cleaned={cln_sides}")
+            if not case.outcomes_match:
+                print(f"   - outcomes: ref={ref_outcomes}, cleaned={cln_outcomes}")
+            if not case.price_match:
+                print(f"   - prices: ref={ref_prices[:3]}, cleaned={cln_prices[:3]}")
+        if len(incorrect) > 10:
+            print(f"... and {len(incorrect) - 10} more incorrect groups")
     
     # Show summary stats
     print(f"\n=== SUMMARY STATS ===")
-    ref_total_rows = sum(group['ref_count'] for group in transaction_groups)
-    cleaned_total_rows = sum(group['cleaned_count'] for group in transaction_groups)
+    ref_total_rows = int(transaction_groups['ref_count'].sum())
+    cleaned_total_rows = int(transaction_groups['cleaned_count'].sum())
     print(f"Total reference rows: {ref_total_rows}")
     print(f"Total cleaned rows: {cleaned_total_rows}")
     print(f"Row count difference: {cleaned_total_rows - ref_total_rows}")
 
 def main():
+    args = parse_args()
+    metrics.configure(args)
     print("=== Transaction Comparison Analysis ===")
     
     try:
-        ref_df, cleaned_df = load_and_prepare_data()
-        matches = find_matching_transactions(ref_df, cleaned_df)
-        analyze_matches(matches)
+        with metrics.stage("read") as st:
+            ref_df, cleaned_df = load_and_prepare_data(args.ref_path, args.cleaned_path,
+                                                       args.store, args.market)
+            st.rows = len(ref_df) + len(cleaned_df)
+        with metrics.stage("match", rows=st.rows, hot=True):
+            matches = find_matching_transactions(ref_df, cleaned_df)
+        with metrics.stage("analyze", rows=len(matches)):
+            analyze_matches(matches, ref_df, cleaned_df)
         
     except FileNotFoundError as e:
         print(f"Error: Could not find file - {e}")
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# Time-aligned Kalshi vs Polymarket price comparison for the same event.
+# Both venues map into one normalized trade schema (YES-probability prices, UTC timestamps);
+# the streams are then aligned with as-of joins and compared bar by bar (spread, divergence,
+# lead/lag), or trade by trade against the other venue's last price (--mode trades).
+# Everything is columnar, so millions of trades per venue are fine.
+
+import argparse
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+
+import metrics
+from tabular_io import read_table, write_table
+
+# Normalized trade schema shared by both venues
+#   ts             trade time (UTC, microsecond resolution on both venues, so as-of joins line up)
+#   yes_price      price of the YES outcome as a probability in [0, 1]
+#   size           contracts / outcome tokens
+#   notional       USD paid for the outcome actually traded
+#   yes_direction  +1 if the trade added YES exposure (buy YES / sell NO), -1 otherwise
+NORMALIZED_COLS = ["venue", "market", "ts", "yes_price", "size", "notional", "yes_direction", "trade_id"]
+
+def normalize_polymarket(cleaned: pd.DataFrame, market: str = "") -> pd.DataFrame:
+    """clean_polymarket output → normalized trades (prices folded onto the YES outcome)."""
+    is_yes = cleaned["outcome"].astype(str).str.upper().eq("YES").to_numpy()
+    is_buy = cleaned["side"].astype(str).str.upper().eq("BUY").to_numpy()
+    price = cleaned["price"].to_numpy(dtype="float64")
+    out = pd.DataFrame({
+        "venue":         "polymarket",
+        "market":        market,
+        "ts":            pd.to_datetime(cleaned["timestamp"].astype("int64"), unit="s", utc=True).dt.as_unit("us"),
+        "yes_price":     np.where(is_yes, price, 1.0 - price),
+        "size":          cleaned["size"].to_numpy(dtype="float64"),
+        "notional":      cleaned["volume_usdc"].to_numpy(dtype="float64"),
+        "yes_direction": np.where(is_yes == is_buy, 1, -1).astype("int8"),
+        "trade_id":      cleaned["transactionHash"].astype(str).to_numpy(),
+    })
+    return out.sort_values("ts", kind="stable").reset_index(drop=True)
+
+def normalize_kalshi(trades: pd.DataFrame, market: str = "") -> pd.DataFrame:
+    """Kalshi /markets/trades records → normalized trades (cents or *_dollars price fields)."""
+    if "yes_price_dollars" in trades.columns:
+        yes_price = pd.to_numeric(trades["yes_price_dollars"], errors="coerce").to_numpy()
+    else:
+        yes_price = pd.to_numeric(trades["yes_price"], errors="coerce").to_numpy() / 100.0
+    size = pd.to_numeric(trades["count"], errors="coerce").to_numpy(dtype="float64")
+    taker_yes = trades["taker_side"].astype(str).str.lower().eq("yes").to_numpy()
+    out = pd.DataFrame({
+        "venue":         "kalshi",
+        "market":        market or (trades["ticker"].astype(str).to_numpy() if "ticker" in trades else ""),
+        "ts":            pd.to_datetime(trades["created_time"], utc=True, format="ISO8601").dt.as_unit("us"),
+        "yes_price":     yes_price,
+        "size":          size,
+        "notional":      size * np.where(taker_yes, yes_price, 1.0 - yes_price),
+        "yes_direction": np.where(taker_yes, 1, -1).astype("int8"),
+        "trade_id":      trades["trade_id"].astype(str).to_numpy(),
+    })
+    return out.sort_values("ts", kind="stable").reset_index(drop=True)
+
+def asof_align(a: pd.DataFrame, b: pd.DataFrame, tolerance: Optional[str] = None) -> pd.DataFrame:
+    """Each trade of `a` with the last `b` trade at or before it (within tolerance).
+
+    Adds b_yes_price, b_ts, spread (a - b) and staleness (a.ts - b.ts).
+    """
+    right = b[["ts", "yes_price"]].rename(columns={"yes_price": "b_yes_price"})
+    right = right.assign(b_ts=right["ts"])
+    out = pd.merge_asof(a, right, on="ts", direction="backward",
+                        tolerance=pd.Timedelta(tolerance) if tolerance else None)
+    out["spread"] = out["yes_price"] - out["b_yes_price"]
+    out["staleness"] = out["ts"] - out["b_ts"]
+    return out
+
+def align_trades(a: pd.DataFrame, b: pd.DataFrame, tolerance: Optional[str] = None,
+                 divergence: float = 0.05) -> pd.DataFrame:
+    """Every trade of both venues against the other venue's last trade (asof_align both ways), by time.
+
+    spread is the trade's own venue minus the other; diverged flags |spread| >= divergence.
+    """
+    out = pd.concat([asof_align(a, b, tolerance), asof_align(b, a, tolerance)], ignore_index=True)
+    out = out.sort_values("ts", kind="stable").reset_index(drop=True)
+    out["diverged"] = out["spread"].abs() >= divergence
+    return out
+
+def summarize_trades(aligned: pd.DataFrame) -> pd.DataFrame:
+    """Per venue: trades, how many found an other-venue price, spread, staleness and divergence."""
+    venue = aligned["venue"]
+    matched = aligned["spread"].notna()
+    return pd.DataFrame({
+        "trades":             venue.value_counts(sort=False),
+        "matched":            matched.groupby(venue).sum(),
+        "mean_spread":        aligned["spread"].groupby(venue).mean(),
+        "mean_abs_spread":    aligned["spread"].abs().groupby(venue).mean(),
+        "median_staleness_s": aligned["staleness"].dt.total_seconds().groupby(venue).median(),
+        "diverged_share":     aligned["diverged"].where(matched).astype("float64").groupby(venue).mean(),
+    }).rename_axis("venue").reset_index()
+
+def resample_prices(trades: pd.DataFrame, freq: str) -> pd.DataFrame:
+    """Per-bar last YES price, VWAP, size, signed flow and trade count (empty bars: price carried)."""
+    t = trades.set_index("ts")
+    g = t.resample(freq, label="right", closed="right")
+    bars = pd.DataFrame({
+        "last":   g["yes_price"].last(),
+        "size":   g["size"].sum(),
+        "flow":   (t["size"] * t["yes_direction"]).resample(freq, label="right", closed="right").sum(),
+        "trades": g["yes_price"].count(),
+    })
+    pv = (t["yes_price"] * t["size"]).resample(freq, label="right", closed="right").sum()
+    bars["vwap"] = pv / bars["size"].where(bars["size"] > 0)
+    bars["last"] = bars["last"].ffill()
+    return bars
+
+def align_bars(a: pd.DataFrame, b: pd.DataFrame, freq: str, divergence: float = 0.05,
+               z_window: int = 60) -> pd.DataFrame:
+    """Both venues on one bar grid with spread, rolling z-score and divergence flags.
+
+    Bars run over the overlap of the two streams; prices are carried forward into empty bars.
+    """
+    ba, bb = resample_prices(a, freq), resample_prices(b, freq)
+    start, end = max(ba.index.min(), bb.index.min()), min(ba.index.max(), bb.index.max())
+    if start > end:
+        return pd.DataFrame(columns=["a_last", "b_last", "spread", "spread_z", "diverged"])
+    grid = pd.date_range(start, end, freq=freq)
+    ba = ba.reindex(grid).assign(last=lambda d: d["last"].ffill()).fillna({"size": 0, "flow": 0, "trades": 0})
+    bb = bb.reindex(grid).assign(last=lambda d: d["last"].ffill()).fillna({"size": 0, "flow": 0, "trades": 0})
+    out = ba.add_prefix("a_").join(bb.add_prefix("b_"))
+    out["spread"] = out["a_last"] - out["b_last"]
+    roll = out["spread"].rolling(z_window, min_periods=max(2, z_window // 4))
+    out["spread_z"] = (out["spread"] - roll.mean()) / roll.std()
+    out["diverged"] = out["spread"].abs() >= divergence
+    return out
+
+def lead_lag(bars: pd.DataFrame, max_lag: int = 10) -> pd.DataFrame:
+    """Correlation of a's bar returns with b's returns `lag` bars later, for lag in [-max_lag, max_lag].
+
+    A peak at a positive lag means venue a moves first (a leads b).
+    """
+    ra = bars["a_last"].diff()
+    rb = bars["b_last"].diff()
+    lags = np.arange(-max_lag, max_lag + 1)
+    corr = [ra.corr(rb.shift(-lag)) for lag in lags]  # one vectorized corr per lag
+    return pd.DataFrame({"lag": lags, "corr": corr})
+
+def compare_venues(a: pd.DataFrame, b: pd.DataFrame, freqs: List[str], max_lag: int = 10,
+                   divergence: float = 0.05, z_window: int = 60) -> Dict[str, Dict[str, pd.DataFrame]]:
+    """{freq: {"bars": aligned bars, "lead_lag": correlation by lag}} for every resolution."""
+    out = {}
+    for freq in freqs:
+        bars = align_bars(a, b, freq, divergence=divergence, z_window=z_window)
+        out[freq] = {"bars": bars, "lead_lag": lead_lag(bars, max_lag) if len(bars) > 2 else pd.DataFrame()}
+    return out
+
+def summarize(results: Dict[str, Dict[str, pd.DataFrame]]) -> pd.DataFrame:
+    rows = []
+    for freq, r in results.items():
+        bars, ll = r["bars"], r["lead_lag"]
+        best = ll.loc[ll["corr"].abs().idxmax()] if len(ll) and ll["corr"].notna().any() else None
+        rows.append({
+            "freq":           freq,
+            "bars":           len(bars),
+            "mean_spread":    bars["spread"].mean() if len(bars) else np.nan,
+            "mean_abs_spread": bars["spread"].abs().mean() if len(bars) else np.nan,
+            "diverged_share": bars["diverged"].mean() if len(bars) else np.nan,
+            "best_lag":       int(best["lag"]) if best is not None else None,
+            "best_lag_corr":  float(best["corr"]) if best is not None else np.nan,
+        })
+    return pd.DataFrame(rows)
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--polymarket", required=True, help="clean_polymarket output (CSV/Parquet)")
+    p.add_argument("--kalshi", required=True, help="query_kalshi output (JSONL/Parquet)")
+    p.add_argument("--market", default="", help="label for the paired market")
+    p.add_argument("--mode", choices=["bars", "trades"], default="bars",
+                   help="compare on bar grids (default), or each trade against the other venue's last trade")
+    p.add_argument("--tolerance", help="trades mode: ignore other-venue prices older than this (e.g. 5min)")
+    p.add_argument("--freq", nargs="+", default=["1min", "5min", "1h"], help="bar resolutions")
+    p.add_argument("--max-lag", type=int, default=10, help="lead/lag range in bars")
+    p.add_argument("--divergence", type=float, default=0.05, help="|spread| that counts as divergence")
+    p.add_argument("--z-window", type=int, default=60, help="bars in the rolling spread z-score")
+    p.add_argument("--out", help="output prefix; writes <prefix>_<freq>_bars/_lead_lag (.parquet), "
+                                 "or <prefix>_trades.parquet in trades mode")
+    metrics.add_args(p)
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    metrics.configure(args)
+    with metrics.stage("read") as st:
+        poly = normalize_polymarket(read_table(args.polymarket), args.market)
+        kalshi = normalize_kalshi(read_table(args.kalshi), args.market)
+        st.rows = len(poly) + len(kalshi)
+    print(f"Polymarket trades: {len(poly)} | Kalshi trades: {len(kalshi)}")
+
+    if args.mode == "trades":
+        with metrics.stage("align", rows=len(poly) + len(kalshi), hot=True):
+            aligned = align_trades(poly, kalshi, args.tolerance, args.divergence)
+        print(summarize_trades(aligned).to_string(index=False))
+        if args.out:
+            with metrics.stage("write", rows=len(aligned)):
+                write_table(aligned, f"{args.out}_trades.parquet")
+            print(f"✓ Wrote {args.out}_trades.parquet")
+        return
+
+    with metrics.stage("compare", rows=len(poly) + len(kalshi), hot=True):
+        results = compare_venues(poly, kalshi, args.freq, max_lag=args.max_lag,
+                                 divergence=args.divergence, z_window=args.z_window)
+    print(summarize(results).to_string(index=False))
+    if args.out:
+        with metrics.stage("write"):
+            for freq, r in results.items():
+                write_table(r["bars"].rename_axis("ts").reset_index(), f"{args.out}_{freq}_bars.parquet")
+                write_table(r["lead_lag"], f"{args.out}_{freq}_lead_lag.parquet")
+        print(f"✓ Wrote {args.out}_<freq>_bars/_lead_lag.parquet for {', '.join(args.freq)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# Runs the Polymarket backfill and the Kalshi fetch against the local mock API while it throttles,
+# fails and drops requests, and checks that the HTTP layer still delivers exactly the served data
+# (no gaps, no duplicates) without jumping announced Retry-After windows.
+#
+#   python fault_harness.py                 # every scenario
+#   python fault_harness.py throttle drops  # some of them
+
+import argparse
+import sys
+import time
+
+import pandas as pd
+
+import query_kalshi as qk
+import query_polymarket as qp
+from http_client import HttpClient
+from mock_api import Faults, MockAPI
+from synthetic_fills import FILL_FIELDS, NO_TOKEN, YES_TOKEN, generate_fills, generate_kalshi_trades
+
+class _Rows:
+    # TableWriter stand-in that keeps rows in memory
+    def __init__(self):
+        self.rows = []
+
+    def writerow(self, row):
+        self.rows.append(row)
+
+    def flush(self):
+        pass
+
+# name → (Faults kwargs, workers)
+SCENARIOS = {
+    "clean":       ({}, 4),
+    "throttle":    ({"throttle_rps": 40, "burst": 5, "retry_after": 0.2}, 4),
+    "retry_after": ({"throttle_rps": 20, "burst": 2, "retry_after": 0.3}, 1),
+    "errors":      ({"error_rate": 0.2, "retry_after": 0.1}, 4),
+    "drops":       ({"drop_rate": 0.1}, 4),
+    "slow":        ({"slow_rate": 0.1, "slow_sec": 0.3}, 4),
+    "mixed":       ({"throttle_rps": 60, "retry_after": 0.2, "error_rate": 0.05, "drop_rate": 0.05,
+                     "slow_rate": 0.05, "slow_sec": 0.2}, 4),
+}
+
+def client(workers: int) -> HttpClient:
+    # Short backoff so the scenarios finish quickly; Retry-After still wins when it is longer
+    return HttpClient(workers, interval=0.0, backoff=0.05, max_backoff=1.0, retries=10, timeout=10)
+
+def run_polymarket(api: MockAPI, workers: int) -> list:
+    qp.ORDERBOOK_GQL = api.gql_url
+    sess = client(workers)
+    ids = [YES_TOKEN, NO_TOKEN]
+    since, until = qp.find_time_bounds(ids, sess)
+    passes = [({}, side, ids) for side in ("maker", "taker")]
+    for pstate, _, _ in passes:
+        qp.plan_pass(pstate, since, until, 4 * workers)
+    out = _Rows()
+    qp.run_backfill(out, set(), passes, workers, session=sess, batch=4)
+    return [r["id"] for r in out.rows]
+
+def run_kalshi(api: MockAPI, trades: pd.DataFrame, workers: int) -> list:
+    qk.URL = api.kalshi_url
+    ts = (pd.to_datetime(trades["created_time"], utc=True, format="ISO8601")
+          - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)
+    out = _Rows()
+    qk.fetch_trades([trades["ticker"].iloc[0]], int(ts.min()), int(ts.max()), out,
+                    windows=workers, workers=workers, session=client(workers))
+    return [r["trade_id"] for r in out.rows]
+
+def check(name: str, got: list, want: set) -> list:
+    problems = []
+    if len(got) != len(set(got)):
+        problems.append(f"{name}: {len(got) - len(set(got))} duplicate rows")
+    if set(got) != want:
+        problems.append(f"{name}: {len(want - set(got))} missing, {len(set(got) - want)} unexpected")
+    return problems
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("scenarios", nargs="*", default=list(SCENARIOS), help=f"of {', '.join(SCENARIOS)}")
+    p.add_argument("--rows", type=int, default=5000, help="fills / trades served")
+    args = p.parse_args()
+
+    fills = pd.concat(generate_fills(args.rows, seed=2, other_share=0.0), ignore_index=True)[FILL_FIELDS]
+    trades = generate_kalshi_trades(args.rows, seed=2)
+    want_fills, want_trades = set(fills["id"]), set(trades["trade_id"])
+
+    failed = []
+    for name in args.scenarios:
+        kw, workers = SCENARIOS[name]
+        faults = Faults(seed=len(name), **kw)
+        t0 = time.perf_counter()
+        with MockAPI(fills, trades, faults=faults) as api:
+            problems = check("polymarket", run_polymarket(api, workers), want_fills)
+            problems += check("kalshi", run_kalshi(api, trades, workers), want_trades)
+            requests = api.requests
+        if workers == 1 and faults.counts["early"]:
+            problems.append(f"{faults.counts['early']} requests ignored Retry-After")
+        status = "ok" if not problems else "FAIL"
+        print(f"{name:<12} {status:<5} {time.perf_counter() - t0:6.2f}s  {requests:5d} requests  "
+              + " ".join(f"{k}={v}" for k, v in faults.counts.items()))
+        for msg in problems:
+            print(f"    {msg}")
+        if problems:
+            failed.append(name)
+    if failed:
+        sys.exit(f"✗ Failed: {', '.join(failed)}")
+    print("✓ All scenarios delivered every row exactly once")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# Shared HTTP layer for the fetchers (Goldsky GraphQL, CLOB markets, Kalshi trades).
+# One HttpClient per run: a pooled requests.Session, a request rate that adapts to what the
+# server tells us (429/5xx → slow down, fast responses → speed up, latency climbing → ease off)
+# and retries with jittered exponential backoff that honor Retry-After.
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from urllib.parse import urlsplit
+
+import requests
+
+import metrics
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+THROTTLE_STATUS = {429, 503}
+
+class AdaptiveRate:
+    """Minimum spacing between request starts, shared by every thread using the client.
+
+    The interval shrinks toward min_interval while requests succeed quickly and doubles (up to
+    max_interval) on a throttle. A latency EWMA well above the best seen so far widens it too
+    (up to the latency itself), before the server starts refusing. Retry-After pauses everyone
+    until it expires.
+    """
+
+    def __init__(self, interval: float = 0.0, min_interval: float = 0.0, max_interval: float = 30.0,
+                 slow_factor: float = 3.0):
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.slow_factor = slow_factor
+        self._lock = threading.Lock()
+        self._next = 0.0
+        self._resume_at = 0.0
+        self._latency = None  # EWMA
+        self._best = None     # lowest EWMA seen (slowly forgotten)
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next, self._resume_at)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def on_success(self, latency: float) -> None:
+        with self._lock:
+            self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+            self._best = self._latency if self._best is None else min(self._best * 1.001, self._latency)
+            if self._latency > self.slow_factor * self._best:
+                # ease off, but not past one request per current latency; that's for throttles
+                if self.interval < self._latency:
+                    self.interval = min(self._latency, max(self.interval, 0.01) * 1.25)
+            else:
+                self.interval = max(self.min_interval, self.interval * 0.9)
+                if self.interval < 1e-3:
+                    self.interval = self.min_interval
+
+    def on_throttle(self, retry_after: Optional[float] = None) -> None:
+        with self._lock:
+            self.interval = min(self.max_interval, max(self.interval * 2, 0.05))
+            if retry_after:
+                self._resume_at = max(self._resume_at, time.monotonic() + retry_after)
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    # Either delta-seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class HttpClient:
+    """requests.Session-like get/post with adaptive pacing and retries.
+
+    Retries 429/5xx, connection errors and timeouts up to `retries` times, sleeping
+    uniform(0, min(max_backoff, backoff * 2**attempt)) or the server's Retry-After, whichever is
+    longer. Other HTTP errors, and the last failure, raise as usual (requests.HTTPError etc.).
+    With --metrics, every attempt's latency goes to the http_request_seconds histogram (by host
+    and status) and time spent waiting on the pacer or a backoff to http_wait_seconds.
+    """
+
+    def __init__(self, pool_size: int = 10, interval: float = 0.0, min_interval: float = 0.0,
+                 max_interval: float = 30.0, retries: int = 8, backoff: float = 0.5,
+                 max_backoff: float = 60.0, timeout: float = 60):
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.rate = AdaptiveRate(interval, min_interval, max_interval)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0, "errors": 0, "bytes": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def request(self, method: str, url: str, **kw) -> requests.Response:
+        kw.setdefault("timeout", self.timeout)
+        host = urlsplit(url).netloc
+        attempt = 0
+        while True:
+            t_wait = time.monotonic()
+            self.rate.acquire()
+            self._count("requests")
+            t0 = time.monotonic()
+            metrics.count("http_wait_seconds", t0 - t_wait, host=host)
+            retry_after = None
+            try:
+                resp = self.session.request(method, url, **kw)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.observe("http_request_seconds", time.monotonic() - t0, host=host, status=type(e).__name__)
+                if attempt >= self.retries:
+                    raise
+                self._count("errors")
+                self.rate.on_throttle()
+            else:
+                metrics.observe("http_request_seconds", time.monotonic() - t0, host=host, status=resp.status_code)
+                if resp.status_code not in RETRY_STATUS:
+                    resp.raise_for_status()
+                    self.rate.on_success(time.monotonic() - t0)
+                    self._count("bytes", len(resp.content))
+                    metrics.count("http_response_bytes", len(resp.content), host=host)
+                    return resp
+                if attempt >= self.retries:
+                    resp.raise_for_status()
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                if resp.status_code in THROTTLE_STATUS:
+                    self._count("throttled")
+                    self.rate.on_throttle(retry_after)
+                else:
+                    self._count("errors")
+                resp.close()
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            self._count("retries")
+            metrics.count("http_wait_seconds", delay, host=host)
+            attempt += 1
+            time.sleep(delay)
+
+    def get(self, url: str, **kw) -> requests.Response:
+        return self.request("GET", url, **kw)
+
+    def post(self, url: str, **kw) -> requests.Response:
+        return self.request("POST", url, **kw)
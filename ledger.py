@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# Cleaned trades → per-wallet positions and PnL per (market, wallet, outcome), average-cost method.
+# Everything is columnar. A position is the running sum of signed sizes in int64 micro-units. The
+# cost basis follows the recurrence C_t = keep_t · C_{t-1} + added_t: a buy that grows the position
+# adds its cost, and a reduce keeps the share of the position left. That recurrence is solved with
+# cumulative sums in log space (see _cost_basis). Re-runs are incremental: the saved positions are
+# replayed as opening rows, then only trades newer than the last run are applied. Trades that turn
+# up below the watermark (late arrivals in a regenerated input) change every later average cost of
+# their positions, so they trigger a replay of the full history.
+#
+#   python ledger.py --in cleaned_trades.csv --out-dir ledger/
+#   python ledger.py --in cleaned_trades.csv --out-dir ledger/ --marks resolution.csv --trade-ledger ledger/trades.csv
+
+import argparse
+from pathlib import Path
+from typing import Optional
+import numpy as np
+import pandas as pd
+
+import metrics
+from build_bars import advance_watermark, late_trades, new_trades_since, record_applied
+from checkpoint import Checkpoint
+from tabular_io import TableWriter, is_parquet, read_table, write_table
+
+TRADE_COLS = ["timestamp", "side", "outcome", "size", "volume_usdc", "transactionHash", "asset", "proxyWallet"]
+KEYS = ["market", "proxyWallet", "outcome"]
+POSITION_COLS = KEYS + ["position", "avg_cost", "cost_basis", "realized_pnl", "mark", "unrealized_pnl",
+                        "trades", "last_ts"]
+LEDGER_COLS = ["timestamp", "transactionHash"] + KEYS + ["side", "size", "price", "position", "avg_cost",
+                                                         "cost_basis", "realized_pnl", "cum_realized_pnl"]
+UNITS = 1_000_000  # micro-units per token, as in clean_polymarket
+BLOCK = 200.0      # nats of position decay per rescaling block in _cost_basis
+
+def _prepare(trades: pd.DataFrame) -> pd.DataFrame:
+    t = trades[[c for c in TRADE_COLS + ["market"] if c in trades.columns]].copy()
+    if "market" not in t.columns:
+        t["market"] = ""
+    for c in KEYS:
+        t[c] = t[c].astype(str)
+    units = np.rint(t["size"].to_numpy(dtype="float64") * UNITS).astype("int64")
+    t["qty"] = np.where(t["side"].astype(str).str.upper().eq("BUY"), units, -units)
+    t["usdc"] = t["volume_usdc"].to_numpy(dtype="float64")
+    t["timestamp"] = t["timestamp"].astype("int64")
+    t["realized0"] = 0.0
+    t["_open"] = False
+    return t
+
+def _opening_rows(positions: pd.DataFrame) -> pd.DataFrame:
+    # Saved positions as synthetic first trades: the position bought for its cost basis
+    p = positions
+    return pd.DataFrame({
+        "timestamp": -1, "side": "", "transactionHash": "", "asset": "",
+        **{k: p[k].astype(str).to_numpy() for k in KEYS},
+        "size": p["position"].abs().to_numpy(),
+        "qty": np.rint(p["position"].to_numpy(dtype="float64") * UNITS).astype("int64"),
+        "usdc": p["cost_basis"].to_numpy(dtype="float64"),
+        "realized0": p["realized_pnl"].to_numpy(dtype="float64"),
+        "prior_trades": p["trades"].to_numpy(dtype="int64"),
+        "_open": True,
+    })
+
+def _cost_basis(add: np.ndarray, keep: np.ndarray, seg: np.ndarray) -> np.ndarray:
+    """C_t = keep_t · C_{t-1} + add_t within each segment (rows sorted, segments contiguous, 0 < keep ≤ 1).
+
+    With L_t the cumulative log(keep), C_t = e^{L_t} · Σ_{s≤t} add_s e^{-L_s}. e^{-L_s} would overflow on
+    long-lived positions, so rows are cut into blocks of BLOCK nats of L and each term is scaled to its
+    row's block. Terms more than a full block older weigh less than e^-BLOCK and are dropped.
+    """
+    L = pd.Series(np.log(keep)).groupby(seg).cumsum().to_numpy()
+    blk = np.floor(-L / BLOCK).astype("int64")
+    x = add * np.exp(-L - BLOCK * blk)
+    key = pd.MultiIndex.from_arrays([seg, blk])
+    run = pd.Series(x).groupby([seg, blk]).cumsum().to_numpy()
+    tot = pd.Series(x, index=key).groupby(level=[0, 1]).sum()
+    prev = tot.reindex(pd.MultiIndex.from_arrays([seg, blk - 1])).fillna(0.0).to_numpy()
+    return np.exp(L + BLOCK * blk) * (run + np.exp(-BLOCK) * prev)
+
+def run_ledger(trades: pd.DataFrame, positions: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """Per-trade ledger rows (running position, average cost, realized PnL), continuing from positions.
+
+    trades are clean_trades output (optionally with a market column), in any order. The result is
+    sorted by key, then time; opening rows from positions carry _open=True.
+    """
+    t = _prepare(trades)
+    t["prior_trades"] = 0
+    if positions is not None and len(positions):
+        t = pd.concat([_opening_rows(positions), t], ignore_index=True)
+    t = t.sort_values(KEYS + ["timestamp", "transactionHash"], kind="stable").reset_index(drop=True)
+
+    gid = t.groupby(KEYS, sort=False).ngroup().to_numpy()
+    first = np.r_[True, gid[1:] != gid[:-1]]
+    qty = t["qty"].to_numpy()
+    pos = pd.Series(qty).groupby(gid).cumsum().to_numpy()
+    before = pos - qty
+    side_before, side_after = np.sign(before), np.sign(pos)
+    tokens = np.abs(qty) / UNITS
+    price = np.divide(t["usdc"].to_numpy(), tokens, out=np.zeros(len(t)), where=tokens > 0)
+
+    increase = (before == 0) | ((side_after == side_before) & (np.abs(pos) > np.abs(before)))
+    cross = (before != 0) & (pos != 0) & (side_after != side_before)
+    reduce = ~increase & ~cross
+    # Share of the cost basis kept: a reduce keeps |pos|/|before|, a flip or close keeps nothing
+    keep = np.where(reduce, np.abs(pos) / np.where(before == 0, 1, np.abs(before)), np.where(cross, 0.0, 1.0))
+    add = np.where(increase, t["usdc"].to_numpy(), np.where(cross, np.abs(pos) / UNITS * price, 0.0))
+
+    # A segment restarts after the position goes flat and at a flip; inside one keep is in (0, 1]
+    seg = np.cumsum(first | (before == 0) | cross)
+    cost = _cost_basis(add, np.where(reduce & (pos != 0), keep, 1.0), seg)
+    cost = np.where(pos == 0, 0.0, cost)
+    prev_cost = np.where(first, 0.0, np.r_[0.0, cost[:-1]])
+
+    closed = np.where(increase, 0, np.minimum(np.abs(qty), np.abs(before))) / UNITS
+    realized = np.where(increase, 0.0, side_before * (closed * price - prev_cost * (1.0 - keep)))
+    realized = realized + t["realized0"].to_numpy()
+
+    held = np.abs(pos) / UNITS
+    t["price"] = price
+    t["position"] = pos / UNITS
+    t["cost_basis"] = cost
+    t["avg_cost"] = np.divide(cost, held, out=np.full(len(t), np.nan), where=held > 0)
+    t["realized_pnl"] = realized
+    t["cum_realized_pnl"] = pd.Series(realized).groupby(gid).cumsum().to_numpy()
+    t["_gid"] = gid
+    return t
+
+def last_prices(trades: pd.DataFrame) -> pd.DataFrame:
+    """Last traded price per (market, outcome): the default mark."""
+    t = _prepare(trades).sort_values("timestamp", kind="stable")
+    t["price"] = t["usdc"] / (t["qty"].abs() / UNITS)
+    return t.groupby(["market", "outcome"], sort=False)["price"].last().rename("mark").reset_index()
+
+def snapshot(ledger: pd.DataFrame, marks: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """Latest position per key with mark-to-market; marks has market, outcome, mark."""
+    real = ~ledger["_open"]
+    counts = real.groupby(ledger["_gid"]).sum() + ledger.groupby("_gid")["prior_trades"].sum()
+    last = ledger.groupby("_gid", sort=False).tail(1).set_index("_gid")
+    last_ts = ledger["timestamp"].where(real).groupby(ledger["_gid"]).max()
+    out = last[KEYS + ["position", "avg_cost", "cost_basis", "cum_realized_pnl"]].rename(
+        columns={"cum_realized_pnl": "realized_pnl"})
+    out["trades"] = counts.reindex(out.index).astype("int64")
+    out["last_ts"] = last_ts.reindex(out.index)
+    out = out.reset_index(drop=True)
+    if marks is not None and len(marks):
+        out = out.merge(marks[["market", "outcome", "mark"]], on=["market", "outcome"], how="left")
+    else:
+        out["mark"] = np.nan
+    pos = out["position"].to_numpy()
+    out["unrealized_pnl"] = np.sign(pos) * (out["mark"].to_numpy() * np.abs(pos) - out["cost_basis"].to_numpy())
+    return out[POSITION_COLS]
+
+def update_positions(positions: Optional[pd.DataFrame], new_trades: pd.DataFrame,
+                     marks: Optional[pd.DataFrame] = None):
+    """(positions after new_trades, ledger rows of new_trades); untouched positions are kept as is."""
+    t = _prepare(new_trades)
+    old = positions if positions is not None else pd.DataFrame(columns=POSITION_COLS)
+    touched = pd.MultiIndex.from_frame(t[KEYS].drop_duplicates())
+    hit = pd.MultiIndex.from_frame(old[KEYS].astype(str)).isin(touched) if len(old) else np.zeros(0, bool)
+    ledger = run_ledger(new_trades, old[hit])
+    fresh = snapshot(ledger)
+    out = pd.concat([old[~hit], fresh], ignore_index=True) if len(old) else fresh
+    # Marks: explicit table, else the last price in these trades, else the previous mark
+    m = marks if marks is not None else last_prices(new_trades)
+    if len(m):
+        new_mark = out[["market", "outcome"]].merge(m, on=["market", "outcome"], how="left")["mark"]
+        out["mark"] = new_mark.fillna(out["mark"].astype("float64")).to_numpy()
+    pos = out["position"].to_numpy(dtype="float64")
+    out["unrealized_pnl"] = np.sign(pos) * (out["mark"].to_numpy(dtype="float64") * np.abs(pos)
+                                            - out["cost_basis"].to_numpy(dtype="float64"))
+    out = out.sort_values(KEYS, kind="stable").reset_index(drop=True)
+    return out[POSITION_COLS], ledger[~ledger["_open"]][LEDGER_COLS].reset_index(drop=True)
+
+def positions_path(out_dir, fmt: str) -> Path:
+    return Path(out_dir) / f"positions.{'parquet' if fmt == 'parquet' else 'csv'}"
+
+def load_positions(path: Path) -> Optional[pd.DataFrame]:
+    if not path.exists():
+        return None
+    p = read_table(path, dtype={"market": str, "proxyWallet": str, "outcome": str})
+    p["market"] = p["market"].fillna("").astype(str)
+    return p
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--in", dest="in_path", required=True,
+                   help="cleaned trades CSV or Parquet (a market column keys positions per market)")
+    p.add_argument("--out-dir", required=True, help="directory for positions and state")
+    p.add_argument("--marks", help="mark prices (CSV/Parquet/JSONL) with columns market, outcome, mark; "
+                                   "default: last traded price per outcome")
+    p.add_argument("--trade-ledger", help="also write per-trade ledger rows here (CSV or JSONL, appended on re-runs)")
+    p.add_argument("--format", choices=["csv", "parquet"], default="parquet", help="positions file format")
+    p.add_argument("--rebuild", action="store_true", help="ignore saved positions and rebuild from scratch")
+    metrics.add_args(p)
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    metrics.configure(args)
+    if args.trade_ledger and is_parquet(args.trade_ledger):
+        raise SystemExit("--trade-ledger is appended to on re-runs; use a CSV or JSONL path")
+    Path(args.out_dir).mkdir(parents=True, exist_ok=True)
+    state_ckpt = Checkpoint(Path(args.out_dir) / "ledger_state.json")
+    path = positions_path(args.out_dir, args.format)
+    positions = None if args.rebuild else load_positions(path)
+    if positions is None:
+        state_ckpt.data = {}  # no positions on disk: replay the full history
+    state = state_ckpt.section("trades")
+
+    with metrics.stage("read") as st:
+        trades = read_table(args.in_path)
+        st.rows = len(trades)
+    marks = None
+    if args.marks:
+        marks = read_table(args.marks, dtype={"market": str, "outcome": str})
+        marks["market"] = marks["market"].fillna("").astype(str)
+    late, gone, since = late_trades(trades, state)
+    if since is not None:
+        print(f"⚠ {late} late trade(s) below the watermark, {gone} gone from the input (net per hour) since "
+              f"{pd.to_datetime(since, unit='s', utc=True)}; replaying the full history")
+        positions = None
+        state.clear()
+    new = new_trades_since(trades, state)
+    with metrics.stage("ledger", rows=len(new), hot=True):
+        positions, ledger = update_positions(positions, new, marks)
+    with metrics.stage("write", rows=len(positions)):
+        write_table(positions, path)
+        if args.trade_ledger:
+            with TableWriter(args.trade_ledger, append=bool(state.get("watermark"))) as w:
+                w.write_frame(ledger)
+    advance_watermark(state, new)
+    record_applied(state, trades)
+    state_ckpt.save()
+    open_ = positions[positions["position"] != 0]
+    print(f"✓ Applied {len(new)} new trades of {len(trades)}: {positions['proxyWallet'].nunique()} wallets, "
+          f"{len(open_)} open positions, realized {positions['realized_pnl'].sum():,.2f} USDC, "
+          f"unrealized {open_['unrealized_pnl'].sum():,.2f} USDC → {path}")
+
+if __name__ == "__main__":
+    main()
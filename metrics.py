@@ -0,0 +1,240 @@
+# Opt-in instrumentation for the pipeline scripts: stage timers with rows/sec, counters, HTTP
+# latency histograms and peak memory, written as JSON or Prometheus text when the run exits.
+# Off unless a script is run with --metrics; --profile adds a cProfile dump of the hot stages
+# (every --profile-every'th call, so long streaming runs aren't slowed down throughout).
+#
+#   python clean_polymarket.py --in fills.csv --out trades.csv --metrics run.json
+#   python query_polymarket.py --workers 8 --metrics run.prom --profile backfill.prof
+
+import atexit
+import cProfile
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+# Histogram bucket upper bounds in seconds (Prometheus client defaults)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+PREFIX = "pm_"
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2 ** 20 if sys.platform == "darwin" else rss / 2 ** 10  # bytes on macOS, KiB on Linux
+
+class Stage:
+    """Handle yielded by Metrics.stage; set .rows once the count is known."""
+    __slots__ = ("rows",)
+
+    def __init__(self, rows: Optional[int] = None):
+        self.rows = rows
+
+class Metrics:
+    """Thread-safe registry of stage timings, counters and histograms.
+
+    Disabled instances make every call a cheap no-op, so instrumented code needs no flag checks.
+    """
+
+    def __init__(self, enabled: bool = False, profile_path: Optional[str] = None, profile_every: int = 1):
+        self.enabled = enabled
+        self.profile_path = profile_path
+        self.profile_every = max(1, profile_every)
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict] = {}
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._hists: Dict[Tuple[str, Tuple], Dict] = {}
+        self._profiler = cProfile.Profile() if profile_path else None
+        self._profiling = False
+        self._hot_calls: Dict[str, int] = {}
+
+    # ----- recording -----
+    @contextmanager
+    def stage(self, name: str, rows: Optional[int] = None, hot: bool = False) -> Iterator[Stage]:
+        """Time a block; rows (given here or set on the handle) feed rows/sec.
+
+        hot=True marks the block for --profile; it's profiled on every profile_every'th call,
+        from one thread at a time.
+        """
+        st = Stage(rows)
+        if not self.enabled:
+            yield st
+            return
+        prof = hot and self._start_profile(name)
+        t0 = time.perf_counter()
+        try:
+            yield st
+        finally:
+            secs = time.perf_counter() - t0
+            if prof:
+                self._profiler.disable()
+                self._profiling = False
+            with self._lock:
+                s = self._stages.setdefault(name, {"calls": 0, "seconds": 0.0, "rows": 0, "max_seconds": 0.0})
+                s["calls"] += 1
+                s["seconds"] += secs
+                s["max_seconds"] = max(s["max_seconds"], secs)
+                s["rows"] += int(st.rows or 0)
+
+    def _start_profile(self, name: str) -> bool:
+        if self._profiler is None:
+            return False
+        with self._lock:
+            n = self._hot_calls.get(name, 0)
+            self._hot_calls[name] = n + 1
+            if self._profiling or n % self.profile_every:
+                return False
+            self._profiling = True
+        self._profiler.enable()
+        return True
+
+    def timed_iter(self, name: str, chunks: Iterable, hot: bool = False) -> Iterator:
+        """Yield from chunks, timing each fetch as one call of stage `name` (rows = len(chunk))."""
+        it = iter(chunks)
+        while True:
+            with self.stage(name, hot=hot) as st:
+                try:
+                    chunk = next(it)
+                except StopIteration:
+                    return
+                st.rows = len(chunk)
+            yield chunk
+
+    def count(self, name: str, n: float = 1, **labels) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """Add a value (seconds) to histogram `name`."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self._hists.get(key)
+            if h is None:
+                h = self._hists[key] = {"buckets": [0] * len(LATENCY_BUCKETS), "count": 0, "sum": 0.0}
+            for i, le in enumerate(LATENCY_BUCKETS):
+                if value <= le:
+                    h["buckets"][i] += 1
+                    break
+            h["count"] += 1
+            h["sum"] += value
+
+    # ----- output -----
+    def snapshot(self) -> Dict:
+        with self._lock:
+            stages = {}
+            for name, s in self._stages.items():
+                stages[name] = {**s, "rows_per_sec": s["rows"] / s["seconds"] if s["rows"] and s["seconds"] > 0 else None}
+            counters = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in self._counters.items()]
+            hists = []
+            for (n, l), h in self._hists.items():
+                cum, acc = [], 0
+                for c in h["buckets"]:
+                    acc += c
+                    cum.append(acc)
+                hists.append({"name": n, "labels": dict(l), "count": h["count"], "sum": h["sum"],
+                              "buckets": dict(zip(map(str, LATENCY_BUCKETS), cum))})
+        return {
+            "script": sys.argv[0],
+            "started": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.started)),
+            "wall_seconds": time.perf_counter() - self._t0,
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": stages,
+            "counters": counters,
+            "histograms": hists,
+        }
+
+    def to_prometheus(self) -> str:
+        snap = self.snapshot()
+        lines = []
+
+        def labels(d: Dict) -> str:
+            if not d:
+                return ""
+            esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"')
+            return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in sorted(d.items())) + "}"
+
+        def metric(name: str, kind: str, samples):
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+            for suffix, lbl, v in samples:
+                lines.append(f"{PREFIX}{name}{suffix}{labels(lbl)} {v}")
+
+        st = snap["stages"]
+        metric("stage_seconds_total", "counter", [("", {"stage": k}, s["seconds"]) for k, s in st.items()])
+        metric("stage_calls_total", "counter", [("", {"stage": k}, s["calls"]) for k, s in st.items()])
+        metric("stage_rows_total", "counter", [("", {"stage": k}, s["rows"]) for k, s in st.items()])
+        for name in dict.fromkeys(c["name"] for c in snap["counters"]):
+            metric(f"{name}_total", "counter",
+                   [("", c["labels"], c["value"]) for c in snap["counters"] if c["name"] == name])
+        for name in dict.fromkeys(h["name"] for h in snap["histograms"]):
+            samples = []
+            for h in (h for h in snap["histograms"] if h["name"] == name):
+                samples += [("_bucket", {**h["labels"], "le": le}, c) for le, c in h["buckets"].items()]
+                samples += [("_bucket", {**h["labels"], "le": "+Inf"}, h["count"]),
+                            ("_sum", h["labels"], h["sum"]), ("_count", h["labels"], h["count"])]
+            metric(name, "histogram", samples)
+        metric("wall_seconds", "gauge", [("", {}, snap["wall_seconds"])])
+        if snap["peak_rss_mb"] is not None:
+            metric("peak_rss_bytes", "gauge", [("", {}, int(snap["peak_rss_mb"] * 2 ** 20))])
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """JSON, or Prometheus text for a .prom/.txt path; '-' writes JSON to stderr."""
+        if path == "-":
+            print(json.dumps(self.snapshot(), indent=1), file=sys.stderr)
+            return
+        text = (self.to_prometheus() if path.endswith((".prom", ".txt"))
+                else json.dumps(self.snapshot(), indent=1))
+        with open(path, "w") as f:
+            f.write(text)
+
+    def dump_profile(self) -> None:
+        if self._profiler is not None:
+            self._profiler.dump_stats(self.profile_path)
+
+# Process-wide registry; disabled until configure() enables it
+registry = Metrics()
+
+def stage(name: str, rows: Optional[int] = None, hot: bool = False):
+    return registry.stage(name, rows, hot)
+
+def timed_iter(name: str, chunks: Iterable, hot: bool = False) -> Iterator:
+    return registry.timed_iter(name, chunks, hot) if registry.enabled else iter(chunks)
+
+def count(name: str, n: float = 1, **labels) -> None:
+    registry.count(name, n, **labels)
+
+def observe(name: str, value: float, **labels) -> None:
+    registry.observe(name, value, **labels)
+
+def add_args(p) -> None:
+    g = p.add_argument_group("metrics")
+    g.add_argument("--metrics", metavar="PATH",
+                   help="write stage timings, counters, HTTP latency and peak memory on exit "
+                        "(JSON; Prometheus text for .prom/.txt; '-' for stderr)")
+    g.add_argument("--profile", metavar="PATH", help="cProfile stats of the hot stages (pstats format)")
+    g.add_argument("--profile-every", type=int, default=1, help="profile every Nth call of a hot stage")
+
+def configure(args) -> Metrics:
+    """Enable the registry per --metrics/--profile and write its outputs when the process exits."""
+    global registry
+    if not (getattr(args, "metrics", None) or getattr(args, "profile", None)):
+        return registry
+    registry = Metrics(enabled=True, profile_path=args.profile, profile_every=args.profile_every)
+
+    def finish(m=registry, path=args.metrics):
+        if path:
+            m.write(path)
+        m.dump_profile()
+    atexit.register(finish)
+    return registry
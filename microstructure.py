@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# Cleaned trades → rolling microstructure metrics per outcome. Windows are trailing and end at
+# (and include) each trade. A time window ("5min", "1h") covers the trades in (t - w, t]; a trade
+# window ("100") covers the last N trades. For every window:
+#   trades_<w>     trades in the window
+#   buy_<w>        BUY size in the window (tokens); sell_<w> likewise
+#   ofi_<w>        order-flow imbalance (buy - sell) / (buy + sell), in [-1, 1]
+#   rv_<w>         realized volatility: sqrt of the summed squared log price returns in the window
+#   intensity_<w>  trades per second (a trade window uses the time it spans)
+#   large_<w>      the trade is at least --large-mult × the mean size of the window's other trades
+# Each metric is a difference of prefix sums at the window's two ends; a searchsorted on a
+# (group, timestamp) key finds every window start at once. One pass, O(n log n) over all windows.
+# Sizes are summed in int64 micro-units, so sums don't drift over tens of millions of trades.
+#
+#   python microstructure.py --in cleaned_trades.parquet --out micro.parquet --windows 1min 15min 100
+#   python microstructure.py --in cleaned_trades.parquet --out micro_1m.parquet --every 1min
+
+import argparse
+from typing import List
+import numpy as np
+import pandas as pd
+
+import metrics
+from build_bars import interval_seconds
+from tabular_io import read_table, write_table
+
+TRADE_COLS = ["timestamp", "side", "outcome", "price", "size", "transactionHash"]
+UNITS = 1_000_000  # micro-units per token, as in clean_polymarket
+
+def _keys(trades: pd.DataFrame) -> List[str]:
+    # Batch output carries a market column; single-market output is keyed by outcome alone
+    return ["market", "outcome"] if "market" in trades.columns else ["outcome"]
+
+def _window_starts(gkey: np.ndarray, ts: np.ndarray, pos: np.ndarray, window: str) -> np.ndarray:
+    """Index of each row's first in-window row; rows sorted by group, then time."""
+    if window.isdigit():
+        # Last N trades of the group: N-1 rows back, not before the group's first row
+        return np.maximum(np.arange(len(ts)) - (int(window) - 1), np.arange(len(ts)) - pos)
+    # (t - w, t] inside the group: the group id in the high bits keeps the search within it
+    key = (gkey << 34) | ts
+    return np.searchsorted(key, key - interval_seconds(window), side="right")
+
+def _diff(prefix: np.ndarray, start: np.ndarray) -> np.ndarray:
+    # Σ values[start..i] for every i, from an inclusive prefix sum
+    return prefix - np.where(start > 0, prefix[start - 1], 0)
+
+def rolling_metrics(trades: pd.DataFrame, windows: List[str], large_mult: float = 5.0) -> pd.DataFrame:
+    """One row per trade (oldest first per key) with the metrics of every window."""
+    keys = _keys(trades)
+    t = trades[[c for c in TRADE_COLS + ["market"] if c in trades.columns]]
+    t = t.sort_values(keys + ["timestamp", "transactionHash"], kind="stable").reset_index(drop=True)
+    gid = t.groupby(keys, sort=False, observed=True).ngroup().to_numpy().astype("int64")
+    n = len(t)
+    first = np.r_[True, gid[1:] != gid[:-1]] if n else np.zeros(0, bool)
+    group_start = np.maximum.accumulate(np.where(first, np.arange(n), 0))
+    pos = np.arange(n) - group_start  # row's position within its group
+
+    ts = t["timestamp"].to_numpy(dtype="int64")
+    units = np.rint(t["size"].to_numpy(dtype="float64") * UNITS).astype("int64")
+    buy = t["side"].astype(str).str.upper().eq("BUY").to_numpy()
+    price = t["price"].to_numpy(dtype="float64")
+    logp = np.log(np.where(price > 0, price, np.nan))
+    ret = np.where(first, 0.0, logp - np.r_[np.nan, logp[:-1]])
+    ret = np.nan_to_num(ret, nan=0.0)
+
+    cs_buy = np.cumsum(np.where(buy, units, 0))
+    cs_sell = np.cumsum(np.where(buy, 0, units))
+    cs_r2 = np.cumsum(ret * ret)
+
+    out = t.copy()
+    for w in windows:
+        start = _window_starts(gid, ts, pos, w)
+        count = (np.arange(n) - start + 1)
+        b = _diff(cs_buy, start)
+        s = _diff(cs_sell, start)
+        # Returns ending inside the window: the one into the first in-window trade comes from outside
+        r2 = np.maximum(cs_r2 - cs_r2[start], 0.0)
+        span = interval_seconds(w) if not w.isdigit() else np.maximum(ts - ts[start], 1)
+        others = count - 1
+        mean_other = np.divide(b + s - units, others, out=np.full(n, np.nan), where=others > 0)
+        out[f"trades_{w}"] = count.astype("int32")
+        out[f"buy_{w}"] = (b / UNITS).astype("float32")
+        out[f"sell_{w}"] = (s / UNITS).astype("float32")
+        out[f"ofi_{w}"] = np.divide(b - s, b + s, out=np.zeros(n), where=(b + s) > 0).astype("float32")
+        out[f"rv_{w}"] = np.sqrt(r2).astype("float32")
+        out[f"intensity_{w}"] = (count / span).astype("float32")
+        out[f"large_{w}"] = units >= large_mult * mean_other
+    for c in ("outcome", "market", "side"):
+        if c in out.columns:
+            out[c] = out[c].astype("category")
+    return out
+
+def sample_every(metrics_df: pd.DataFrame, every: str) -> pd.DataFrame:
+    """Last row per key and `every` bucket: the metrics as of each bucket's last trade."""
+    step = interval_seconds(every)
+    keys = _keys(metrics_df)
+    bucket = (metrics_df["timestamp"].astype("int64") // step * step).rename("bar_start")
+    out = metrics_df.groupby(keys + [bucket], sort=False, observed=True).tail(1)
+    out.insert(0, "bar_start", bucket.loc[out.index])
+    return out.reset_index(drop=True)
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--in", dest="in_path", required=True, help="cleaned trades CSV or Parquet")
+    p.add_argument("--out", dest="out_path", required=True, help="output Parquet or CSV (by extension)")
+    p.add_argument("--windows", nargs="+", default=["1min", "15min", "100"],
+                   help='time windows ("5min", "1h") and/or trade-count windows ("100")')
+    p.add_argument("--large-mult", type=float, default=5.0,
+                   help="large trade: size ≥ this × the mean size of the window's other trades")
+    p.add_argument("--every", help="emit one row per key and interval (the last trade's metrics) instead of per trade")
+    metrics.add_args(p)
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    metrics.configure(args)
+    with metrics.stage("read") as st:
+        trades = read_table(args.in_path)
+        trades = trades[[c for c in TRADE_COLS + ["market"] if c in trades.columns]]
+        st.rows = len(trades)
+    with metrics.stage("rolling", rows=len(trades), hot=True):
+        out = rolling_metrics(trades, args.windows, args.large_mult)
+        if args.every:
+            out = sample_every(out, args.every)
+    with metrics.stage("write", rows=len(out)):
+        write_table(out, args.out_path)
+    print(f"✓ Wrote {args.out_path}: {len(out)} rows × {len(args.windows)} window(s) from {len(trades)} trades")
+
+if __name__ == "__main__":
+    main()
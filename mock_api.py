@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# Local stand-in for the Goldsky orderbook subgraph and Kalshi's /markets/trades endpoint, for
+# benchmarks and offline runs of the fetchers. It serves a fills / trades table with the same
+# paging semantics the real APIs have (orderFilledEvents filters incl. id_gt, ordering by timestamp
+# or id, `first`, aliased fields; Kalshi ticker/min_ts/max_ts/limit/cursor). Faults can inject
+# throttling (429 with Retry-After), 5xx errors, dropped connections and slow responses.
+# A table with an `arrival` column (unix seconds) is served as a live feed: each row stays
+# hidden until the wall clock passes its arrival, as if the indexer had just picked it up.
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+import pandas as pd
+
+from tabular_io import read_table
+
+GQL_PATH = "/subgraphs/orderbook-subgraph/gn"
+KALSHI_PATH = "/trade-api/v2/markets/trades"
+
+# [alias:] orderFilledEvents(args) { fields }
+_GQL_FIELD = re.compile(r"(?:(\w+)\s*:\s*)?orderFilledEvents\s*\((.*?)\)\s*\{([^{}]*)\}", re.S)
+_GQL_ARG = re.compile(r"(\w+)\s*:\s*(\$\w+|\"[^\"]*\"|[\w.-]+)")
+
+class MockGoldsky:
+    """orderFilledEvents over a fills table, indexed by (side asset, timestamp)."""
+
+    def __init__(self, fills: pd.DataFrame):
+        self.arrival = fills["arrival"].to_numpy(dtype="float64") if "arrival" in fills.columns else None
+        fills = fills.drop(columns="arrival", errors="ignore").astype(str)
+        self.ts = fills["timestamp"].astype("int64").to_numpy()
+        self.cols = {c: fills[c].to_numpy(dtype=object) for c in fills.columns}
+        self._sides = {}
+        for side in ("maker", "taker"):
+            asset = fills[f"{side}AssetId"].to_numpy(dtype=object)
+            # newest first, ties in id order; then grouped by asset
+            order = np.lexsort((fills["id"].to_numpy(dtype=object), -self.ts))
+            order = order[np.argsort(asset[order], kind="stable")]
+            keys, starts = np.unique(asset[order], return_index=True)
+            ends = np.append(starts[1:], len(order))
+            self._sides[side] = (order, {k: (s, e) for k, s, e in zip(keys, starts, ends)})
+        self._merged: Dict[Tuple[str, Tuple[str, ...]], np.ndarray] = {}
+
+    def _rows_for(self, side: str, ids) -> np.ndarray:
+        # Row indices with side asset in ids, newest first (cached per id set)
+        key = (side, tuple(sorted(ids)))
+        if key not in self._merged:
+            order, spans = self._sides[side]
+            parts = [order[slice(*spans[i])] for i in key[1] if i in spans]
+            rows = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+            if len(parts) > 1:
+                rows = rows[np.lexsort((self.cols["id"][rows], -self.ts[rows]))]
+            self._merged[key] = rows
+        return self._merged[key]
+
+    def select(self, args: Dict, fields) -> list:
+        where = args.get("where", {})
+        side = "maker" if "makerAssetId_in" in where else "taker"
+        ids = where.get(f"{side}AssetId_in") or []
+        rows = self._rows_for(side, [str(i) for i in ids])
+        neg = -self.ts[rows]  # ascending
+        lo, hi = 0, len(rows)
+        if where.get("timestamp_lte") is not None:
+            lo = max(lo, np.searchsorted(neg, -int(where["timestamp_lte"]), "left"))
+        if where.get("timestamp_lt") is not None:
+            lo = max(lo, np.searchsorted(neg, -int(where["timestamp_lt"]), "right"))
+        if where.get("timestamp_gte") is not None:
+            hi = min(hi, np.searchsorted(neg, -int(where["timestamp_gte"]), "right"))
+        if where.get("timestamp_gt") is not None:
+            hi = min(hi, np.searchsorted(neg, -int(where["timestamp_gt"]), "left"))
+        if where.get("timestamp") is not None:
+            lo = max(lo, np.searchsorted(neg, -int(where["timestamp"]), "left"))
+            hi = min(hi, np.searchsorted(neg, -int(where["timestamp"]), "right"))
+        sel = rows[lo:hi] if hi > lo else rows[:0]
+        if self.arrival is not None:
+            sel = sel[self.arrival[sel] <= time.time()]
+        if where.get("id_gt") is not None:
+            sel = sel[self.cols["id"][sel] > where["id_gt"]]
+        asc = args.get("orderDirection", "desc") == "asc"
+        if args.get("orderBy") == "id":
+            sel = sel[np.argsort(self.cols["id"][sel], kind="stable")]
+            sel = sel if asc else sel[::-1]
+        elif asc:
+            sel = sel[np.lexsort((self.cols["id"][sel], self.ts[sel]))]
+        sel = sel[:int(args.get("first", 100))]
+        cols = [(f, self.cols[f]) for f in fields if f in self.cols]
+        return [{f: col[i] for f, col in cols} for i in sel.tolist()]
+
+    def execute(self, query: str, variables: Dict) -> Dict:
+        def value(tok):
+            if tok.startswith("$"):
+                return variables.get(tok[1:])
+            if tok.startswith('"'):
+                return tok[1:-1]
+            return tok
+
+        data = {}
+        for alias, arg_text, field_text in _GQL_FIELD.findall(query):
+            where_text = re.search(r"where\s*:\s*\{(.*?)\}", arg_text, re.S)
+            args = {k: value(v) for k, v in _GQL_ARG.findall(re.sub(r"where\s*:\s*\{.*?\}", "", arg_text, flags=re.S))}
+            args["where"] = {k: value(v) for k, v in _GQL_ARG.findall(where_text.group(1))} if where_text else {}
+            data[alias or "orderFilledEvents"] = self.select(args, field_text.split())
+        return {"data": data}
+
+class MockKalshi:
+    """/markets/trades over a trades table: newest first, offset cursors."""
+
+    def __init__(self, trades: pd.DataFrame):
+        trades = trades.copy()
+        ts = pd.to_datetime(trades["created_time"], utc=True, format="ISO8601")
+        trades["_ts"] = (ts - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)
+        if "arrival" not in trades.columns:
+            trades["arrival"] = -np.inf
+        trades = trades.sort_values("_ts", ascending=False, kind="stable")
+        self._by_ticker = {}
+        for ticker, part in trades.groupby("ticker", sort=False):
+            neg = -part["_ts"].to_numpy()
+            arrival = part["arrival"].to_numpy(dtype="float64")
+            self._by_ticker[str(ticker)] = (neg, arrival, part.drop(columns=["_ts", "arrival"]).to_dict("records"))
+
+    def execute(self, params: Dict) -> Dict:
+        neg, arrival, records = self._by_ticker.get(params.get("ticker", ""), (np.empty(0), np.empty(0), []))
+        lo = np.searchsorted(neg, -int(params["max_ts"]), "left") if params.get("max_ts") else 0
+        hi = np.searchsorted(neg, -int(params["min_ts"]), "right") if params.get("min_ts") else len(neg)
+        visible = lo + np.flatnonzero(arrival[lo:hi] <= time.time())
+        off = int(params.get("cursor") or 0)
+        limit = int(params.get("limit", 100))
+        end = min(off + limit, len(visible))
+        return {"trades": [records[i] for i in visible[off:end].tolist()],
+                "cursor": str(end) if end < len(visible) else ""}
+
+class Faults:
+    """What the mock does wrong, decided per request.
+
+    throttle_rps   token-bucket limit (burst of `burst`); over it → 429 with Retry-After
+    retry_after    Retry-After seconds sent with 429/503 (None → header omitted)
+    error_rate     share of requests answered 500/502/503/504
+    drop_rate      share of connections closed without a response
+    slow_rate      share of requests delayed by a further slow_sec
+    """
+
+    def __init__(self, throttle_rps: Optional[float] = None, burst: int = 5,
+                 retry_after: Optional[float] = 1, error_rate: float = 0.0, drop_rate: float = 0.0,
+                 slow_rate: float = 0.0, slow_sec: float = 1.0, seed: int = 0):
+        self.throttle_rps = throttle_rps
+        self.burst = burst
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.slow_rate = slow_rate
+        self.slow_sec = slow_sec
+        # early: requests that arrived while an announced Retry-After was still running
+        self.counts = {"throttled": 0, "errors": 0, "dropped": 0, "slow": 0, "early": 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._quiet_until = 0.0
+
+    def pick(self):
+        """None, "drop", ("slow", sec) or (status, headers) for the next request."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._quiet_until:
+                self.counts["early"] += 1
+            if self.throttle_rps:
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.throttle_rps)
+                self._last = now
+                if self._tokens < 1:
+                    self.counts["throttled"] += 1
+                    return 429, self._retry_headers(now)
+                self._tokens -= 1
+            r = self._rng.random()
+            if r < self.drop_rate:
+                self.counts["dropped"] += 1
+                return "drop"
+            r -= self.drop_rate
+            if r < self.error_rate:
+                self.counts["errors"] += 1
+                status = self._rng.choice([500, 502, 503, 504])
+                return status, self._retry_headers(now) if status == 503 else {}
+            r -= self.error_rate
+            if r < self.slow_rate:
+                self.counts["slow"] += 1
+                return "slow", self.slow_sec
+        return None
+
+    def _retry_headers(self, now: float):
+        if self.retry_after is None:
+            return {}
+        self._quiet_until = max(self._quiet_until, now + self.retry_after)
+        return {"Retry-After": str(self.retry_after)}
+
+class MockAPI:
+    """Both mocks on one local HTTP server (ephemeral port); use as a context manager.
+
+    latency adds a fixed delay to every response, to stand in for the network round trip;
+    faults (a Faults) makes some responses fail.
+    """
+
+    def __init__(self, fills: Optional[pd.DataFrame] = None, kalshi: Optional[pd.DataFrame] = None,
+                 port: int = 0, latency: float = 0.0, faults: Optional[Faults] = None):
+        self.goldsky = MockGoldsky(fills) if fills is not None else None
+        self.kalshi = MockKalshi(kalshi) if kalshi is not None else None
+        self.latency = latency
+        self.faults = faults
+        self.requests = 0
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real endpoints
+            disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+            def log_message(self, *a):
+                pass
+
+            def _send(self, status: int, body: Dict, headers: Optional[Dict] = None):
+                b = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(b)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(b)
+
+            def _fault(self) -> bool:
+                # True when the request was answered (or dropped) by an injected fault
+                api.requests += 1
+                if api.latency:
+                    time.sleep(api.latency)
+                fault = api.faults.pick() if api.faults else None
+                if fault is None:
+                    return False
+                if fault == "drop":
+                    self.close_connection = True
+                    return True
+                if fault[0] == "slow":
+                    time.sleep(fault[1])
+                    return False
+                status, headers = fault
+                self._send(status, {"errors": [{"message": f"injected {status}"}]}, headers)
+                return True
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                if self._fault():
+                    return
+                if api.goldsky is None or urlparse(self.path).path != GQL_PATH:
+                    return self._send(404, {"errors": [{"message": "not found"}]})
+                self._send(200, api.goldsky.execute(body["query"], body.get("variables") or {}))
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if self._fault():
+                    return
+                if api.kalshi is None or url.path != KALSHI_PATH:
+                    return self._send(404, {"error": "not found"})
+                self._send(200, api.kalshi.execute({k: v[0] for k, v in parse_qs(url.query).items()}))
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    @property
+    def gql_url(self) -> str:
+        return self.base_url + GQL_PATH
+
+    @property
+    def kalshi_url(self) -> str:
+        return self.base_url + KALSHI_PATH
+
+    def start(self) -> "MockAPI":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+def main():
+    p = argparse.ArgumentParser(description="Serve fills / Kalshi trades through a local mock API")
+    p.add_argument("--fills", help="fills table (Goldsky schema) for the GraphQL endpoint")
+    p.add_argument("--kalshi", help="Kalshi trades table for /markets/trades")
+    p.add_argument("--port", type=int, default=8000)
+    p.add_argument("--latency-ms", type=float, default=0.0, help="added delay per request")
+    p.add_argument("--throttle-rps", type=float, help="answer 429 above this request rate")
+    p.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered 5xx")
+    p.add_argument("--drop-rate", type=float, default=0.0, help="share of connections dropped")
+    args = p.parse_args()
+    fills = read_table(args.fills, dtype=str) if args.fills else None
+    kalshi = read_table(args.kalshi) if args.kalshi else None
+    faults = None
+    if args.throttle_rps or args.error_rate or args.drop_rate:
+        faults = Faults(args.throttle_rps, error_rate=args.error_rate, drop_rate=args.drop_rate)
+    api = MockAPI(fills, kalshi, port=args.port, latency=args.latency_ms / 1000, faults=faults)
+    print(f"GraphQL: {api.gql_url}\nKalshi:  {api.kalshi_url}")
+    try:
+        api.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
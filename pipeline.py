@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# One CLI for the whole workflow: fetch → clean → compare / bars per market (plus optional Kalshi
+# fetches), run as a DAG of stages. Each stage runs the existing script in a subprocess and its
+# outputs are cached under <work-dir>/cache/<stage>/<key>. The key hashes the stage's parameters,
+# the content of its input files and the source of the script (and the local modules it imports),
+# so a stage whose inputs haven't changed is skipped. A fetch without --until sees new data every
+# run, so it always runs. Its output is content-hashed, though, and an unchanged fetch still lets
+# clean and the rest hit the cache. Independent stages (markets, compare vs bars) run in parallel.
+# Only the standard library is imported here; pandas & co. load in the stage subprocesses.
+#
+#   python pipeline.py --conditions 0x6220… 0x81a2… --ref 0x6220…=poly_nyc_dem_nom_zm_trades.csv
+#   python pipeline.py --conditions 0x6220… --until 1751500000 --stages fetch clean bars --out-dir out/
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, List, Optional
+
+HERE = Path(__file__).resolve().parent
+STAGES = ["fetch", "clean", "compare", "bars"]
+UPSTREAM = {"compare": "clean", "bars": "clean"}  # selecting a stage brings in the one it reads
+
+class Stage:
+    """One node of the DAG: `script` run with argv from `argv(inputs, out_dir)`.
+
+    inputs maps names to (stage name, output file) of upstream stages; files to plain files. A
+    stage with `given` runs nothing: that existing file is its (single) output.
+    """
+
+    def __init__(self, name: str, script: Optional[str], argv, outputs: List[str], params: dict,
+                 inputs: Optional[Dict[str, tuple]] = None, files: Optional[Dict[str, str]] = None,
+                 volatile: bool = False, stdout: Optional[str] = None, given: Optional[str] = None):
+        self.name = name
+        self.script = script
+        self.argv = argv
+        self.outputs = outputs
+        self.params = params
+        self.inputs = inputs or {}
+        self.files = files or {}
+        self.volatile = volatile
+        self.stdout = stdout  # output file that receives the script's stdout
+        self.given = given
+        self.deps = sorted({src for src, _ in self.inputs.values()})
+
+# ---------- Hashing ----------
+_hash_lock = threading.Lock()
+
+def file_digest(path, memo: dict) -> str:
+    """sha256 of a file, memoized on (path, size, mtime) so unchanged big inputs aren't re-read."""
+    st = os.stat(path)
+    stamp = f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}"
+    with _hash_lock:
+        if stamp in memo:
+            return memo[stamp]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    with _hash_lock:
+        memo[stamp] = h.hexdigest()
+    return memo[stamp]
+
+def code_digest(script: str) -> str:
+    """sha256 over the script and, transitively, the repo modules it imports."""
+    seen, todo, h = set(), [script], hashlib.sha256()
+    while todo:
+        name = todo.pop()
+        path = HERE / name
+        if name in seen or not path.exists():
+            continue
+        seen.add(name)
+        src = path.read_bytes()
+        h.update(name.encode() + b"\0" + src)
+        for mod in re.findall(rb"^\s*(?:from|import)\s+([A-Za-z_]\w*)", src, re.M):
+            todo.append(mod.decode() + ".py")
+    return h.hexdigest()
+
+def stage_key(stage: Stage, input_digests: Dict[str, str]) -> str:
+    blob = json.dumps({"stage": stage.name.split(":")[0], "params": stage.params, "inputs": input_digests,
+                       "code": code_digest(stage.script)}, sort_keys=True)
+    return hashlib.sha256(blob.encode()).hexdigest()[:24]
+
+# ---------- Running ----------
+class Runner:
+    def __init__(self, work_dir, force: bool = False, verbose: bool = False):
+        self.work = Path(work_dir).resolve()  # stages run from the repo directory
+        self.cache = self.work / "cache"
+        self.force = force
+        self.verbose = verbose
+        self.memo_path = self.work / "digests.json"
+        self.memo = json.loads(self.memo_path.read_text()) if self.memo_path.exists() else {}
+        self.results: Dict[str, dict] = {}
+
+    def _run(self, stage: Stage, paths: Dict[str, str], out_dir: Path) -> None:
+        cmd = [sys.executable, str(HERE / stage.script)] + stage.argv(paths, str(out_dir))
+        if self.verbose:
+            print("  $ " + " ".join(cmd))
+        proc = subprocess.run(cmd, cwd=HERE, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"{stage.name} failed ({proc.returncode}):\n{proc.stderr[-2000:] or proc.stdout[-2000:]}")
+        if stage.stdout:
+            (out_dir / stage.stdout).write_text(proc.stdout)
+
+    def run_stage(self, stage: Stage) -> dict:
+        t0 = time.perf_counter()
+        paths, digests = {}, {}
+        for k, (src, out) in stage.inputs.items():
+            up = self.results[src]
+            paths[k] = up["outputs"][out]
+            digests[k] = up["digests"][out]
+        for k, f in stage.files.items():
+            paths[k], digests[k] = f, file_digest(f, self.memo)
+
+        key = stage_key(stage, digests)
+        entry = self.cache / stage.name.split(":")[0] / key
+        status = "cached"
+        if stage.volatile or self.force or not (entry / "manifest.json").exists():
+            tmp = Path(tempfile.mkdtemp(prefix=f".{key}-", dir=self.cache))
+            try:
+                self._run(stage, paths, tmp)
+                out_digests = {o: file_digest(tmp / o, self.memo) for o in stage.outputs}
+                if stage.volatile:
+                    # A fetch is keyed by what it fetched, so identical data maps to one entry
+                    key = hashlib.sha256((key + json.dumps(out_digests, sort_keys=True)).encode()).hexdigest()[:24]
+                    entry = self.cache / stage.name.split(":")[0] / key
+                (tmp / "manifest.json").write_text(json.dumps(
+                    {"stage": stage.name, "key": key, "params": stage.params, "inputs": digests,
+                     "outputs": out_digests, "created": int(time.time())}, indent=1))
+                if entry.exists() and stage.volatile:
+                    pass  # the same data was fetched before; keep that entry
+                else:
+                    if entry.exists():
+                        shutil.rmtree(entry)
+                    entry.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(tmp, entry)
+                status = "ran"
+            finally:
+                shutil.rmtree(tmp, ignore_errors=True)
+        manifest = json.loads((entry / "manifest.json").read_text())
+        # Outputs were hashed at write time; re-stamp the memo so downstream lookups don't re-read them
+        for o, d in manifest["outputs"].items():
+            st = os.stat(entry / o)
+            with _hash_lock:
+                self.memo[f"{os.path.abspath(entry / o)}:{st.st_size}:{st.st_mtime_ns}"] = d
+        return {"status": status, "dir": entry, "seconds": time.perf_counter() - t0,
+                "outputs": {o: str(entry / o) for o in stage.outputs}, "digests": manifest["outputs"]}
+
+    def run(self, stages: List[Stage], workers: int) -> Dict[str, dict]:
+        """Run the DAG; each stage starts once its upstream stages are done."""
+        self.cache.mkdir(parents=True, exist_ok=True)
+        pending = {s.name: s for s in stages}
+        running = {}
+        failed = None
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            while pending or running:
+                for name, s in list(pending.items()):
+                    if failed is None and all(d in self.results for d in s.deps):
+                        running[ex.submit(self.run_stage, s)] = name
+                        del pending[name]
+                if not running:
+                    break  # a failure left stages waiting on it
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    name = running.pop(fut)
+                    try:
+                        self.results[name] = r = fut.result()
+                    except Exception as e:  # let the running stages finish, start nothing new
+                        failed = failed or e
+                        print(f"✗ {name}: {e}")
+                        continue
+                    print(f"{'✓' if r['status'] == 'ran' else '·'} {name:<32} {r['status']:<6} "
+                          f"{r['seconds']:6.1f}s  {r['dir']}")
+        tmp = self.memo_path.with_name(self.memo_path.name + ".tmp")
+        tmp.write_text(json.dumps(self.memo))
+        os.replace(tmp, self.memo_path)
+        if failed is not None:
+            raise SystemExit(f"Pipeline stopped: {len(pending)} stage(s) not run")
+        if pending:
+            raise SystemExit(f"Stages waiting on stages that never ran: {sorted(pending)}")
+        return self.results
+
+# ---------- The workflow ----------
+def _pairs(values: List[str], markets: List[str], what: str) -> Dict[str, str]:
+    # "cond=path" pairs, or a single bare path for a single market; paths made absolute
+    out = {}
+    for v in values or []:
+        if "=" in v:
+            k, p = v.split("=", 1)
+            out[k.lower()] = os.path.abspath(p)
+        elif len(markets) == 1:
+            out[markets[0]] = os.path.abspath(v)
+        else:
+            raise SystemExit(f"--{what} {v}: use market=path with several markets")
+    return out
+
+def plan(args) -> List[Stage]:
+    stages = []
+    wanted = set(args.stages) | {UPSTREAM[s] for s in args.stages if s in UPSTREAM}
+    markets = [c.lower() for c in args.conditions]
+    refs = _pairs(args.ref, markets, "ref")
+    fills = {m: _pairs(args.fills, markets, "fills").get(m) for m in markets}
+    window = {"since": args.since, "until": args.until}
+    for m in markets:
+        tag = m[:10]
+        if fills[m]:
+            stages.append(Stage(f"fetch:{tag}", None, None, ["fills.parquet"], {}, given=fills[m]))
+        else:
+            stages.append(Stage(
+                f"fetch:{tag}", "query_polymarket.py",
+                lambda paths, out, m=m: ["--conditions", m, "--out", f"{out}/fills.parquet", "--workers",
+                                         str(args.fetch_workers)]
+                + (["--since", str(args.since)] if args.since is not None else [])
+                + (["--until", str(args.until)] if args.until is not None else []),
+                ["fills.parquet"], {"condition": m, **window}, volatile=args.until is None))
+        if "clean" in wanted:
+            stages.append(Stage(
+                f"clean:{tag}", "clean_polymarket.py",
+                lambda paths, out, m=m: ["--in", paths["fills"], "--condition", m, "--perspective", "both",
+                                         "--out", f"{out}/trades.parquet", "--maker-out", f"{out}/trades_maker.parquet",
+                                         "--registry", os.path.abspath(args.registry)],
+                ["trades.parquet", "trades_maker.parquet"], {"condition": m},
+                inputs={"fills": (f"fetch:{tag}", "fills.parquet")}))
+        if "compare" in wanted and m in refs:
+            stages.append(Stage(
+                f"compare:{tag}", "compare_transactions.py",
+                lambda paths, out: ["--ref", paths["ref"], "--cleaned", paths["cleaned"]],
+                ["report.txt"], {}, inputs={"cleaned": (f"clean:{tag}", "trades_maker.parquet")},
+                files={"ref": refs[m]}, stdout="report.txt"))
+        if "bars" in wanted:
+            stages.append(Stage(
+                f"bars:{tag}", "build_bars.py",
+                lambda paths, out: ["--in", paths["trades"], "--out-dir", out, "--format", "parquet",
+                                    "--intervals"] + args.intervals,
+                [f"bars_{iv}.parquet" for iv in args.intervals], {"intervals": args.intervals},
+                inputs={"trades": (f"clean:{tag}", "trades.parquet")}))
+    for t in args.kalshi_tickers or []:
+        stages.append(Stage(
+            f"kalshi:{t}", "query_kalshi.py",
+            lambda paths, out, t=t: ["--tickers", t, "--out", f"{out}/trades.jsonl"]
+            + (["--min-ts", str(args.since)] if args.since is not None else [])
+            + (["--max-ts", str(args.until)] if args.until is not None else []),
+            ["trades.jsonl"], {"ticker": t, **window}, volatile=args.until is None))
+    if "fetch" not in args.stages:
+        # Downstream-only run: every fetch must have been given as a file
+        missing = [s.name for s in stages if s.name.startswith("fetch:") and s.given is None]
+        if missing:
+            raise SystemExit(f"--stages without fetch needs --fills for {missing}")
+    names = {s.name for s in stages}
+    for s in stages:
+        if any(d not in names for d in s.deps):
+            raise SystemExit(f"{s.name} needs {[d for d in s.deps if d not in names]}, which are not planned")
+    return stages
+
+def _resolve_given(stages: List[Stage], runner: Runner) -> List[Stage]:
+    # Given files become finished stages; the rest is what runs
+    out = []
+    for s in stages:
+        if s.given is not None:
+            runner.results[s.name] = {"status": "given", "dir": Path(s.given).parent, "seconds": 0.0,
+                                      "outputs": {s.outputs[0]: s.given},
+                                      "digests": {s.outputs[0]: file_digest(s.given, runner.memo)}}
+        else:
+            out.append(s)
+    return out
+
+def publish(results: Dict[str, dict], out_dir) -> None:
+    """Symlink each stage's cache entry to <out-dir>/<market>/<stage> for stable paths."""
+    for name, r in results.items():
+        if r["status"] == "given":
+            continue
+        stage, key = name.split(":", 1)
+        link = Path(out_dir) / key / stage
+        link.parent.mkdir(parents=True, exist_ok=True)
+        if link.is_symlink() or link.exists():
+            link.unlink()
+        link.symlink_to(Path(r["dir"]).resolve(), target_is_directory=True)
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Run fetch → clean → compare / bars with cached stages")
+    p.add_argument("--conditions", nargs="+", default=[], help="Polymarket condition ids (0x…)")
+    p.add_argument("--kalshi-tickers", nargs="+", help="Kalshi tickers to fetch alongside")
+    p.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES, help="stages to run (default: all); compare and bars also run clean")
+    p.add_argument("--fills", nargs="+", help="existing fills file(s) instead of fetching: path, or market=path")
+    p.add_argument("--ref", nargs="+", help="reference trades for compare: path, or market=path")
+    p.add_argument("--since", type=int, help="earliest unix timestamp to fetch")
+    p.add_argument("--until", type=int, help="fetch before this unix timestamp; pins the fetch so it is cached")
+    p.add_argument("--intervals", nargs="+", default=["1min", "1h", "1d"], help="bar intervals")
+    p.add_argument("--registry", default="token_registry.json", help="token registry cache JSON")
+    p.add_argument("--work-dir", default=".pipeline", help="cache directory")
+    p.add_argument("--out-dir", default="pipeline_out", help="<market>/<stage> links to the cached outputs")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="stages run at once")
+    p.add_argument("--fetch-workers", type=int, default=1, help="--workers passed to each fetch")
+    p.add_argument("--force", action="store_true", help="re-run every stage, ignoring the cache")
+    p.add_argument("-v", "--verbose", action="store_true", help="print each stage's command")
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    if not args.conditions and not args.kalshi_tickers:
+        raise SystemExit("nothing to do: pass --conditions and/or --kalshi-tickers")
+    runner = Runner(args.work_dir, force=args.force, verbose=args.verbose)
+    stages = _resolve_given(plan(args), runner)
+    t0 = time.perf_counter()
+    results = runner.run(stages, args.workers)
+    publish(results, args.out_dir)
+    ran = sum(r["status"] == "ran" for r in results.values())
+    print(f"Done in {time.perf_counter() - t0:.1f}s: {ran} stage(s) ran, "
+          f"{sum(r['status'] == 'cached' for r in results.values())} cached → {args.out_dir}/")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,18 @@
-import requests
-import json
+#!/usr/bin/env python3
+# Kalshi trades → JSONL/Parquet, streamed page by page.
+# Many tickers, each split into time windows that are fetched concurrently; memory stays flat
+# because every page is written as soon as it arrives.
+
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import metrics
+from checkpoint import Checkpoint
+from http_client import HttpClient
+from tabular_io import TableWriter, is_parquet
+from trade_store import StoreWriter, TradeStore
 
 # ----- CONFIG -----
 URL = "https://api.elections.kalshi.com/trade-api/v2/markets/trades"
@@ -9,37 +22,171 @@ PARAMS = {
     "max_ts": 1751515200,
     "limit": 1000  # Kalshi defaults to pagination, so we grab chunks
 }
-OUTPUT_FILE = "/Users/wendyliu/Desktop/kalshi_zm_trades.json"
+OUTPUT_FILE = "./kalshi_zm_trades.jsonl"  # one trade per line (.parquet also works)
+TIMEOUT = 60
+PACE_SEC = 0.05  # starting request spacing; the HTTP client adapts it to 429s and latency
 # ------------------
 
-all_trades = []
-cursor = None
+def trade_ts(trade) -> int:
+    # created_time is ISO-8601, e.g. "2025-06-24T03:00:00.123456Z"
+    return int(datetime.fromisoformat(trade["created_time"].replace("Z", "+00:00")).timestamp())
 
-while True:
-    # Update cursor if we have one
-    if cursor:
-        PARAMS["cursor"] = cursor
-    else:
-        PARAMS.pop("cursor", None)
+def make_session(pool_size: int = 10) -> HttpClient:
+    return HttpClient(pool_size, interval=PACE_SEC, timeout=TIMEOUT)
+
+def split_windows(min_ts: int, max_ts: int, n: int):
+    # Equal-width, contiguous [lo, hi) windows covering [min_ts, max_ts]
+    until = max_ts + 1
+    n = max(1, min(n, until - min_ts))
+    edges = [min_ts + (until - min_ts) * i // n for i in range(n + 1)]
+    return [(lo, hi) for lo, hi in zip(edges, edges[1:]) if hi > lo]
+
+def fetch_window(ticker, lo, hi, on_page, cursor=None, session=None, limit=PARAMS["limit"]):
+    """Page through one ticker's trades with lo <= created_time < hi, calling on_page(trades, next_cursor).
+
+    The request window is widened by a second on each side and trimmed client-side, so adjacent
+    windows neither miss nor repeat boundary trades whether Kalshi's bounds are inclusive or not.
+    """
+    params = {"ticker": ticker, "min_ts": lo - 1, "max_ts": hi, "limit": limit}
+    session = session or make_session(1)
+    total = 0
+    while True:
+        # Update cursor if we have one
+        if cursor:
+            params["cursor"] = cursor
+        else:
+            params.pop("cursor", None)
+
+        # Call API (paced, retried on 429/5xx)
+        resp = session.get(URL, params=params)
+        data = resp.json()
 
-    # Call API
-    resp = requests.get(URL, params=PARAMS)
-    resp.raise_for_status()
-    data = resp.json()
+        trades = [t for t in data.get("trades", []) if lo <= trade_ts(t) < hi]
+        metrics.count("pages")
+        metrics.count("trades_fetched", len(trades))
+        # Check for pagination
+        cursor = data.get("cursor") or None
+        on_page(trades, cursor)
+        total += len(trades)
+        if not cursor:
+            break  # No more pages
+    return total
 
-    # Collect trades
-    trades = data.get("trades", [])
-    all_trades.extend(trades)
+def _finish_ticker(state: dict) -> None:
+    run = state.pop("run")
+    if run["newest"] is None:
+        return
+    if state.get("newest") == run["newest"]:
+        state["newest_ids"] = sorted(set(state["newest_ids"]) | set(run["newest_ids"]))
+    elif state.get("newest") is None or run["newest"] > state["newest"]:
+        state["newest"], state["newest_ids"] = run["newest"], run["newest_ids"]
 
-    print(f"Fetched {len(trades)} trades, total so far: {len(all_trades)}")
+def fetch_trades(tickers, min_ts, max_ts, writer, windows=1, workers=1, ckpt=None, out_path=None,
+                 session=None):
+    """Fetch every ticker's trades in [min_ts, max_ts] into writer; returns trades written.
 
-    # Check for pagination
-    cursor = data.get("cursor")
-    if not cursor:
-        break  # No more pages
+    Each ticker is split into `windows` time windows and all (ticker, window) jobs run on a pool
+    of `workers` threads. With a checkpoint, each job's page cursor is saved after every page;
+    an interrupted run continues from those cursors, and a finished ticker is refreshed from its
+    newest saved trade onwards.
+    """
+    session = session or make_session(workers)
+    lock = threading.Lock()
 
-# Save all trades to JSON file
-with open(OUTPUT_FILE, "w") as f:
-    json.dump(all_trades, f, indent=2)
+    def save():
+        if ckpt is not None:
+            writer.flush()
+            ckpt.save(out_path)
+
+    def job(state, key, js):
+        run = state["run"]
+        lo, hi = (int(x) for x in key.split("-"))
+        # trades at the newest saved second are fetched again by a refresh; skip them
+        seen = set(state.get("newest_ids", []))
+        written = 0
+
+        def on_page(trades, next_cursor):
+            nonlocal written
+            with lock:
+                for t in trades:
+                    if t.get("trade_id") in seen:
+                        continue
+                    writer.writerow(t)
+                    written += 1
+                    ts = trade_ts(t)
+                    if run["newest"] is None or ts > run["newest"]:
+                        run["newest"], run["newest_ids"] = ts, []
+                    if ts == run["newest"]:
+                        run["newest_ids"].append(t.get("trade_id"))
+                js["cursor"] = next_cursor
+                js["count"] += len(trades)
+                print(f"{state['ticker']} [{lo}, {hi}): fetched {len(trades)} trades, total so far: {js['count']}")
+                if next_cursor is None:
+                    # Last page: mark the window done in the same save that covers its rows, or a
+                    # crash in between would resume it from the first page and write it twice
+                    js["done"] = True
+                    if all(j["done"] for j in run["jobs"].values()):
+                        _finish_ticker(state)
+                save()
+
+        fetch_window(state["ticker"], lo, hi, on_page, cursor=js["cursor"], session=session)
+        return written
+
+    total = 0
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futs = []
+        for ticker in tickers:
+            state = ckpt.section("tickers", ticker) if ckpt else {}
+            state["ticker"] = ticker
+            if "run" not in state:
+                lo = min_ts
+                if state.get("newest") is not None:
+                    lo = max(lo, state["newest"])
+                state["run"] = {"newest": None, "newest_ids": [],
+                                "jobs": {f"{a}-{b}": {"cursor": None, "done": False, "count": 0}
+                                         for a, b in split_windows(lo, max_ts, windows)}}
+            if not state["run"]["jobs"]:
+                _finish_ticker(state)
+                continue
+            for key, js in state["run"]["jobs"].items():
+                if not js["done"]:
+                    futs.append(ex.submit(job, state, key, js))
+        for fut in as_completed(futs):
+            total += fut.result()
+    return total
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--tickers", nargs="+", default=[PARAMS["ticker"]], help="Kalshi market tickers")
+    p.add_argument("--min-ts", type=int, default=PARAMS["min_ts"], help="earliest unix timestamp")
+    p.add_argument("--max-ts", type=int, default=PARAMS["max_ts"], help="latest unix timestamp")
+    p.add_argument("--out", dest="out_path", default=OUTPUT_FILE, help="output JSONL or Parquet (by extension)")
+    p.add_argument("--store", help="write trades into this trade store (see trade_store.py) instead of --out")
+    p.add_argument("--windows", type=int, default=1, help="time windows per ticker")
+    p.add_argument("--workers", type=int, default=1, help="concurrent requests")
+    p.add_argument("--checkpoint", help="checkpoint JSON; resumes an interrupted run, otherwise "
+                                        "appends only trades newer than the previous run (JSONL output)")
+    metrics.add_args(p)
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    metrics.configure(args)
+    if args.checkpoint and (args.store or is_parquet(args.out_path)):
+        raise SystemExit("--checkpoint needs a JSONL output (Parquet files and the store can't be cut back)")
+    ckpt = Checkpoint(args.checkpoint) if args.checkpoint else None
+    append = ckpt.restore_output(args.out_path) if ckpt else False
+    session = make_session(args.workers)
+    if args.store:
+        writer = StoreWriter(TradeStore(args.store), "kalshi", lambda r: r["ticker"])
+    else:
+        writer = TableWriter(args.out_path, append=append)
+    with metrics.stage("fetch") as st, writer as w:
+        st.rows = total = fetch_trades(args.tickers, args.min_ts, args.max_ts, w, windows=args.windows,
+                                       workers=args.workers, ckpt=ckpt, out_path=args.out_path,
+                                       session=session)
+    print(f"✅ Done! Saved {total} trades to {args.store or args.out_path} "
+          f"({session.stats['requests']} requests, {session.stats['retries']} retried)")
 
-print(f"✅ Done! Saved {len(all_trades)} trades to {OUTPUT_FILE}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,142 +1,413 @@
-# pip install requests tqdm
-import csv, time, requests
+# pip install requests tqdm  (pyarrow for Parquet output)
+import argparse, threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from typing import Tuple
+
+import metrics
+from checkpoint import Checkpoint
+from clean_polymarket import FILL_COLS
+from dedup_index import DedupIndex
+from http_client import HttpClient
+from tabular_io import TableWriter, is_parquet
+from trade_store import StoreWriter, TradeStore, token_router
+from token_registry import resolve_tokens
 
 CONDITION_ID = "0x6220c4164a293367cd40eba018dd6e67c78e4d48e74158845cc9361230bcb34d".lower()
-OUT_CSV      = "./polymarket_zm_trades.csv"
+OUT_CSV      = "./polymarket_zm_trades.csv"  # .parquet → columnar output
 
-# 1) CLOB markets (public) to resolve outcome token IDs (YES/NO) for the condition
-CLOB_MARKETS = "https://clob.polymarket.com/markets?next_cursor="
+# 1) Outcome token IDs (YES/NO) for the condition come from token_registry (cache → CLOB markets)
 
 # 2) Goldsky public Polymarket Orderbook subgraph (no key needed)
 ORDERBOOK_GQL = "https://api.goldsky.com/api/public/project_cl6mb8i9h0003e201j6li0diw/subgraphs/orderbook-subgraph/0.0.1/gn"
 
-# GraphQL page size and pacing
+# GraphQL page size and pacing (starting request spacing; the HTTP client adapts it)
 FIRST      = 1000
 SLEEP_SEC  = 0.07
 TIMEOUT    = 60
 
-def get_market_tokens(condition_id: str):
-    sess = requests.Session()
-    cursor = ""
-    while True:
-        r = sess.get(CLOB_MARKETS + cursor, timeout=TIMEOUT)
-        r.raise_for_status()
-        j = r.json()
-        for m in j.get("data", []):
-            if m.get("condition_id", "").lower() == condition_id:
-                toks = [t["token_id"] for t in m.get("tokens", [])]
-                if len(toks) != 2:
-                    raise RuntimeError(f"Expected 2 tokens, got {toks}")
-                return toks  # [YES_token_id, NO_token_id] (both decimal strings)
-        cursor = j.get("next_cursor", "")
-        if cursor == "LTE=" or cursor is None:
-            break
-    raise RuntimeError(f"Condition {condition_id} not found via CLOB markets")
-
-# Query all OrderFilled events where makerAssetId IN ids
-Q_MAKER = """
-query Page($ids:[BigInt!], $cursor:BigInt, $first:Int!) {
-  orderFilledEvents(
-    first: $first
-    orderBy: timestamp
-    orderDirection: desc
-    where: { makerAssetId_in: $ids, timestamp_lt: $cursor }
-  ) {
-    id
-    timestamp
-    transactionHash
-    maker
-    taker
-    makerAssetId
-    makerAmountFilled
-    takerAssetId
-    takerAmountFilled
-    fee
-  }
+def get_market_tokens(condition_id: str, session=None):
+    toks = resolve_tokens([condition_id], session=session).get(condition_id.lower())
+    if toks is None:
+        raise RuntimeError(f"Condition {condition_id} not found via CLOB markets")
+    return toks  # [YES_token_id, NO_token_id] (both decimal strings)
+
+# Fill fields the backfill can request; id and timestamp always come along (dedup, paging).
+# "clean" is just what clean_polymarket reads.
+FIELDS = [
+    "id","timestamp","transactionHash","maker","taker",
+    "makerAssetId","makerAmountFilled","takerAssetId","takerAmountFilled","fee"
+]
+FIELD_PRESETS = {"all": FIELDS, "clean": ["id"] + FILL_COLS}
+
+@lru_cache(maxsize=None)
+def batch_query(sides: Tuple[str, ...], fields: Tuple[str, ...] = tuple(FIELDS)) -> str:
+    """One request with a page of OrderFilled events per entry of sides ("maker"/"taker").
+
+    Page i is aliased p{i} and takes $ids{i}, $since{i}, $cursor{i} and $first{i}: events whose
+    {side}AssetId is in ids, with since <= timestamp <= cursor, newest first. Pages of both
+    sides, of different shards and of different markets can share a request.
+    A side suffixed ":tie" pages through the single second $cursor{i} by id instead: events
+    with id > $after{i}, in id order (for a second with more fills than fit in one page).
+    """
+    sel = " ".join(dict.fromkeys(("id", "timestamp") + tuple(fields)))
+    decl, pages = [], []
+    for i, page in enumerate(sides):
+        side, _, tie = page.partition(":")
+        if tie:
+            decl.append(f"$ids{i}:[BigInt!], $cursor{i}:BigInt, $after{i}:ID, $first{i}:Int!")
+            pages.append(f"  p{i}: orderFilledEvents(first: $first{i}, orderBy: id, orderDirection: asc, "
+                         f"where: {{ {side}AssetId_in: $ids{i}, timestamp: $cursor{i}, id_gt: $after{i} }}) "
+                         f"{{ {sel} }}")
+            continue
+        decl.append(f"$ids{i}:[BigInt!], $since{i}:BigInt, $cursor{i}:BigInt, $first{i}:Int!")
+        pages.append(f"  p{i}: orderFilledEvents(first: $first{i}, orderBy: timestamp, orderDirection: desc, "
+                     f"where: {{ {side}AssetId_in: $ids{i}, timestamp_gte: $since{i}, timestamp_lte: $cursor{i} }}) "
+                     f"{{ {sel} }}")
+    return f"query Pages({', '.join(decl)}) {{\n" + "\n".join(pages) + "\n}\n"
+
+# First/last fill timestamps for the market, both passes, in one request
+Q_BOUNDS = """
+query Bounds($ids:[BigInt!]) {
+  makerFirst: orderFilledEvents(first: 1, orderBy: timestamp, orderDirection: asc,  where: { makerAssetId_in: $ids }) { timestamp }
+  makerLast:  orderFilledEvents(first: 1, orderBy: timestamp, orderDirection: desc, where: { makerAssetId_in: $ids }) { timestamp }
+  takerFirst: orderFilledEvents(first: 1, orderBy: timestamp, orderDirection: asc,  where: { takerAssetId_in: $ids }) { timestamp }
+  takerLast:  orderFilledEvents(first: 1, orderBy: timestamp, orderDirection: desc, where: { takerAssetId_in: $ids }) { timestamp }
 }
 """
 
-# Query all OrderFilled events where takerAssetId IN ids
-Q_TAKER = """
-query Page($ids:[BigInt!], $cursor:BigInt, $first:Int!) {
-  orderFilledEvents(
-    first: $first
+# Forward (oldest first) pages of both passes in one request, for tail mode (which only cleans,
+# so no fee); first: 0 skips a side
+Q_TAIL = """
+query Tail($ids:[BigInt!], $makerSince:BigInt, $takerSince:BigInt, $makerFirst:Int!, $takerFirst:Int!) {
+  maker: orderFilledEvents(
+    first: $makerFirst
+    orderBy: timestamp
+    orderDirection: asc
+    where: { makerAssetId_in: $ids, timestamp_gte: $makerSince }
+  ) { id timestamp transactionHash maker taker makerAssetId makerAmountFilled takerAssetId takerAmountFilled }
+  taker: orderFilledEvents(
+    first: $takerFirst
     orderBy: timestamp
-    orderDirection: desc
-    where: { takerAssetId_in: $ids, timestamp_lt: $cursor }
-  ) {
-    id
-    timestamp
-    transactionHash
-    maker
-    taker
-    makerAssetId
-    makerAmountFilled
-    takerAssetId
-    takerAmountFilled
-    fee
-  }
+    orderDirection: asc
+    where: { takerAssetId_in: $ids, timestamp_gte: $takerSince }
+  ) { id timestamp transactionHash maker taker makerAssetId makerAmountFilled takerAssetId takerAmountFilled }
 }
 """
 
-def gql(endpoint, query, variables):
-    r = requests.post(endpoint, json={"query": query, "variables": variables}, timeout=TIMEOUT)
-    r.raise_for_status()
+_client = None
+
+def make_session(pool_size: int = 10) -> HttpClient:
+    # Pooled keep-alive connections, sized for the number of concurrent workers, with adaptive
+    # pacing and retry/backoff on 429/5xx
+    return HttpClient(pool_size, interval=SLEEP_SEC, timeout=TIMEOUT)
+
+def default_session() -> HttpClient:
+    global _client
+    if _client is None:
+        _client = make_session()
+    return _client
+
+def gql(endpoint, query, variables, session=None):
+    r = (session or default_session()).post(endpoint, json={"query": query, "variables": variables})
     j = r.json()
     if "errors" in j and j["errors"]:
         raise RuntimeError(str(j["errors"]))
     return j["data"]
 
-def backfill_loop(ids, query, writer, seen):
-    total = 0
-    cursor = 2_000_000_000  # > current unix seconds, safe upper bound
-    while True:
-        data = gql(ORDERBOOK_GQL, query, {"ids": ids, "cursor": cursor, "first": FIRST})
-        rows = data.get("orderFilledEvents", [])
-        if not rows:
-            break
-        # write + update cursor
-        earliest = None
+def write_page(rows, writer, seen) -> int:
+    """Write a page's unseen fills; returns how many were written."""
+    written = 0
+    for r in rows:
+        rid = r["id"]
+        if rid in seen:
+            continue
+        seen.add(rid)
+        writer.writerow(r)
+        written += 1
+    return written
+
+def advance_job(js: dict, rows, lo: int, first: int = FIRST) -> bool:
+    """Move a shard job past a page it fetched; True while the shard has more pages.
+
+    A short page ends the shard (or the crowded second being paged by id). A full page can end
+    partway through a second, so the next page re-reads that second (timestamp_lte, deduped via
+    `seen`). A full page that is all one second switches the job to paging that second by id
+    (`after`), from its first fill, so fills of the second beyond the page limit are not skipped.
+    """
+    full = len(rows) >= first
+    if js.get("after") is not None:
+        if full:
+            js["after"] = rows[-1]["id"]
+            return True
+        js["after"], js["cursor"], js["cursor_ids"] = None, js["cursor"] - 1, []
+        return js["cursor"] >= lo
+    if not full:
+        return False
+    earliest = min(int(r["timestamp"]) for r in rows)
+    if earliest < js["cursor"]:
+        js["cursor"] = earliest
+    else:
+        js["after"] = ""
+    js["cursor_ids"] = [r["id"] for r in rows if int(r["timestamp"]) == js["cursor"]]
+    return True
+
+def find_time_bounds(ids, session=None):
+    """(first, last + 1) fill timestamps across both passes, or None if the market has no fills."""
+    data = gql(ORDERBOOK_GQL, Q_BOUNDS, {"ids": ids}, session=session)
+    firsts = [int(data[k][0]["timestamp"]) for k in ("makerFirst", "takerFirst") if data.get(k)]
+    lasts = [int(data[k][0]["timestamp"]) for k in ("makerLast", "takerLast") if data.get(k)]
+    if not firsts:
+        return None
+    return min(firsts), max(lasts) + 1
+
+def shard_ranges(since: int, until: int, shards: int):
+    # Equal-width, contiguous [lo, hi) time windows covering [since, until)
+    shards = max(1, min(shards, until - since))
+    edges = [since + (until - since) * i // shards for i in range(shards + 1)]
+    return [(lo, hi) for lo, hi in zip(edges, edges[1:]) if hi > lo]
+
+def plan_pass(pstate: dict, since: int, until: int, shards: int) -> dict:
+    """Continue the pass's interrupted run, or plan a new one above its last completed watermark.
+
+    pstate is the checkpoint section for one (market, pass):
+      newest, newest_ids   newest fill second covered by completed runs, and the fill ids at it
+      run                  the in-progress run: since/until, its own newest/newest_ids, and
+                           jobs {"lo-hi": {cursor, cursor_ids, after, done}} for each time shard (after: the last
+                           fill id read while paging the cursor's second by id, else None)
+    """
+    if "run" not in pstate:
+        if pstate.get("newest") is not None:
+            since = max(since, pstate["newest"])
+        pstate["run"] = {
+            "since": since, "until": until, "newest": None, "newest_ids": [],
+            "jobs": {f"{lo}-{hi}": {"cursor": hi - 1, "cursor_ids": [], "after": None, "done": False}
+                     for lo, hi in shard_ranges(since, until, shards)},
+        }
+    return pstate["run"]
+
+def seed_seen(pstate: dict, seen: set) -> None:
+    # Fill ids at seconds that the next pages will read again
+    seen.update(pstate.get("newest_ids", []))
+    run = pstate.get("run") or {}
+    seen.update(run.get("newest_ids", []))
+    for js in run.get("jobs", {}).values():
+        seen.update(js["cursor_ids"])
+
+def _finish_pass(pstate: dict) -> None:
+    run = pstate.pop("run")
+    if run["newest"] is None:
+        return
+    if pstate.get("newest") == run["newest"]:
+        pstate["newest_ids"] = sorted(set(pstate["newest_ids"]) | set(run["newest_ids"]))
+    elif pstate.get("newest") is None or run["newest"] > pstate["newest"]:
+        pstate["newest"], pstate["newest_ids"] = run["newest"], run["newest_ids"]
+
+def run_backfill(writer, seen, passes, workers, ckpt=None, out_path=None, session=None, batch=1,
+                 fields=FIELDS):
+    """Run every pending shard job of every pass; returns unique fills written.
+
+    passes is [(pstate, side, ids)] with pstate planned by plan_pass. Jobs take turns in
+    submission order: each request carries the next page of up to `batch` jobs (aliased, across
+    sides, shards and markets) and `workers` requests run at a time. With a checkpoint, progress
+    is saved after every request once the output has been flushed.
+    """
+    session = session or make_session(workers)
+    cond = threading.Condition()
+    queue = deque()  # (pstate, side, ids, lo, job state) of unfinished jobs not in flight
+    for pstate, side, ids in passes:
+        for key, js in pstate["run"]["jobs"].items():
+            if not js["done"]:
+                queue.append((pstate, side, ids, int(key.split("-")[0]), js))
+        if not pstate["run"]["jobs"]:
+            _finish_pass(pstate)
+    active = len(queue)
+    in_flight = 0
+    failed = False
+
+    def save():
+        if ckpt is not None:
+            writer.flush()
+            if hasattr(seen, "sync"):
+                ckpt.data["seen_count"] = seen.sync()  # journal length that matches the output
+            ckpt.save(out_path)
+
+    def take(job, rows) -> Tuple[int, bool]:
+        # One page of one job: write it, advance the job; (written, job has more pages)
+        pstate, _, _, lo, js = job
+        run = pstate["run"]
+        n = write_page(rows, writer, seen)
         for r in rows:
-            rid = r["id"]
-            if rid in seen:
-                continue
-            seen.add(rid)
-            writer.writerow(r)
-            total += 1
+            ts = int(r["timestamp"])
+            if run["newest"] is None or ts > run["newest"]:
+                run["newest"], run["newest_ids"] = ts, []
+            if ts == run["newest"]:
+                run["newest_ids"].append(r["id"])
+        if advance_job(js, rows, lo, FIRST):
+            return n, True
+        js["done"] = True
+        if all(j["done"] for j in run["jobs"].values()):
+            _finish_pass(pstate)
+        return n, False
+
+    def worker():
+        nonlocal active, in_flight, failed
+        written = 0
+        while True:
+            with cond:
+                while not queue and in_flight and not failed:
+                    cond.wait()
+                if not queue or failed:
+                    return written
+                # Spread the jobs over the workers before filling requests up to `batch`
+                k = max(1, min(batch, len(queue), -(-active // workers)))
+                jobs = [queue.popleft() for _ in range(k)]
+                in_flight += 1
             try:
-                ts = int(r["timestamp"])
-                earliest = ts if earliest is None or ts < earliest else earliest
-            except:
-                pass
-        cursor = (earliest - 1) if earliest else (cursor - 60)
-        if cursor <= 0:
-            break
-        time.sleep(SLEEP_SEC)
+                variables, sides = {}, []
+                for i, (_, side, ids, lo, js) in enumerate(jobs):
+                    variables.update({f"ids{i}": ids, f"cursor{i}": js["cursor"], f"first{i}": FIRST})
+                    if js.get("after") is not None:
+                        variables[f"after{i}"] = js["after"]
+                        sides.append(side + ":tie")
+                    else:
+                        variables[f"since{i}"] = lo
+                        sides.append(side)
+                data = gql(ORDERBOOK_GQL, batch_query(tuple(sides), tuple(fields)), variables, session=session)
+            except BaseException:
+                with cond:
+                    failed = True
+                    in_flight -= 1
+                    cond.notify_all()
+                raise
+            with cond:
+                try:
+                    for i, job in enumerate(jobs):
+                        rows = data.get(f"p{i}") or []
+                        metrics.count("pages")
+                        metrics.count("fills_fetched", len(rows))
+                        n, more = take(job, rows)
+                        written += n
+                        if more:
+                            queue.append(job)
+                        else:
+                            active -= 1
+                    save()
+                except BaseException:
+                    failed = True  # a failed write or save stops the other workers too, not hangs them
+                    raise
+                finally:
+                    in_flight -= 1
+                    cond.notify_all()
+
+    total = 0
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futs = [ex.submit(worker) for _ in range(max(1, min(workers, len(queue))))]
+        for fut in as_completed(futs):
+            total += fut.result()
     return total
 
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--out", dest="out_path", default=OUT_CSV, help="output CSV or Parquet (by extension)")
+    p.add_argument("--store", help="write fills into this trade store (see trade_store.py) instead of --out")
+    p.add_argument("--conditions", nargs="+", default=[CONDITION_ID],
+                   help="condition ids (0x...) to backfill into the one output (default: the ZM market)")
+    p.add_argument("--fields", nargs="+", default=["all"],
+                   help=f"fill fields to request and write: a preset ({', '.join(FIELD_PRESETS)}) "
+                        f"or field names; id and timestamp are always included")
+
+    # Request coalescing
+    p.add_argument("--batch", type=int, default=8,
+                   help="pages per request: maker/taker passes, shards and markets share requests")
+
+    # Parallel backfill (optional)
+    p.add_argument("--workers", type=int, default=1,
+                   help="concurrent requests; >1 enables the time-sharded parallel backfill")
+    p.add_argument("--shards", type=int, default=0, help="time shards (default: 4 per worker)")
+    p.add_argument("--since", type=int, help="earliest unix timestamp to fetch (default: market's first fill)")
+    p.add_argument("--until", type=int, help="fetch fills before this unix timestamp (default: after last fill)")
+
+    # Resume / incremental refresh (optional)
+    p.add_argument("--checkpoint", help="checkpoint JSON; resumes an interrupted run, otherwise "
+                                        "appends only fills newer than the previous run (CSV output)")
+
+    # Dedup index (optional)
+    p.add_argument("--seen", help="on-disk dedup index of written fill ids (default: <checkpoint>.seen "
+                                  "with --checkpoint, otherwise in memory)")
+    p.add_argument("--seen-spill", action="store_true",
+                   help="keep the dedup hash table in a memory-mapped file instead of RAM")
+    metrics.add_args(p)
+    return p.parse_args()
+
 def main():
-    print(f"Resolving tokens for condition: {CONDITION_ID}")
-    yes_no_ids = get_market_tokens(CONDITION_ID)
-    print(f"Token IDs: {yes_no_ids}")
-
-    cols = [
-        "id","timestamp","transactionHash","maker","taker",
-        "makerAssetId","makerAmountFilled","takerAssetId","takerAmountFilled","fee"
-    ]
-    seen = set()
-    total = 0
-    with open(OUT_CSV, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=cols, extrasaction="ignore")
-        w.writeheader()
+    args = parse_args()
+    metrics.configure(args)
+    conditions = [c.lower() for c in args.conditions]
+    print(f"Resolving tokens for {len(conditions)} condition(s): {', '.join(conditions)}")
+    session = make_session(args.workers)
+    with metrics.stage("resolve_tokens"):
+        tokens = resolve_tokens(conditions, session=session)
+    missing = [c for c in conditions if c not in tokens]
+    if missing:
+        raise RuntimeError(f"Conditions not found via CLOB markets: {missing}")
+    for c in conditions:
+        print(f"Token IDs {c}: {tokens[c]}")
+
+    cols = list(dict.fromkeys(["id", "timestamp"] + [f for name in args.fields
+                                                     for f in FIELD_PRESETS.get(name, [name])]))
+    unknown = [f for f in cols if f not in FIELDS]
+    if unknown:
+        raise SystemExit(f"Unknown fields {unknown}; choose from {FIELDS}")
+    if args.checkpoint and (args.store or is_parquet(args.out_path)):
+        raise SystemExit("--checkpoint needs a CSV output (Parquet files and the store can't be cut back)")
+    ckpt = Checkpoint(args.checkpoint) if args.checkpoint else None
+    append = ckpt.restore_output(args.out_path) if ckpt else False
 
-        print("Backfilling (makerAssetId in market tokens)…")
-        total += backfill_loop(yes_no_ids, Q_MAKER, w, seen)
+    # With a checkpoint the dedup journal is cut back to the count it recorded, like the output
+    seen_path = args.seen or (args.checkpoint + ".seen" if args.checkpoint else None)
+    seen = DedupIndex(seen_path, count=ckpt.data.get("seen_count", 0) if ckpt else None,
+                      spill=args.seen_spill and seen_path is not None)
+    passes = []
+    for c in conditions:
+        ids = tokens[c]
+        market = ckpt.section("markets", c) if ckpt else {}
+        if args.workers > 1:
+            since, until = args.since, args.until
+            if since is None or until is None:
+                bounds = find_time_bounds(ids, session)
+                if bounds is None:
+                    bounds = (0, 0)
+                since = bounds[0] if since is None else since
+                until = bounds[1] if until is None else until
+            shards = args.shards or 4 * args.workers
+        else:
+            since = args.since or 0
+            until = args.until or 2_000_000_000
+            shards = 1
+        for side in ("maker", "taker"):
+            pstate = market.setdefault(side, {})
+            run = plan_pass(pstate, since, until, shards)
+            seed_seen(pstate, seen)
+            pending = sum(not j["done"] for j in run["jobs"].values())
+            print(f"Backfilling {c[:10]}… ({side}AssetId in market tokens) {run['since']}..{run['until']}: "
+                  f"{pending} shard(s)")
+            passes.append((pstate, side, ids))
+    print(f"{args.workers} worker(s), up to {args.batch} page(s) per request…")
 
-        print("Backfilling (takerAssetId in market tokens)…")
-        total += backfill_loop(yes_no_ids, Q_TAKER, w, seen)
+    if args.store:
+        writer = StoreWriter(TradeStore(args.store), "fills", token_router(tokens))
+    else:
+        writer = TableWriter(args.out_path, fieldnames=cols, append=append)
+    with metrics.stage("backfill") as st, writer as w:
+        st.rows = total = run_backfill(w, seen, passes, args.workers, ckpt, args.out_path, session,
+                                       batch=args.batch, fields=cols)
+    seen.close()
 
-    print(f"Done. Wrote {total} unique fills to {OUT_CSV}")
+    print(f"Done. Wrote {total} unique fills to {args.store or args.out_path} "
+          f"({session.stats['requests']} requests, {session.stats['retries']} retried, "
+          f"{session.stats['bytes'] / 2 ** 20:.1f} MB received)")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
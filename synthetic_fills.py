@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# Synthetic Polymarket OrderFilled events (Goldsky schema) and Kalshi trades for benchmarks
+# and the local mock API. Fills come newest first, the order of each query_polymarket page (not
+# of its whole output, which goes pass by pass and shard by shard), and mix multi-fill
+# transactions, YES and NO fills in one transaction, the outcome token on either side of the
+# fill, and fills from other markets. Generation is vectorized and chunked, so 10M
+# rows stream to disk with flat memory.
+
+import argparse
+from typing import Iterator, List
+import numpy as np
+import pandas as pd
+
+from tabular_io import TableWriter
+
+# Default Mamdani market tokens, so clean_polymarket runs on the output without token flags
+YES_TOKEN = "73817598408230683831072353847770809458837920203753987347670649717002095543451"
+NO_TOKEN = "102505737677514435038431832532030540090751572260157019042399710777845176913904"
+
+FILL_FIELDS = ["id", "timestamp", "transactionHash", "maker", "taker",
+               "makerAssetId", "makerAmountFilled", "takerAssetId", "takerAmountFilled", "fee"]
+KALSHI_FIELDS = ["trade_id", "ticker", "count", "created_time", "yes_price", "no_price", "taker_side"]
+
+END_TS = 1_751_515_200      # newest fill; older fills count back from here
+FILLS_PER_TX = [1, 2, 3, 4, 6, 10]
+FILLS_PER_TX_P = [0.55, 0.2, 0.1, 0.07, 0.05, 0.03]
+WALLETS = 20_000
+
+def _hex(rng: np.random.Generator, n: int, nbytes: int) -> List[str]:
+    words = rng.integers(0, 2 ** 32, size=(n, nbytes // 4), dtype=np.uint64)
+    fmt = "0x" + "%08x" * (nbytes // 4)
+    return [fmt % tuple(w) for w in words.tolist()]
+
+def _token_ids(rng: np.random.Generator, n: int) -> List[str]:
+    # 77-78 digit decimal strings, like real position ids
+    return [str(int(h, 16)) for h in _hex(rng, n, 32)]
+
+def generate_fills(n: int, yes_token: str = YES_TOKEN, no_token: str = NO_TOKEN, seed: int = 0,
+                   end_ts: int = END_TS, other_share: float = 0.1, other_markets: int = 20,
+                   chunk_rows: int = 500_000) -> Iterator[pd.DataFrame]:
+    """Yield n fills in chunks, newest first.
+
+    Each transaction has one taker and a primary (outcome, direction), with some fills on the
+    complementary outcome or the opposite side, so nets, mixed YES/NO and net-zero outcomes all
+    occur. other_share of the fills trade tokens of other markets.
+    """
+    rng = np.random.default_rng(seed)
+    wallets = np.array(_hex(rng, WALLETS, 20), dtype=object)
+    others = np.array(_token_ids(rng, 2 * other_markets), dtype=object)
+    tokens = np.array([yes_token, no_token], dtype=object)
+    ts, yes_p, emitted = end_ts, 0.5, 0
+    while emitted < n:
+        m = min(chunk_rows, n - emitted)
+        k = rng.choice(FILLS_PER_TX, size=m, p=FILLS_PER_TX_P)
+        n_tx = int(np.searchsorted(np.cumsum(k), m)) + 1
+        k = k[:n_tx]
+        k[-1] -= k.sum() - m  # trim the last transaction so the chunk has exactly m fills
+
+        # per transaction: block time (several per second at times), price walk, taker, hash
+        tx_ts = ts - np.cumsum(rng.geometric(0.4, n_tx) - 1)
+        ts = int(tx_ts[-1])
+        walk = np.clip(yes_p + np.cumsum(rng.normal(0, 0.003, n_tx)), 0.01, 0.99)
+        yes_p = float(walk[-1])
+        tx_taker = wallets[(rng.pareto(1.2, n_tx) * 40).astype(np.int64) % WALLETS]
+        tx_hash = np.array(_hex(rng, n_tx, 32), dtype=object)
+        tx_outcome = rng.integers(0, 2, n_tx)
+        tx_token_on_maker = rng.random(n_tx) < 0.5  # taker buying → token on the maker side
+
+        rep = np.repeat(np.arange(n_tx), k)
+        ordinal = np.arange(m) - np.repeat(np.cumsum(k) - k, k)
+        outcome = np.where(rng.random(m) < 0.15, 1 - tx_outcome[rep], tx_outcome[rep])
+        token_on_maker = np.where(rng.random(m) < 0.1, ~tx_token_on_maker[rep], tx_token_on_maker[rep])
+        token = tokens[outcome]
+        is_other = rng.random(m) < other_share
+        token[is_other] = others[rng.integers(0, len(others), int(is_other.sum()))]
+
+        price = np.where(outcome == 0, walk[rep], 1.0 - walk[rep])
+        price = np.clip(price + rng.normal(0, 0.002, m), 0.001, 0.999)
+        size = np.maximum(np.round(np.exp(rng.normal(3.5, 1.6, m)) * 1e6), 10_000).astype(np.int64)
+        usdc = np.maximum(np.round(size * price), 1).astype(np.int64)
+
+        tx = tx_hash[rep]
+        yield pd.DataFrame({
+            "id":                [f"{h}_{i}" for h, i in zip(tx.tolist(), ordinal.tolist())],
+            "timestamp":         tx_ts[rep],
+            "transactionHash":   tx,
+            "maker":             wallets[rng.integers(0, WALLETS, m)],
+            "taker":             tx_taker[rep],
+            "makerAssetId":      np.where(token_on_maker, token, "0"),
+            "makerAmountFilled": np.where(token_on_maker, size, usdc),
+            "takerAssetId":      np.where(token_on_maker, "0", token),
+            "takerAmountFilled": np.where(token_on_maker, usdc, size),
+            "fee":               np.zeros(m, dtype=np.int64),
+        })
+        emitted += m
+
+def generate_kalshi_trades(n: int, ticker: str = "KXMAYORNYCNOMD-25-ZM", seed: int = 0,
+                           end_ts: int = END_TS) -> pd.DataFrame:
+    """n Kalshi /markets/trades records for one ticker, newest first."""
+    rng = np.random.default_rng(seed)
+    ts = end_ts - np.cumsum(rng.geometric(0.3, n) - 1)
+    frac = rng.integers(0, 1_000_000, n)
+    yes_price = np.clip(50 + np.cumsum(rng.integers(-1, 2, n)), 1, 99)
+    created = pd.to_datetime(ts, unit="s", utc=True) + pd.to_timedelta(frac, unit="us")
+    return pd.DataFrame({
+        "trade_id":     [f"{h[2:10]}-{h[10:14]}-{h[14:18]}-{h[18:22]}-{h[22:34]}" for h in _hex(rng, n, 16)],
+        "ticker":       ticker,
+        "count":        rng.integers(1, 500, n),
+        "created_time": created.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+        "yes_price":    yes_price,
+        "no_price":     100 - yes_price,
+        "taker_side":   np.where(rng.random(n) < 0.5, "yes", "no"),
+    })
+
+def write_fills(path, n: int, seed: int = 0, **kw) -> int:
+    with TableWriter(path) as w:
+        for chunk in generate_fills(n, seed=seed, **kw):
+            w.write_frame(chunk)
+    return n
+
+def main():
+    p = argparse.ArgumentParser(description="Write synthetic Polymarket fills or Kalshi trades")
+    p.add_argument("--rows", type=int, required=True, help="number of fills / trades")
+    p.add_argument("--out", required=True, help="output CSV, Parquet or JSONL (by extension)")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--kalshi", action="store_true", help="Kalshi trades instead of Polymarket fills")
+    args = p.parse_args()
+    if args.kalshi:
+        with TableWriter(args.out) as w:
+            w.write_frame(generate_kalshi_trades(args.rows, seed=args.seed))
+    else:
+        write_fills(args.out, args.rows, seed=args.seed)
+    print(f"✓ Wrote {args.rows} rows to {args.out}")
+
+if __name__ == "__main__":
+    main()
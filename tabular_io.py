@@ -0,0 +1,175 @@
+# Shared CSV / Parquet / JSONL I/O for the fetch and clean scripts.
+# Format is picked from the file extension (.parquet/.pq → Parquet, .jsonl → JSON lines,
+# anything else → CSV).
+# Parquet files store token ids, wallets and metadata dictionary-encoded and amounts as int64.
+
+import csv
+import json
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+import pandas as pd
+
+PARQUET_SUFFIXES = (".parquet", ".pq")
+JSONL_SUFFIXES = (".jsonl", ".ndjson")
+
+# Low-cardinality / heavily repeated text → dictionary encoded
+CATEGORICAL_COLS = {
+    "maker", "taker", "makerAssetId", "takerAssetId", "asset", "proxyWallet",
+    "side", "outcome", "title", "slug", "eventSlug", "conditionId",
+}
+# Raw on-chain integers (6-decimal micro-units, unix seconds)
+INT_COLS = {"timestamp", "makerAmountFilled", "takerAmountFilled", "fee"}
+
+def is_parquet(path) -> bool:
+    return Path(path).suffix.lower() in PARQUET_SUFFIXES
+
+def is_jsonl(path) -> bool:
+    return Path(path).suffix.lower() in JSONL_SUFFIXES
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Parquet I/O needs pyarrow (pip install pyarrow)") from e
+    return pa, pq
+
+def compact(df: pd.DataFrame) -> pd.DataFrame:
+    """Cast known columns to their compact dtypes (categorical ids, int64 amounts)."""
+    df = df.copy()
+    for c in df.columns:
+        if c in INT_COLS and not pd.api.types.is_integer_dtype(df[c]):
+            df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0).astype("int64")
+        elif c in CATEGORICAL_COLS and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = df[c].astype("category")
+    return df
+
+def _to_arrow(df: pd.DataFrame):
+    pa, _ = _pyarrow()
+    table = pa.Table.from_pandas(compact(df), preserve_index=False)
+    # Fix dictionary index width so chunks written separately share one schema
+    fields = []
+    for f in table.schema:
+        if pa.types.is_dictionary(f.type):
+            f = f.with_type(pa.dictionary(pa.int32(), pa.string()))
+        fields.append(f)
+    return table.cast(pa.schema(fields))
+
+def read_table(path, columns: Optional[List[str]] = None, dtype=None) -> pd.DataFrame:
+    """Read a CSV or Parquet file, loading only `columns` when given.
+
+    dtype applies to CSV only; Parquet columns come back typed (categoricals, int64).
+    """
+    if is_parquet(path):
+        _pyarrow()
+        return pd.read_parquet(path, columns=columns)
+    if is_jsonl(path):
+        df = pd.read_json(path, lines=True, dtype=dtype or False)
+        return df[columns] if columns else df
+    return pd.read_csv(path, usecols=columns, dtype=dtype)
+
+def iter_table_chunks(path, columns: Optional[List[str]] = None, chunksize: int = 500_000,
+                      dtype=None) -> Iterator[pd.DataFrame]:
+    if is_parquet(path):
+        _, pq = _pyarrow()
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    elif is_jsonl(path):
+        for chunk in pd.read_json(path, lines=True, dtype=dtype or False, chunksize=chunksize):
+            yield chunk[columns] if columns else chunk
+    else:
+        yield from pd.read_csv(path, usecols=columns, dtype=dtype, chunksize=chunksize)
+
+def write_table(df: pd.DataFrame, path) -> None:
+    if is_parquet(path):
+        _, pq = _pyarrow()
+        pq.write_table(_to_arrow(df), path, compression="zstd")
+    elif is_jsonl(path):
+        df.to_json(path, orient="records", lines=True)
+    else:
+        df.to_csv(path, index=False)
+
+class TableWriter:
+    """Incremental writer: append DataFrames (write_frame) or dict rows (writerow).
+
+    CSV/JSONL rows go straight to disk; Parquet rows are buffered and flushed as row groups.
+    append=True continues an existing CSV/JSONL file; Parquet files can't be appended to.
+    """
+
+    def __init__(self, path, fieldnames: Optional[List[str]] = None, buffer_rows: int = 100_000,
+                 append: bool = False):
+        self.path = path
+        self.fieldnames = fieldnames
+        self.buffer_rows = buffer_rows
+        self.parquet = is_parquet(path)
+        self.jsonl = is_jsonl(path)
+        self._rows: List[Dict] = []
+        self._pq_writer = None
+        self._header = True
+        self._f = None
+        self._dict_writer = None
+        if self.parquet and append:
+            raise ValueError(f"Cannot append to Parquet file {path}; use a CSV output")
+        if not self.parquet:
+            has_rows = append and Path(path).exists() and Path(path).stat().st_size > 0
+            self._f = open(path, "a" if append else "w", newline="", encoding="utf-8")
+            self._header = not has_rows
+            if fieldnames and not self.jsonl:
+                self._dict_writer = csv.DictWriter(self._f, fieldnames=fieldnames, extrasaction="ignore")
+                if self._header:
+                    self._dict_writer.writeheader()
+                self._header = False
+
+    def write_frame(self, df: pd.DataFrame) -> None:
+        if self.parquet:
+            table = _to_arrow(df)
+            if self._pq_writer is None:
+                _, pq = _pyarrow()
+                self._pq_writer = pq.ParquetWriter(self.path, table.schema, compression="zstd")
+            self._pq_writer.write_table(table)
+        elif self.jsonl:
+            if len(df):
+                text = df.to_json(orient="records", lines=True)
+                self._f.write(text if text.endswith("\n") else text + "\n")
+        else:
+            df.to_csv(self._f, index=False, header=self._header)
+            self._header = False
+
+    def writerow(self, row: Dict) -> None:
+        if self._dict_writer is not None:
+            self._dict_writer.writerow(row)
+            return
+        if self.jsonl:
+            self._f.write(json.dumps(row) + "\n")
+            return
+        self._rows.append(row)
+        if len(self._rows) >= self.buffer_rows:
+            self.flush()
+
+    def writerows(self, rows: Iterable[Dict]) -> None:
+        for r in rows:
+            self.writerow(r)
+
+    def flush(self) -> None:
+        if self._rows:
+            self.write_frame(pd.DataFrame(self._rows, columns=self.fieldnames))
+            self._rows = []
+        if self._f is not None:
+            self._f.flush()
+
+    def close(self) -> None:
+        self.flush()
+        if self.parquet and self._pq_writer is None and self.fieldnames:
+            # nothing written: still leave a valid (empty) file behind
+            self.write_frame(pd.DataFrame({c: pd.Series(dtype=str) for c in self.fieldnames}))
+        if self._pq_writer is not None:
+            self._pq_writer.close()
+        if self._f is not None:
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# Runs tail mode against the local mock API replaying synthetic fills and Kalshi trades as a live
+# feed. Rows appear as the wall clock reaches them, some fills arrive late, after their
+# transaction was already written, and one second holds more fills than fit in a page. Checks that
+# the folded tail output equals clean_trades on all the fills, that every Kalshi trade is written
+# exactly once, and reports the end-to-end lag.
+#
+#   python tail_harness.py
+#   python tail_harness.py --rows 5000 --seconds 20 --late-share 0.05
+
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import query_kalshi as qk
+import query_polymarket as qp
+from clean_polymarket import clean_trades
+from http_client import HttpClient
+from mock_api import MockAPI
+from synthetic_fills import FILL_FIELDS, NO_TOKEN, YES_TOKEN, generate_fills, generate_kalshi_trades
+from tail_trades import FillTail, KalshiTail, TradeAssembler, latest_trades, run_tail
+
+class _Frames:
+    # TableWriter stand-in that keeps frames / rows in memory, stamped with when they were written
+    def __init__(self):
+        self.frames, self.rows = [], []
+
+    def write_frame(self, df):
+        self.frames.append(df.assign(_written=time.time()))
+
+    def writerow(self, row):
+        self.rows.append(row)
+
+    def flush(self):
+        pass
+
+def live_feed(rows: int, seconds: float, delay: float, late_share: float, late_sec: float, burst: int = 0,
+              seed: int = 3):
+    """(fills, kalshi trades) squeezed into the next `seconds` of wall time, with arrival times.
+
+    Every row arrives `delay` after its timestamp; in late_share of the multi-fill transactions one
+    fill (and late_share of the Kalshi trades) arrives late_sec later still. Whole transactions
+    from the middle of the feed, at least `burst` fills, are moved into a single second.
+    """
+    rng = np.random.default_rng(seed)
+    start = time.time() + 2
+
+    fills = pd.concat(generate_fills(rows, seed=seed, other_share=0.0), ignore_index=True)[FILL_FIELDS]
+    ts = fills["timestamp"].astype("int64")
+    span = max(1, int(ts.max() - ts.min()))
+    fills["timestamp"] = int(start) + (ts - ts.min()) * int(seconds) // span
+    if burst:
+        txs = fills["transactionHash"].iloc[len(fills) // 2:].unique()
+        sizes = fills.groupby("transactionHash")["id"].size().reindex(txs)
+        crowded = fills["transactionHash"].isin(txs[:int(np.searchsorted(sizes.cumsum(), burst)) + 1])
+        fills.loc[crowded, "timestamp"] = fills.loc[crowded, "timestamp"].min()
+    fills["arrival"] = fills["timestamp"] + delay
+    multi = fills.groupby("transactionHash")["id"].transform("size") > 1
+    txs = fills.loc[multi, "transactionHash"].unique()
+    late_tx = rng.choice(txs, size=int(len(txs) * late_share), replace=False)
+    late = fills.index[fills["transactionHash"].isin(late_tx)].to_series().groupby(
+        fills["transactionHash"]).first()
+    fills.loc[late.to_numpy(), "arrival"] += late_sec
+
+    trades = generate_kalshi_trades(rows, seed=seed)
+    created = pd.to_datetime(trades["created_time"], utc=True, format="ISO8601")
+    secs = (created - pd.Timestamp(0, tz="UTC")) / pd.Timedelta(seconds=1)
+    new = start + (secs - secs.min()) * seconds / max(1.0, secs.max() - secs.min())
+    trades["created_time"] = pd.to_datetime(new, unit="s", utc=True).dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    trades["arrival"] = new + delay + np.where(rng.random(len(trades)) < late_share, late_sec, 0.0)
+    return fills, trades
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--rows", type=int, default=3000, help="fills / Kalshi trades replayed")
+    p.add_argument("--seconds", type=float, default=15, help="wall time the replay spans")
+    p.add_argument("--delay", type=float, default=0.5, help="indexing delay of every row")
+    p.add_argument("--late-share", type=float, default=0.05, help="share of transactions with a late fill")
+    p.add_argument("--late-sec", type=float, default=4.0, help="how much later the late fills arrive")
+    p.add_argument("--interval", type=float, default=0.5, help="tail poll interval")
+    p.add_argument("--settle", type=float, default=0.5, help="tail settle time")
+    p.add_argument("--first", type=int, default=250, help="tail page size")
+    p.add_argument("--burst", type=int, default=0,
+                   help="fills squeezed into one second (default: 2 pages and a bit)")
+    args = p.parse_args()
+
+    burst = args.burst or 2 * args.first + 7
+    fills, trades = live_feed(args.rows, args.seconds, args.delay, args.late_share, args.late_sec, burst)
+    since = int(fills["timestamp"].min())
+    out, kout = _Frames(), _Frames()
+    t0 = time.perf_counter()
+    with MockAPI(fills, trades) as api:
+        qp.ORDERBOOK_GQL, qk.URL = api.gql_url, api.kalshi_url
+        session = HttpClient(2, timeout=10)
+        tail = FillTail([YES_TOKEN, NO_TOKEN], since, lookback=int(args.late_sec * 3) + 5, session=session,
+                        first=args.first)
+        asm = TradeAssembler(YES_TOKEN, NO_TOKEN, settle=args.settle)
+        kalshi = KalshiTail([trades["ticker"].iloc[0]], since, lookback=int(args.late_sec * 3) + 5, session=session)
+        stats = run_tail(tail, asm, out, kalshi, kout, interval=args.interval,
+                         duration=(since - time.time()) + args.seconds + args.delay + args.late_sec + 3)
+        requests = api.requests
+
+    problems = []
+    log = pd.concat(out.frames, ignore_index=True)
+    got = latest_trades(log.drop(columns="_written"))
+    want = clean_trades(fills.drop(columns="arrival").astype(str), YES_TOKEN, NO_TOKEN, "", "", "")
+    key = ["transactionHash", "asset"]
+    got_k = got.sort_values(key).reset_index(drop=True)
+    want_k = want.sort_values(key).reset_index(drop=True)
+    if len(got_k) != len(want_k) or not (got_k[key] == want_k[key]).all().all():
+        problems.append(f"polymarket: {len(got_k)} trades vs {len(want_k)} from clean_trades")
+    else:
+        for c in ["timestamp", "side", "outcome", "proxyWallet"]:
+            if (got_k[c].astype(str) != want_k[c].astype(str)).any():
+                problems.append(f"polymarket: column {c} differs")
+        for c in ["price", "size", "volume_usdc"]:
+            if not np.allclose(got_k[c].astype(float), want_k[c].astype(float), rtol=1e-12, atol=0):
+                problems.append(f"polymarket: column {c} differs")
+    kids = [r["trade_id"] for r in kout.rows]
+    if len(kids) != len(set(kids)) or set(kids) != set(trades["trade_id"]):
+        problems.append(f"kalshi: {len(kids)} written, {len(set(kids))} unique, {len(trades)} served")
+
+    # End-to-end lag: written time - arrival of the transaction's last fill (first revision only)
+    arrival = fills.groupby("transactionHash")["arrival"].max()
+    first = log[log["revision"] == 0].drop_duplicates("transactionHash")
+    lag = first["_written"].to_numpy() - arrival.reindex(first["transactionHash"]).to_numpy()
+    print(f"{stats['fills']} fills → {stats['trades']} trade rows ({stats['revised']} revised), "
+          f"{stats['kalshi']} Kalshi trades, {requests} requests in {time.perf_counter() - t0:.1f}s")
+    print(f"lag after arrival: p50 {np.percentile(lag, 50):.2f}s  p95 {np.percentile(lag, 95):.2f}s  "
+          f"max {lag.max():.2f}s")
+    for msg in problems:
+        print(f"    {msg}")
+    if problems:
+        sys.exit("✗ Tail output does not match")
+    print("✓ Tail output matches clean_trades; every Kalshi trade written once")
+
+if __name__ == "__main__":
+    main()
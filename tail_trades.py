@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# Live tail: polls Goldsky (and optionally Kalshi) forward from the newest fill and appends
+# cleaned trades within seconds of them landing on chain.
+# Every poll re-reads the last --lookback seconds (both passes in one request, deduped by fill
+# id), so fills the indexer delivers late are still picked up; a second with more fills than fit
+# in one page is paged through by id. A transaction is canonicalized once no new fill for it has
+# turned up for --settle seconds. If a late fill changes a transaction that was already written,
+# its trades are written again with revision + 1; an outcome that no longer trades gets a size-0
+# row. latest_trades() folds the appended log back into clean_trades output.
+#
+#   python tail_trades.py --condition 0x... --out live_trades.csv
+#   python tail_trades.py --yes-token ... --no-token ... --out live.jsonl \
+#       --kalshi-ticker KXMAYORNYCNOMD-25-ZM --kalshi-out kalshi_live.jsonl
+
+import argparse
+import time
+from typing import Dict, List, Optional, Tuple
+import pandas as pd
+
+import metrics
+import query_kalshi as qk
+import query_polymarket as qp
+from clean_polymarket import FILL_COLS, canonicalize_fills, determine_token_ids, select_token_usdc_fills
+from tabular_io import TableWriter, is_parquet
+from token_registry import CACHE_PATH
+
+# clean_trades columns, plus the revision of the transaction they belong to
+TRADE_COLS = [
+    "timestamp","datetime_utc","side","outcome","price","size","volume_usdc",
+    "transactionHash","asset","proxyWallet","title","slug","eventSlug","revision"
+]
+
+class FillTail:
+    """Forward poller over one market's fills: both passes per request, deduped by fill id."""
+
+    def __init__(self, ids, since: int, lookback: int = 60, session=None, first: int = qp.FIRST):
+        self.ids = ids
+        self.head = since  # newest fill second seen so far
+        self.lookback = lookback
+        self.session = session
+        self.first = first
+        self._seen: Dict[str, int] = {}  # fill id → timestamp, for fills inside the lookback window
+
+    def poll(self) -> List[Dict]:
+        """Every fill not returned before, from head - lookback onwards."""
+        since = {"maker": self.head - self.lookback, "taker": self.head - self.lookback}
+        after: Dict[str, Optional[str]] = {"maker": None, "taker": None}  # paging since[side] by id
+        pending = {"maker": True, "taker": True}
+        new = []
+        while any(pending.values()):
+            forward = [s for s in pending if pending[s] and after[s] is None]
+            tie = [s for s in pending if pending[s] and after[s] is not None]
+            pages = {}
+            if forward:
+                data = qp.gql(qp.ORDERBOOK_GQL, qp.Q_TAIL, {
+                    "ids": self.ids,
+                    "makerSince": since["maker"], "takerSince": since["taker"],
+                    "makerFirst": self.first if "maker" in forward else 0,
+                    "takerFirst": self.first if "taker" in forward else 0,
+                }, session=self.session)
+                metrics.count("pages")
+                pages.update({s: data.get(s) or [] for s in forward})
+            if tie:
+                variables = {}
+                for i, side in enumerate(tie):
+                    variables.update({f"ids{i}": self.ids, f"cursor{i}": since[side],
+                                      f"after{i}": after[side], f"first{i}": self.first})
+                query = qp.batch_query(tuple(s + ":tie" for s in tie), tuple(FILL_COLS))
+                data = qp.gql(qp.ORDERBOOK_GQL, query, variables, session=self.session)
+                metrics.count("pages")
+                pages.update({s: data.get(f"p{i}") or [] for i, s in enumerate(tie)})
+            for side, rows in pages.items():
+                metrics.count("fills_fetched", len(rows))
+                for r in rows:
+                    if r["id"] not in self._seen:
+                        self._seen[r["id"]] = int(r["timestamp"])
+                        new.append(r)
+                full = len(rows) >= self.first
+                if after[side] is not None:
+                    # Paging one crowded second by id: on to the next second once it runs out
+                    if full:
+                        after[side] = rows[-1]["id"]
+                    else:
+                        after[side], since[side] = None, since[side] + 1
+                    continue
+                if not full:
+                    pending[side] = False
+                    continue
+                # Re-read the second a page ends in (deduped); a page that is all one second
+                # switches to paging that second by id, from its first fill
+                first_ts, last_ts = int(rows[0]["timestamp"]), int(rows[-1]["timestamp"])
+                since[side] = last_ts
+                if first_ts == last_ts:
+                    after[side] = ""
+        if new:
+            self.head = max(self.head, max(int(r["timestamp"]) for r in new))
+        cutoff = self.head - self.lookback
+        self._seen = {k: ts for k, ts in self._seen.items() if ts >= cutoff}
+        return new
+
+class TradeAssembler:
+    """Buffers fills per transaction and canonicalizes a transaction once it has settled.
+
+    Written transactions keep their fills for `retain` seconds (by trade time), so a late fill
+    can be folded in and the whole transaction written again as the next revision.
+    """
+
+    def __init__(self, yes: str, no: str, title: str = "", slug: str = "", event_slug: str = "",
+                 perspective: str = "taker", price_units: str = "float", settle: float = 1.0,
+                 retain: int = 3600):
+        self.yes, self.no = yes, no
+        self.meta = (title, slug, event_slug)
+        self.perspective = perspective
+        self.price_units = price_units
+        self.settle = settle
+        self.retain = retain
+        self._fills: Dict[str, List[Dict]] = {}              # tx → every fill seen for it
+        self._ts: Dict[str, int] = {}                        # tx → block timestamp
+        self._pending: Dict[str, float] = {}                 # tx → wall time of its newest fill
+        self._written: Dict[str, Tuple[int, List[str]]] = {}  # tx → (revision, assets written)
+
+    def add(self, fills: List[Dict], now: float) -> None:
+        for f in fills:
+            tx = f["transactionHash"]
+            self._fills.setdefault(tx, []).append(f)
+            self._ts[tx] = max(self._ts.get(tx, 0), int(f["timestamp"]))
+            self._pending[tx] = now
+
+    def ready(self, now: float, flush: bool = False) -> pd.DataFrame:
+        """Trades (TRADE_COLS, oldest first) of every transaction that has settled by `now`."""
+        txs = [tx for tx, t in self._pending.items() if flush or now - t >= self.settle]
+        if not txs:
+            return pd.DataFrame(columns=TRADE_COLS)
+        for tx in txs:
+            del self._pending[tx]
+        df = pd.DataFrame([f for tx in txs for f in self._fills[tx]], columns=FILL_COLS)
+        fills = select_token_usdc_fills(df, self.yes, self.no)
+        if fills.empty:
+            cleaned = pd.DataFrame(columns=TRADE_COLS[:-1])
+        else:
+            cleaned = canonicalize_fills(fills, self.yes, self.no, *self.meta,
+                                         perspective=self.perspective, price_units=self.price_units)
+
+        # Revisions; outcomes written before but gone now get a size-0 row
+        assets = cleaned.groupby("transactionHash", sort=False)["asset"].agg(list).to_dict()
+        revision, voids = {}, []
+        for tx in txs:
+            prev = self._written.get(tx)
+            now_assets = assets.get(tx, [])
+            if prev is None and not now_assets:
+                continue  # nothing tradeable yet; a later fill may still make it a trade
+            revision[tx] = 0 if prev is None else prev[0] + 1
+            self._written[tx] = (revision[tx], now_assets)
+            for a in (prev[1] if prev else []):
+                if a not in now_assets:
+                    voids.append({"timestamp": self._ts[tx], "side": "", "outcome": "Yes" if a == self.yes else "No",
+                                  "price": 0, "size": 0.0, "volume_usdc": 0.0, "transactionHash": tx, "asset": a,
+                                  "proxyWallet": "", "title": self.meta[0], "slug": self.meta[1],
+                                  "eventSlug": self.meta[2]})
+        if voids:
+            voids = pd.DataFrame(voids)
+            voids["datetime_utc"] = pd.to_datetime(voids["timestamp"], unit="s", utc=True)
+            cleaned = pd.concat([cleaned, voids[TRADE_COLS[:-1]]], ignore_index=True) if len(cleaned) else voids
+        cleaned = cleaned[cleaned["transactionHash"].isin(revision.keys())]
+        # Append order: oldest first; within a transaction Yes precedes No, as in clean_trades
+        cleaned = cleaned.assign(revision=cleaned["transactionHash"].map(revision).astype("int64"),
+                                 _no_first=cleaned["outcome"] == "No")
+        cleaned = cleaned.sort_values(["timestamp", "transactionHash", "_no_first"], kind="stable")
+        return cleaned[TRADE_COLS].reset_index(drop=True)
+
+    def prune(self, head: int) -> None:
+        """Forget settled transactions older than head - retain."""
+        cutoff = head - self.retain
+        for tx in [tx for tx, ts in self._ts.items() if ts < cutoff and tx not in self._pending]:
+            del self._fills[tx], self._ts[tx]
+            self._written.pop(tx, None)
+
+class KalshiTail:
+    """Forward poller over Kalshi tickers: re-reads the last `lookback` seconds, deduped by trade_id."""
+
+    def __init__(self, tickers, since: int, lookback: int = 60, session=None):
+        self.tickers = list(tickers)
+        self.head = {t: since for t in self.tickers}
+        self.lookback = lookback
+        self.session = session or qk.make_session(1)
+        self._seen: Dict[str, Dict[str, int]] = {t: {} for t in self.tickers}
+
+    def poll(self, now: float) -> List[Dict]:
+        new = []
+        for ticker in self.tickers:
+            seen = self._seen[ticker]
+
+            def on_page(trades, next_cursor):
+                for t in trades:
+                    if t["trade_id"] not in seen:
+                        seen[t["trade_id"]] = qk.trade_ts(t)
+                        new.append(t)
+
+            qk.fetch_window(ticker, self.head[ticker] - self.lookback, int(now) + 2, on_page, session=self.session)
+            if seen:
+                self.head[ticker] = max(self.head[ticker], max(seen.values()))
+            cutoff = self.head[ticker] - self.lookback
+            self._seen[ticker] = {k: ts for k, ts in seen.items() if ts >= cutoff}
+        return new
+
+def latest_trades(log: pd.DataFrame) -> pd.DataFrame:
+    """Fold a tail output log into clean_trades form: each transaction's last revision, newest first."""
+    last = log.groupby("transactionHash")["revision"].transform("max")
+    out = log[(log["revision"] == last) & (log["size"] != 0)]
+    out = out.assign(_no_first=out["outcome"] == "No")
+    out = out.sort_values(["timestamp", "transactionHash", "_no_first"],
+                          ascending=[False, True, True], kind="stable")
+    return out.drop(columns=["_no_first", "revision"]).reset_index(drop=True)
+
+def run_tail(fills: FillTail, asm: TradeAssembler, writer, kalshi: Optional[KalshiTail] = None,
+             kalshi_writer=None, interval: float = 2.0, duration: float = 0) -> Dict[str, int]:
+    """Poll every `interval` seconds, appending settled trades (and new Kalshi trades) as they come.
+
+    Runs until interrupted, or for `duration` seconds when given; pending transactions are
+    written before returning. Returns counts of fills, trades, revisions and Kalshi trades.
+    """
+    stats = {"fills": 0, "trades": 0, "revised": 0, "kalshi": 0}
+    stop_at = time.time() + duration if duration else None
+
+    def emit(trades: pd.DataFrame, now: float):
+        if trades.empty:
+            return
+        writer.write_frame(trades)
+        writer.flush()
+        stats["trades"] += len(trades)
+        stats["revised"] += int((trades["revision"] > 0).sum())
+        for lag in now - trades["timestamp"].drop_duplicates().to_numpy(dtype="float64"):
+            metrics.observe("tail_lag_seconds", lag)
+
+    try:
+        while stop_at is None or time.time() < stop_at:
+            t0 = time.time()
+            with metrics.stage("poll") as st:
+                new = fills.poll()
+                st.rows = len(new)
+            asm.add(new, time.time())
+            stats["fills"] += len(new)
+            with metrics.stage("canonicalize", hot=True) as st:
+                trades = asm.ready(time.time())
+                st.rows = len(trades)
+            emit(trades, time.time())
+            asm.prune(fills.head)
+            if kalshi is not None:
+                with metrics.stage("kalshi_poll") as st:
+                    rows = kalshi.poll(time.time())
+                    st.rows = len(rows)
+                for r in rows:
+                    kalshi_writer.writerow(r)
+                kalshi_writer.flush()
+                stats["kalshi"] += len(rows)
+            time.sleep(max(0.0, interval - (time.time() - t0)))
+    except KeyboardInterrupt:
+        pass
+    emit(asm.ready(time.time(), flush=True), time.time())
+    return stats
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Tail new Polymarket fills (and Kalshi trades) into cleaned trades")
+    p.add_argument("--out", dest="out_path", required=True, help="cleaned trades CSV or JSONL, appended to")
+
+    # Token ids (as in clean_polymarket)
+    p.add_argument("--yes-token", help="explicit YES token id")
+    p.add_argument("--no-token", help="explicit NO token id")
+    p.add_argument("--condition", help="conditionId (0x...) to look up / derive ids")
+    p.add_argument("--collateral", help="collateral address (USDC on the correct chain)")
+    p.add_argument("--yes-index", type=int, default=0, help="YES outcome index (default 0)")
+    p.add_argument("--no-index", type=int, default=1, help="NO outcome index (default 1)")
+    p.add_argument("--registry", default=CACHE_PATH, help="token registry cache JSON")
+    p.add_argument("--title", default="", help="title column text")
+    p.add_argument("--slug", default="", help="slug column text")
+    p.add_argument("--event-slug", default="", help="eventSlug column text")
+    p.add_argument("--perspective", choices=["taker", "maker"], default="taker",
+                   help="perspective for buy/sell classification (default: taker)")
+    p.add_argument("--price-units", choices=["float", "bps", "micro"], default="float",
+                   help="price as a float, or an integer in basis points / micro-USDC per token")
+
+    # Kalshi (optional)
+    p.add_argument("--kalshi-ticker", nargs="+", default=[], help="Kalshi tickers to tail as well")
+    p.add_argument("--kalshi-out", help="Kalshi trades JSONL or CSV, appended to")
+
+    # Timing
+    p.add_argument("--since", type=int, help="start from this unix timestamp (default: now)")
+    p.add_argument("--interval", type=float, default=2.0, help="seconds between polls")
+    p.add_argument("--settle", type=float, default=1.0,
+                   help="seconds without new fills before a transaction is written")
+    p.add_argument("--lookback", type=int, default=60,
+                   help="seconds re-read on every poll; fills arriving later than this are missed")
+    p.add_argument("--retain", type=int, default=3600,
+                   help="seconds a written transaction stays revisable by late fills")
+    p.add_argument("--duration", type=float, default=0, help="stop after this many seconds (default: run until ^C)")
+    metrics.add_args(p)
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    metrics.configure(args)
+    if is_parquet(args.out_path) or (args.kalshi_out and is_parquet(args.kalshi_out)):
+        raise SystemExit("tail mode appends; use CSV or JSONL outputs (Parquet files can't be appended to)")
+    if args.kalshi_ticker and not args.kalshi_out:
+        raise SystemExit("--kalshi-ticker needs --kalshi-out")
+
+    yes, no = determine_token_ids(None, args)
+    since = args.since if args.since is not None else int(time.time())
+    session = qp.make_session(2)
+    fills = FillTail([yes, no], since, lookback=args.lookback, session=session)
+    asm = TradeAssembler(yes, no, args.title, args.slug, args.event_slug, perspective=args.perspective,
+                         price_units=args.price_units, settle=args.settle, retain=args.retain)
+    kalshi = KalshiTail(args.kalshi_ticker, since, lookback=args.lookback) if args.kalshi_ticker else None
+
+    print(f"Tailing YES {yes} | NO {no} from {since} every {args.interval}s… (^C to stop)")
+    with TableWriter(args.out_path, append=True) as w:
+        if kalshi is not None:
+            with TableWriter(args.kalshi_out, append=True) as kw:
+                stats = run_tail(fills, asm, w, kalshi, kw, interval=args.interval, duration=args.duration)
+        else:
+            stats = run_tail(fills, asm, w, interval=args.interval, duration=args.duration)
+    print(f"Done. {stats['fills']} fills → {stats['trades']} trade rows ({stats['revised']} revised) "
+          f"in {args.out_path}" + (f"; {stats['kalshi']} Kalshi trades in {args.kalshi_out}" if kalshi else ""))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# The equivalence and regression checks behind clean_polymarket --verify, backfill_harness.py
+# and tail_harness.py, as a pytest module run against synthetic fills and the local mock API (no
+# network): vectorized vs reference cleaning, streaming vs batch cleaning of query_polymarket's
+# own output, re-appending to the trade store, and a second with more fills than fit in a page
+# for both the backfill and the tail.
+#
+#   python -m pytest -q test_regressions.py
+
+import json
+
+import pandas as pd
+import pytest
+
+import query_kalshi as qk
+import query_polymarket as qp
+from backfill_harness import (CONDITION, kalshi_case, polymarket_case, run_main, served_fills, served_trades,
+                              store_case)
+from clean_polymarket import FILL_COLS, clean_trades, clean_trades_streaming, verify_equivalence
+from mock_api import MockAPI
+from synthetic_fills import NO_TOKEN, YES_TOKEN, generate_fills
+from tabular_io import read_table, write_table
+from tail_trades import FillTail
+from trade_store import TradeStore
+
+FIRST = 50  # page size the fetchers use here, so the crowded second spans several pages
+KEY = ["transactionHash", "asset"]
+
+@pytest.fixture(scope="module")
+def served():
+    fills, trades = served_fills(3000, FIRST), served_trades(2000)
+    with MockAPI(fills, trades.drop(columns="_ts")) as api:
+        yield api, fills, trades
+
+@pytest.fixture
+def mock(served, tmp_path, monkeypatch):
+    # The fetchers pointed at the mock, paging by FIRST, in a directory with the token registry
+    api, fills, trades = served
+    monkeypatch.setattr(qp, "FIRST", FIRST)
+    monkeypatch.setattr(qp, "SLEEP_SEC", 0.0)
+    monkeypatch.setattr(qp, "ORDERBOOK_GQL", api.gql_url)
+    monkeypatch.setattr(qk, "PACE_SEC", 0.0)
+    monkeypatch.setattr(qk, "URL", api.kalshi_url)
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "token_registry.json").write_text(json.dumps({CONDITION: [YES_TOKEN, NO_TOKEN]}))
+    return fills, trades
+
+def fetch_fills(path, workers: int = 4) -> str:
+    run_main(qp, ["--conditions", CONDITION, "--out", path, "--workers", workers])
+    return path
+
+def sorted_trades(path) -> pd.DataFrame:
+    return read_table(path, dtype=str).sort_values(KEY).reset_index(drop=True)
+
+@pytest.mark.parametrize("perspective", ["taker", "maker"])
+def test_vectorized_matches_reference(perspective):
+    df = pd.concat(generate_fills(5000, seed=1), ignore_index=True)[FILL_COLS].astype(str)
+    verify_equivalence(df, YES_TOKEN, NO_TOKEN, "t", "s", "e", perspective)
+
+def test_streaming_matches_batch(mock, tmp_path):
+    fills = fetch_fills(str(tmp_path / "fills.csv"))  # maker pass, taker pass, shard by shard
+    batch = clean_trades(read_table(fills, columns=FILL_COLS, dtype=str).fillna(""), YES_TOKEN, NO_TOKEN,
+                         "", "", "", perspective="both")
+    n = clean_trades_streaming(fills, str(tmp_path / "s.csv"), YES_TOKEN, NO_TOKEN, "", "", "",
+                               perspective="both", chunksize=257, maker_out_path=str(tmp_path / "s_maker.csv"))
+    assert n == len(batch["taker"])
+    for p, streamed in [("taker", "s.csv"), ("maker", "s_maker.csv")]:
+        write_table(batch[p], tmp_path / f"b_{p}.csv")
+        pd.testing.assert_frame_equal(sorted_trades(tmp_path / streamed), sorted_trades(tmp_path / f"b_{p}.csv"))
+
+def test_store_reappend(mock, tmp_path):
+    assert store_case(mock[0], 4, str(tmp_path)) == []  # query_polymarket --store, twice
+
+    fills = read_table(fetch_fills(str(tmp_path / "fills.csv")), columns=FILL_COLS, dtype=str)
+    trades = clean_trades(fills.fillna(""), YES_TOKEN, NO_TOKEN, "", "", "")
+    store = TradeStore(tmp_path / "trades_store")
+    assert store.append(trades, "trades", CONDITION) == len(trades)
+    assert store.append(trades, "trades", CONDITION) == 0
+    assert len(store.scan("trades", CONDITION)) == len(trades)
+
+@pytest.mark.parametrize("workers", [1, 4])
+@pytest.mark.parametrize("crash", [None, 5, 20])
+def test_backfill_crowded_second(mock, tmp_path, workers, crash):
+    assert polymarket_case(mock[0], workers, crash, str(tmp_path)) == []
+
+@pytest.mark.parametrize("crash", [None, 10])
+def test_kalshi_backfill(mock, tmp_path, crash):
+    assert kalshi_case(mock[1], 3, crash, str(tmp_path)) == []
+
+def test_tail_crowded_second(mock):
+    fills = mock[0]
+    tail = FillTail([YES_TOKEN, NO_TOKEN], int(fills["timestamp"].astype("int64").min()), lookback=0, first=FIRST)
+    ids = [r["id"] for r in tail.poll()]
+    assert len(ids) == len(set(ids))
+    assert set(ids) == set(fills["id"])
+    assert tail.poll() == []
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# Condition id → [YES, NO] outcome token ids, shared by query_polymarket and clean_polymarket.
+# Lookup order: local JSON cache → offline position-id derivation (when the collateral is known)
+# → a single CLOB markets scan for everything still missing (results are cached).
+
+import argparse
+import csv
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, Tuple, Union
+
+import metrics
+
+CACHE_PATH = "./token_registry.json"
+DERIVED_CACHE_PATH = "./position_ids.json"  # "condition:collateral:index" → derived position id
+
+# Public CLOB markets listing (paged) used for cache misses
+CLOB_MARKETS = "https://clob.polymarket.com/markets?next_cursor="
+TIMEOUT = 60
+
+# Collateral tokens on Polygon. Neg-risk (multi-outcome event) markets hold WrappedCollateral.
+USDC_E = "0x2791Bca1f2de4661ED88A30C99A7a9449Aa84174"
+NEG_RISK_WRAPPED_COLLATERAL = "0x3A3BD7bb9528E159577F7C2e685CC81A765002E2"
+
+# Mamdani NYC nominee market (neg-risk): clean_polymarket's default tokens, and the known
+# answer derivation is checked against before any derived id is trusted
+DEFAULT_CONDITION = "0x6220c4164a293367cd40eba018dd6e67c78e4d48e74158845cc9361230bcb34d"
+DEFAULT_YES_TOKEN = "73817598408230683831072353847770809458837920203753987347670649717002095543451"
+DEFAULT_NO_TOKEN = "102505737677514435038431832532030540090751572260157019042399710777845176913904"
+
+# ---------- Optional: on-chain derivation of token ids (no API) ----------
+# alt_bn128 field modulus and curve constant used by ConditionalTokens.getCollectionId
+ALT_BN128_P = 0x30644e72e131a029b85045b68181585d97816a916871ca8d3c208c16d87cfd47
+ALT_BN128_B = 3
+
+@lru_cache(maxsize=None)
+def _keccak_impl():
+    # Resolved once: pycryptodome (maintained), else the legacy pysha3 module if it happens to be there
+    try:
+        from Crypto.Hash import keccak
+        return lambda data: keccak.new(data=data, digest_bits=256).digest()
+    except ImportError:
+        pass
+    try:
+        import sha3
+        return lambda data: sha3.keccak_256(data).digest()
+    except ImportError:
+        raise ImportError("position-id derivation needs keccak256: pip install pycryptodome") from None
+
+def keccak256(data: bytes) -> bytes:
+    return _keccak_impl()(data)
+
+def to_uint256_be(n: int) -> bytes:
+    return n.to_bytes(32, "big")
+
+def hexstr_to_bytes32(h: str) -> bytes:
+    h = h[2:] if h.startswith("0x") else h
+    b = bytes.fromhex(h)
+    return b if len(b) == 32 else b.rjust(32, b"\x00")
+
+def address_to_bytes(addr: str) -> bytes:
+    a = addr[2:] if addr.startswith("0x") else addr
+    b = bytes.fromhex(a)
+    if len(b) != 20:
+        raise ValueError(f"Bad address length for {addr}")
+    return b
+
+def collection_id(condition_id: str, index_set: int) -> bytes:
+    # ConditionalTokens maps keccak256(conditionId, indexSet) onto alt_bn128 and returns the
+    # compressed point (parent collection = 0, so no point addition is needed).
+    P = ALT_BN128_P
+    x = int.from_bytes(keccak256(hexstr_to_bytes32(condition_id) + to_uint256_be(index_set)), "big")
+    odd = x >> 255 != 0
+    while True:
+        x = (x + 1) % P
+        yy = (x * x * x + ALT_BN128_B) % P
+        y = pow(yy, (P + 1) // 4, P)  # P ≡ 3 (mod 4)
+        if y * y % P == yy:
+            break
+    if (odd and y % 2 == 0) or (not odd and y % 2 == 1):
+        y = P - y
+    if y % 2 == 1:
+        x ^= 1 << 254
+    return to_uint256_be(x)
+
+def derive_position_id(condition_id: str, outcome_index: int, collateral: str) -> int:
+    # positionId = keccak256(collateral(address) || collectionId(indexSet=1<<i))
+    pos = keccak256(address_to_bytes(collateral) + collection_id(condition_id, 1 << outcome_index))
+    return int.from_bytes(pos, "big")
+
+@lru_cache(maxsize=None)
+def check_derivation() -> None:
+    """Raise unless derivation reproduces the known default YES/NO pair (checked once per process)."""
+    got = [str(derive_position_id(DEFAULT_CONDITION, i, NEG_RISK_WRAPPED_COLLATERAL)) for i in (0, 1)]
+    if got != [DEFAULT_YES_TOKEN, DEFAULT_NO_TOKEN]:
+        raise RuntimeError(f"position-id derivation is broken: got {got} for the default market")
+
+def _derived_key(condition_id: str, collateral: str, index: int) -> str:
+    return f"{condition_id}:{collateral}:{index}"
+
+def derive_position_ids(items: Iterable[Tuple[str, str, int]],
+                        cache_path=DERIVED_CACHE_PATH) -> Dict[Tuple[str, str, int], str]:
+    """Position ids for many (condition id, collateral, outcome index) tuples at once.
+
+    Keys come back lowercased. Results are memoized in cache_path (exact, so safe to keep) and
+    only misses are derived; a collection id is computed once per (condition, index) however
+    many collaterals ask for it.
+    """
+    keys = list(dict.fromkeys((c.lower(), col.lower(), int(i)) for c, col, i in items))
+    cache = load_cache(cache_path) if cache_path else {}
+    out = {k: cache[_derived_key(*k)] for k in keys if _derived_key(*k) in cache}
+    todo = [k for k in keys if k not in out]
+    if todo:
+        check_derivation()
+        collections: Dict[Tuple[str, int], bytes] = {}
+        for c, col, i in todo:
+            if (c, i) not in collections:
+                collections[c, i] = collection_id(c, 1 << i)
+            pos = keccak256(address_to_bytes(col) + collections[c, i])
+            out[c, col, i] = cache[_derived_key(c, col, i)] = str(int.from_bytes(pos, "big"))
+        if cache_path:
+            save_cache(cache, cache_path)
+    return out
+
+def derive_token_pairs(condition_ids: Iterable[str], collateral: Union[str, Mapping[str, str]],
+                       yes_index: int = 0, no_index: int = 1,
+                       cache_path=DERIVED_CACHE_PATH) -> Dict[str, List[str]]:
+    """[YES, NO] token ids per condition, offline; collateral is one address or a per-condition map."""
+    cids = list(dict.fromkeys(c.lower() for c in condition_ids))
+    lower = {k.lower(): v for k, v in collateral.items()} if isinstance(collateral, Mapping) else None
+    col = {c: (lower.get(c) if lower is not None else collateral) for c in cids}
+    cids = [c for c in cids if col[c]]
+    ids = derive_position_ids([(c, col[c], i) for c in cids for i in (yes_index, no_index)], cache_path)
+    return {c: [ids[c, col[c].lower(), yes_index], ids[c, col[c].lower(), no_index]] for c in cids}
+
+# ---------- Registry ----------
+def load_cache(path=CACHE_PATH) -> Dict[str, List[str]]:
+    p = Path(path)
+    return json.loads(p.read_text()) if p.exists() else {}
+
+def save_cache(cache: Dict[str, List[str]], path=CACHE_PATH) -> None:
+    tmp = Path(str(path) + ".tmp")
+    tmp.write_text(json.dumps(cache, indent=1, sort_keys=True))
+    os.replace(tmp, path)
+
+def scan_clob_markets(condition_ids: Iterable[str], session=None) -> Dict[str, List[str]]:
+    """One pass over the CLOB market listing, stopping once every condition id is found."""
+    from http_client import HttpClient
+    sess = session or HttpClient(timeout=TIMEOUT)
+    wanted = {c.lower() for c in condition_ids}
+    found: Dict[str, List[str]] = {}
+    cursor = ""
+    while wanted - found.keys():
+        r = sess.get(CLOB_MARKETS + cursor, timeout=TIMEOUT)
+        r.raise_for_status()
+        j = r.json()
+        for m in j.get("data", []):
+            cid = m.get("condition_id", "").lower()
+            if cid in wanted:
+                toks = [t["token_id"] for t in m.get("tokens", [])]
+                if len(toks) != 2:
+                    raise RuntimeError(f"Expected 2 tokens for {cid}, got {toks}")
+                found[cid] = toks  # [YES_token_id, NO_token_id] (both decimal strings)
+        cursor = j.get("next_cursor", "")
+        if cursor == "LTE=" or cursor is None:
+            break
+    return found
+
+def resolve_tokens(condition_ids: Iterable[str], collateral: Union[str, Mapping[str, str], None] = None,
+                   yes_index: int = 0, no_index: int = 1, cache_path=CACHE_PATH,
+                   scan: bool = True, session=None,
+                   derived_cache_path=DERIVED_CACHE_PATH) -> Dict[str, List[str]]:
+    """Map each condition id (lowercased) to [YES, NO] token ids.
+
+    Cached ids win; with a collateral address (or a per-condition map) the rest are derived
+    offline in one batch; only what is still missing goes to the CLOB scan, whose results are
+    added to the cache. Derived ids stay out of the registry, since they are only as good as
+    the collateral they were given; they are memoized per collateral in derived_cache_path.
+    """
+    cids = list(dict.fromkeys(c.lower() for c in condition_ids))
+    cache = load_cache(cache_path)
+    out = {c: cache[c] for c in cids if c in cache}
+
+    if collateral:
+        try:
+            out.update(derive_token_pairs([c for c in cids if c not in out], collateral,
+                                          yes_index, no_index, derived_cache_path))
+        except ImportError:
+            pass  # no keccak implementation available; fall through to the scan
+
+    missing = [c for c in cids if c not in out]
+    if missing and scan:
+        found = scan_clob_markets(missing, session=session)
+        if found:
+            cache.update(found)
+            save_cache(cache, cache_path)
+            out.update(found)
+    return out
+
+def main():
+    p = argparse.ArgumentParser(description="Resolve Polymarket condition ids to YES/NO token ids")
+    p.add_argument("conditions", nargs="*", help="conditionId (0x...)")
+    p.add_argument("--from", dest="from_path",
+                   help="CSV with a condition column (and optionally collateral) to resolve in bulk")
+    p.add_argument("--collateral", help="collateral address for offline derivation")
+    p.add_argument("--neg-risk", action="store_true",
+                   help="derive with the neg-risk WrappedCollateral (multi-outcome events)")
+    p.add_argument("--no-scan", action="store_true", help="never fall back to the CLOB markets scan")
+    p.add_argument("--cache", default=CACHE_PATH, help="registry cache JSON")
+    p.add_argument("--derived-cache", default=DERIVED_CACHE_PATH, help="derived position-id cache JSON")
+    metrics.add_args(p)
+    args = p.parse_args()
+    metrics.configure(args)
+    conditions = list(args.conditions)
+    collateral = NEG_RISK_WRAPPED_COLLATERAL if args.neg_risk else args.collateral
+    if args.from_path:
+        with open(args.from_path, newline="") as f:
+            rows = [r for r in csv.DictReader(f) if r.get("condition")]
+        conditions += [r["condition"] for r in rows]
+        per_row = {r["condition"].lower(): r.get("collateral") or collateral for r in rows}
+        if any(per_row.values()):
+            collateral = {**{c.lower(): collateral for c in args.conditions if collateral}, **per_row}
+    with metrics.stage("resolve_tokens", rows=len(conditions)):
+        resolved = resolve_tokens(conditions, collateral=collateral, cache_path=args.cache,
+                                  scan=not args.no_scan, derived_cache_path=args.derived_cache)
+    for c in conditions:
+        toks = resolved.get(c.lower())
+        print(f"{c.lower()}: {' '.join(toks) if toks else 'NOT FOUND'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+# Embedded local store for fills, cleaned trades and Kalshi trades, so analyses stop re-reading
+# whole CSVs. Data lives in Parquet parts partitioned by market and month and sorted by
+# timestamp, so a time window only touches the row groups it overlaps:
+#   <root>/<kind>/market=<market>/month=YYYY-MM/part-*.parquet
+# Next to each part, sorted (key, row) index files cover the transaction hash and the wallet
+# columns:
+#   <root>/<kind>/_index/{tx,wallet}/market=…/month=…/part-*.parquet
+# A hash or wallet lookup reads the index and then only the row groups holding the hits.
+# append() skips rows whose key (see KINDS) the market already holds, found through the tx index,
+# so re-fetching a window adds nothing. Parts are immutable; compact() merges a partition's parts
+# and drops duplicate rows (and indexes a part that a crash left without its index files, whose
+# rows append() can't see until then).
+#
+#   python trade_store.py store/ ingest fills --market 0x6220… fills.csv
+#   python trade_store.py store/ query trades --tx 0xabc… --out hits.csv
+#   python trade_store.py store/ query fills --wallet 0x12… --since 1750000000
+
+import argparse
+import os
+import re
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+import numpy as np
+import pandas as pd
+
+from tabular_io import _pyarrow, _to_arrow, read_table, write_table
+
+# Per kind: columns that identify a row (for dedup), the transaction column and the wallet columns
+KINDS = {
+    "fills":  {"key": ["id"],                       "tx": "transactionHash", "wallets": ["maker", "taker"]},
+    "trades": {"key": ["transactionHash", "asset"], "tx": "transactionHash", "wallets": ["proxyWallet"]},
+    "kalshi": {"key": ["trade_id"],                 "tx": "trade_id",        "wallets": []},
+}
+ROW_GROUP = 64_000       # data row groups (timestamp-sorted)
+INDEX_ROW_GROUP = 8_192  # index row groups (key-sorted), small so lookups read little
+
+def _safe(market: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", str(market))
+
+def _epoch_seconds(created_time: pd.Series) -> pd.Series:
+    ts = pd.to_datetime(created_time, utc=True, format="ISO8601")
+    return (ts - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)
+
+def _months(since: Optional[int], until: Optional[int]):
+    # Partition bounds for [since, until)
+    fmt = lambda t: pd.Timestamp(int(t), unit="s").strftime("%Y-%m")
+    return (fmt(since) if since is not None else None), (fmt(until - 1) if until is not None else None)
+
+class TradeStore:
+    """Partitioned, indexed Parquet store under `root`; every method takes the kind (see KINDS)."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    # ----- writing -----
+    def append(self, df: pd.DataFrame, kind: str, market: str) -> int:
+        """Add rows for one market as new parts (one per month touched); returns rows written.
+
+        Rows whose key the market already holds, or that repeat one earlier in df, are skipped.
+        """
+        df = self._unstored(df, kind, market)
+        if df.empty:
+            return 0
+        df = df.copy()
+        if "timestamp" not in df.columns and "created_time" in df.columns:
+            df["timestamp"] = _epoch_seconds(df["created_time"])  # Kalshi
+        df["timestamp"] = pd.to_numeric(df["timestamp"], errors="coerce").fillna(0).astype("int64")
+        df = df.drop(columns=["market"], errors="ignore").sort_values("timestamp", kind="stable")
+        month = pd.to_datetime(df["timestamp"], unit="s").dt.strftime("%Y-%m")
+        for m, part in df.groupby(month.to_numpy(), sort=True):
+            self._write_part(part.reset_index(drop=True), kind, _safe(market), m)
+        return len(df)
+
+    def _unstored(self, df: pd.DataFrame, kind: str, market: str) -> pd.DataFrame:
+        # The tx index narrows the stored rows to those sharing a transaction with df; their keys
+        # decide which of df's rows are already there
+        spec = KINDS[kind]
+        key = [c for c in spec["key"] if c in df.columns]
+        if df.empty or not key:
+            return df
+        df = df.drop_duplicates(key)
+        if spec["tx"] not in df.columns:
+            return df
+        have = self._lookup(kind, "tx", df[spec["tx"]].astype(str), market, columns=key)
+        if have.empty:
+            return df
+        stored = pd.MultiIndex.from_frame(have[key].astype(str))
+        return df[~pd.MultiIndex.from_frame(df[key].astype(str)).isin(stored)]
+
+    def _dir(self, kind: str, market: str, month: str, index: Optional[str] = None) -> Path:
+        base = self.root / kind
+        if index:
+            base = base / "_index" / index
+        return base / f"market={market}" / f"month={month}"
+
+    def _write_part(self, df: pd.DataFrame, kind: str, market: str, month: str) -> None:
+        spec = KINDS[kind]
+        name = f"part-{uuid.uuid4().hex}.parquet"
+        rows = np.arange(len(df), dtype=np.int64)
+        indexes = {}
+        if spec["tx"] in df.columns:
+            indexes["tx"] = pd.DataFrame({"key": df[spec["tx"]].astype(str).to_numpy(), "row": rows})
+        wallets = [c for c in spec["wallets"] if c in df.columns]
+        if wallets:
+            w = pd.concat([pd.DataFrame({"key": df[c].astype(str).to_numpy(), "row": rows}) for c in wallets])
+            indexes["wallet"] = w.drop_duplicates()
+        # Data first, index files last: an index never points at a part that isn't there. A crash in
+        # between leaves a part that scans see and lookups miss until the next compact()
+        self._atomic_write(df, self._dir(kind, market, month) / name, ROW_GROUP)
+        for ix, idx in indexes.items():
+            idx = idx.sort_values("key", kind="stable").assign(part=name)
+            self._atomic_write(idx, self._dir(kind, market, month, ix) / name, INDEX_ROW_GROUP)
+
+    @staticmethod
+    def _atomic_write(df: pd.DataFrame, path: Path, row_group: int) -> None:
+        _, pq = _pyarrow()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name("." + path.name)  # dot files are skipped by dataset discovery
+        pq.write_table(_to_arrow(df), tmp, compression="zstd", row_group_size=row_group)
+        os.replace(tmp, path)
+
+    def compact(self, kind: str, market: Optional[str] = None) -> int:
+        """Merge each partition's parts into one, dropping duplicate rows; returns parts removed.
+
+        A partition's lone part is rewritten too when its index files are missing.
+        """
+        removed = 0
+        base = self.root / kind
+        indexes = ["tx"] + (["wallet"] if KINDS[kind]["wallets"] else [])
+        for mdir in sorted(base.glob(f"market={_safe(market)}" if market else "market=*")):
+            for pdir in sorted(mdir.glob("month=*")):
+                parts = sorted(pdir.glob("part-*.parquet"))
+                m, mo = mdir.name.split("=", 1)[1], pdir.name.split("=", 1)[1]
+                unindexed = any(not (self._dir(kind, m, mo, ix) / p.name).exists() for p in parts for ix in indexes)
+                if not parts or (len(parts) == 1 and not unindexed):
+                    continue
+                df = pd.concat([pd.read_parquet(p) for p in parts], ignore_index=True)
+                key = [c for c in KINDS[kind]["key"] if c in df.columns]
+                if key:
+                    df = df.drop_duplicates(key)
+                df = df.sort_values("timestamp", kind="stable").reset_index(drop=True)
+                self._write_part(df, kind, m, mo)
+                for p in parts:
+                    # Indexes before data, so no index is left pointing at a removed part
+                    for ix in ("tx", "wallet"):
+                        (self._dir(kind, m, mo, ix) / p.name).unlink(missing_ok=True)
+                    p.unlink()
+                removed += len(parts) - 1
+        return removed
+
+    # ----- reading -----
+    def _dataset(self, path: Path):
+        import pyarrow.dataset as ds
+        pa, _ = _pyarrow()
+        if not path.exists():
+            return None
+        part = ds.partitioning(pa.schema([("market", pa.string()), ("month", pa.string())]), flavor="hive")
+        return ds.dataset(path, format="parquet", partitioning=part)
+
+    def _filter(self, market=None, since=None, until=None, time_col: bool = True):
+        import pyarrow.dataset as ds
+        f = None
+
+        def both(a, b):
+            return b if a is None else a & b
+
+        if market is not None:
+            f = both(f, ds.field("market").isin([_safe(m) for m in ([market] if isinstance(market, str) else market)]))
+        lo, hi = _months(since, until)
+        if lo is not None:
+            f = both(f, ds.field("month") >= lo)
+        if hi is not None:
+            f = both(f, ds.field("month") <= hi)
+        if time_col and since is not None:
+            f = both(f, ds.field("timestamp") >= int(since))
+        if time_col and until is not None:
+            f = both(f, ds.field("timestamp") < int(until))
+        return f
+
+    def markets(self, kind: str) -> List[str]:
+        return sorted(p.name.split("=", 1)[1] for p in (self.root / kind).glob("market=*"))
+
+    def scan(self, kind: str, market=None, since: Optional[int] = None, until: Optional[int] = None,
+             columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Rows with since <= timestamp < until (either open), for one or more markets, oldest first."""
+        d = self._dataset(self.root / kind)
+        if d is None:
+            return pd.DataFrame(columns=columns)
+        cols = None if columns is None else list(dict.fromkeys(list(columns) + ["timestamp"]))
+        t = d.to_table(columns=cols, filter=self._filter(market, since, until))
+        df = t.to_pandas().drop(columns=["month"], errors="ignore")
+        df = df.sort_values("timestamp", kind="stable").reset_index(drop=True)
+        return df[columns] if columns else df
+
+    def _lookup(self, kind: str, index: str, keys: Iterable[str], market=None,
+                columns: Optional[List[str]] = None) -> pd.DataFrame:
+        d = self._dataset(self.root / kind / "_index" / index)
+        keys = list(dict.fromkeys(str(k) for k in keys))
+        if d is None or not keys:
+            return pd.DataFrame(columns=columns)
+        import pyarrow.dataset as ds
+        f = ds.field("key").isin(keys)
+        mf = self._filter(market, time_col=False)
+        hits = d.to_table(columns=["part", "row", "market", "month"],
+                          filter=f if mf is None else f & mf).to_pandas()
+        return self._take(kind, hits, columns)
+
+    def _take(self, kind: str, hits: pd.DataFrame, columns: Optional[List[str]]) -> pd.DataFrame:
+        # Read just the row groups holding the hit rows of each part
+        _, pq = _pyarrow()
+        out = []
+        for (market, month, part), g in hits.groupby(["market", "month", "part"], sort=False, observed=True):
+            path = self._dir(kind, market, month) / part
+            if not path.exists():
+                continue  # compacted away after its index was read
+            f = pq.ParquetFile(path)
+            sizes = [f.metadata.row_group(i).num_rows for i in range(f.metadata.num_row_groups)]
+            starts = np.concatenate([[0], np.cumsum(sizes)])
+            rows = np.unique(g["row"].to_numpy())
+            rg = np.searchsorted(starts, rows, side="right") - 1  # row group of each hit
+            groups = np.unique(rg)
+            t = f.read_row_groups(groups.tolist(), columns=columns)
+            offset = np.concatenate([[0], np.cumsum([sizes[i] for i in groups])])
+            local = offset[np.searchsorted(groups, rg)] + rows - starts[rg]
+            out.append(t.take(local).to_pandas().assign(market=market))
+        if not out:
+            return pd.DataFrame(columns=columns)
+        df = pd.concat(out, ignore_index=True)
+        if "timestamp" in df.columns:
+            df = df.sort_values("timestamp", kind="stable").reset_index(drop=True)
+        return df
+
+    def by_tx(self, kind: str, hashes: Iterable[str], market=None,
+              columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Rows whose transaction hash (trade_id for Kalshi) is in hashes."""
+        return self._lookup(kind, "tx", hashes, market, columns)
+
+    def by_wallet(self, kind: str, wallets: Iterable[str], market=None, since: Optional[int] = None,
+                  until: Optional[int] = None, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Rows where any wallet column (maker/taker, proxyWallet) is in wallets, optionally in a time window."""
+        cols = None if columns is None else list(dict.fromkeys(list(columns) + ["timestamp"]))
+        df = self._lookup(kind, "wallet", wallets, market, cols)
+        if len(df) and (since is not None or until is not None):
+            ts = df["timestamp"].astype("int64")
+            df = df[(ts >= (since if since is not None else ts.min())) &
+                    (ts < (until if until is not None else ts.max() + 1))].reset_index(drop=True)
+        return df[columns + (["market"] if "market" in df.columns else [])] if columns else df
+
+class StoreWriter:
+    """TableWriter-compatible sink (writerow / write_frame / flush / close) into a TradeStore.
+
+    Rows are buffered and written as parts of `buffer_rows`; market(row) picks each row's market.
+    flush() only writes once the buffer is full, close() writes the rest.
+    """
+
+    def __init__(self, store: TradeStore, kind: str, market: Callable[[Dict], str],
+                 buffer_rows: int = 100_000):
+        self.store = store
+        self.kind = kind
+        self.market = market
+        self.buffer_rows = buffer_rows
+        self._rows: List[Dict] = []
+        self.written = 0
+
+    def writerow(self, row: Dict) -> None:
+        self._rows.append(row)
+
+    def writerows(self, rows: Iterable[Dict]) -> None:
+        self._rows.extend(rows)
+
+    def write_frame(self, df: pd.DataFrame) -> None:
+        self._rows.extend(df.to_dict("records"))
+        self.flush()
+
+    def _write(self) -> None:
+        if not self._rows:
+            return
+        df = pd.DataFrame(self._rows)
+        keys = pd.Series([self.market(r) for r in self._rows])
+        self._rows = []
+        for m, part in df.groupby(keys.to_numpy(), sort=False):
+            self.written += self.store.append(part, self.kind, m)
+
+    def flush(self) -> None:
+        if len(self._rows) >= self.buffer_rows:
+            self._write()
+
+    def close(self) -> None:
+        self._write()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+def token_router(markets: Dict[str, List[str]]) -> Callable[[Dict], str]:
+    """market(row) for fills: the market whose YES/NO token is on either side of the fill."""
+    token_market = {t: m for m, toks in markets.items() for t in toks}
+    return lambda r: token_market.get(str(r.get("makerAssetId")), token_market.get(str(r.get("takerAssetId")), ""))
+
+def main():
+    p = argparse.ArgumentParser(description="Ingest into / query the local trade store")
+    p.add_argument("root", help="store directory")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    ing = sub.add_parser("ingest", help="add a fills / trades / Kalshi file")
+    ing.add_argument("kind", choices=list(KINDS))
+    ing.add_argument("files", nargs="+", help="CSV, Parquet or JSONL")
+    ing.add_argument("--market", help="market key (default: the file's market or ticker column)")
+    q = sub.add_parser("query", help="rows by time window, transaction hash or wallet")
+    q.add_argument("kind", choices=list(KINDS))
+    q.add_argument("--market", nargs="+", help="market keys")
+    q.add_argument("--since", type=int, help="unix seconds, inclusive")
+    q.add_argument("--until", type=int, help="unix seconds, exclusive")
+    q.add_argument("--tx", nargs="+", help="transaction hashes (Kalshi: trade ids)")
+    q.add_argument("--wallet", nargs="+", help="wallet addresses")
+    q.add_argument("--columns", nargs="+", help="columns to return")
+    q.add_argument("--out", help="write rows here (default: print)")
+    c = sub.add_parser("compact", help="merge each partition's parts, dropping duplicates")
+    c.add_argument("kind", choices=list(KINDS))
+    c.add_argument("--market")
+    sub.add_parser("info", help="markets and part counts per kind")
+    args = p.parse_args()
+
+    store = TradeStore(args.root)
+    if args.cmd == "ingest":
+        n = 0
+        for f in args.files:
+            df = read_table(f, dtype=str)
+            col = "ticker" if "ticker" in df.columns else "market"
+            if args.market:
+                n += store.append(df, args.kind, args.market)
+            elif col in df.columns:
+                for m, part in df.groupby(col, sort=False):
+                    n += store.append(part, args.kind, m)
+            else:
+                raise SystemExit(f"{f} has no market/ticker column; pass --market")
+        print(f"✓ Ingested {n} rows into {args.root}/{args.kind}")
+    elif args.cmd == "query":
+        if args.tx:
+            df = store.by_tx(args.kind, args.tx, args.market, args.columns)
+        elif args.wallet:
+            df = store.by_wallet(args.kind, args.wallet, args.market, args.since, args.until, args.columns)
+        else:
+            df = store.scan(args.kind, args.market, args.since, args.until, args.columns)
+        if args.out:
+            write_table(df, args.out)
+            print(f"✓ Wrote {len(df)} rows to {args.out}")
+        else:
+            print(df.to_string(index=False))
+    elif args.cmd == "compact":
+        print(f"✓ Removed {store.compact(args.kind, args.market)} parts")
+    else:
+        for kind in KINDS:
+            for m in store.markets(kind):
+                parts = len(list((store.root / kind / f"market={m}").glob("month=*/part-*.parquet")))
+                print(f"{kind:<7} {m}  {parts} part(s)")
+
+if __name__ == "__main__":
+    main()